@@ -1,39 +1,231 @@
-from flask import Blueprint, request, abort, jsonify, redirect
+import math
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import Blueprint, Response, g, request, abort, jsonify, redirect, send_file
 from flask_cors import CORS
-from .utils import AllowedList, get_domain
+from werkzeug.exceptions import TooManyRequests
+from .errors import FileTooLarge, InvalidFields, PoolTimeout, QueueFull, RedHerring
+from .registry import FormRegistry
+from .utils import OriginPolicy, is_local_path
 
-def blueprint(name, email_backend, allowed_origins="*"):
+def blueprint(name, email_backend, allowed_origins="*", asynchronous=False,
+              rate_limit=None, dedup=None, metrics=None, metrics_route=None,
+              gatekeeper=None, cors_max_age=86400):
     """ Return a blueprint used to send emails to a single contact email
 
     Send an email via the email backend. On success, will either return
     success true on a json request or a redirect to the form 'redirect_uri'
     on a POST.
-    To avoid XSS, only allow redirect to a domain in allowed domain
+    When the email backend is deferred (see QueuedEmailBackend), the view
+    answers 202 as soon as the message is queued, or 503 if the queue is full.
+    When +asynchronous+ is set, the view is a coroutine sending the email
+    with the backend's amail() (requires Flask[async]).
+    When +rate_limit+ (a RateLimiter) is set, clients going over the limit
+    are answered 429 before the body of the request is parsed.
+    When +dedup+ (a DuplicateFilter) is set, duplicates of a recent
+    submission get the success response without being sent again.
+    When +metrics+ (a Metrics) is set, requests are counted and timed, and
+    exposed in the Prometheus text format on +metrics_route+ if given.
+    When +gatekeeper+ (a Gatekeeper) is set, requests are checked from their
+    headers before their body is read, and multipart forms are parsed as a
+    stream, stopping at the red herring field.
+    To avoid XSS, only allow redirect to a domain in allowed domain (see
+    OriginPolicy for the rules). Browsers cache CORS preflights for
+    +cors_max_age+ seconds.
+    When +email_backend+ is a FormRegistry, a single '/<form_id>' route
+    serves all of its forms, each with its own backend and allowed origins
+    (+allowed_origins+ is then unused).
+    When the email backend has an attachment store, the files it sends as
+    links are downloaded from the '/files' route.
     """
     bp = Blueprint(name, __name__)
-    CORS(bp, origins=allowed_origins)
+    registry = email_backend if isinstance(email_backend, FormRegistry) else None
+    if registry is None:
+        # Origins are compiled once, and preflights matched with the same rules
+        origins = OriginPolicy(allowed_origins)
+        CORS(bp, origins=origins.cors_origins(), max_age=cors_max_age)
+    stage = metrics.time if metrics is not None else lambda name: nullcontext()
+
+    def reject(code, reason):
+        """ Abort the request, counting the reason of the rejection """
+        if metrics is not None:
+            metrics.inc('rejections_total', reason=reason)
+        abort(code)
+
+    def check_rate(wait):
+        """ Answer 429 when the rate limiter returned a time to wait """
+        if wait:
+            if metrics is not None:
+                metrics.inc('rejections_total', reason='rate_limited')
+            raise TooManyRequests(retry_after=math.ceil(wait))
+
+    @contextmanager
+    def delivery_errors():
+        """ Answer the errors raised while generating or queuing an email """
+        try:
+            yield
+        except InvalidFields:
+            reject(400, 'invalid_fields')
+        except FileTooLarge:
+            reject(413, 'file_too_large')
+        except QueueFull:
+            reject(503, 'queue_full')
+        except PoolTimeout:
+            reject(503, 'pool_timeout')
 
-    origins = AllowedList(allowed_origins)
+    def get_form(form_id):
+        """ Return the email backend and the allowed origins of the form """
+        if registry is None:
+            return email_backend, origins
+        form = registry.get(form_id)
+        if form is None:
+            reject(404, 'unknown_form')
+        return form.backend, form.origins
 
-    @bp.route('/', methods=["POST"])
-    def view():
-        kwargs = request.json if request.is_json else request.form.to_dict()
+    def get_submission(backend, allowed):
+        """ Return the posted fields, the redirect uri and the posted file """
+        if rate_limit is not None:
+            check_rate(rate_limit.check_request(request))
+
+        if gatekeeper is not None:
+            rejection = gatekeeper.check(request, allowed)
+            if rejection is not None:
+                reject(*rejection)
+
+        with stage('parse'):
+            if gatekeeper is not None and request.mimetype == 'multipart/form-data':
+                try:
+                    kwargs, file = gatekeeper.parse(request, backend.is_red_herring)
+                except RedHerring:
+                    reject(400, 'red_herring')
+            else:
+                kwargs = request.json if request.is_json else request.form.to_dict()
+                file = request.files.get('file')
         redirect_uri = kwargs.pop('redirect_uri', request.referrer)
-        if not request.is_json and not redirect_uri:
+        if not request.is_json:
             if not redirect_uri:
-                abort(400)
-            if get_domain(redirect_uri) not in origins:
-                abort(401)
+                reject(400, 'missing_redirect')
+            # A path of this site can't redirect anywhere else
+            if not is_local_path(redirect_uri) and redirect_uri not in allowed:
+                reject(401, 'origin')
+
+        with stage('red_herring'):
+            if backend.is_red_herring(kwargs):
+                reject(400, 'red_herring')
+
+        with stage('filters'):
+            rejection = backend.get_rejection(kwargs)
+        if rejection is not None:
+            reject(400, 'filter_' + rejection)
 
-        if email_backend.is_red_herring(kwargs):
-            abort(400)
+        if rate_limit is not None:
+            check_rate(rate_limit.check_fields(kwargs))
 
-        file = request.files.get('file')
-        # We generate and send the email via our email backend
-        email_backend.mail(kwargs, file)
+        return kwargs, redirect_uri, file
 
+    @contextmanager
+    def sending(backend, kwargs, file):
+        """ Context in which a submission is sent, yielding False for a duplicate """
+        key = None
+        with delivery_errors():
+            if dedup is not None:
+                key = dedup.get_key(backend.allowed_fields.filter(kwargs),
+                                    backend.get_file(file),
+                                    request.headers.get('Idempotency-Key'))
+                if registry is not None:
+                    # The same submission may be posted to different forms
+                    key = '%s:%s' % (request.view_args['form_id'], key)
+                if not dedup.claim(key):
+                    if metrics is not None:
+                        metrics.inc('rejections_total', reason='duplicate')
+                    yield False
+                    return
+            try:
+                with stage('mail'):
+                    yield True
+            except BaseException:
+                if key is not None:
+                    dedup.release(key)
+                raise
+
+    def get_response(backend, redirect_uri):
+        """ Return the response once the email is sent or queued """
         if request.is_json:
-            return jsonify(success=True)
+            return jsonify(success=True), 202 if backend.deferred else 200
         return redirect(redirect_uri)
 
+    rule = '/' if registry is None else '/<form_id>'
+    if asynchronous:
+        @bp.route(rule, methods=["POST"])
+        async def view(form_id=None):
+            backend, allowed = get_form(form_id)
+            kwargs, redirect_uri, file = get_submission(backend, allowed)
+            with sending(backend, kwargs, file) as new:
+                if new:
+                    await backend.amail(kwargs, file)
+            return get_response(backend, redirect_uri)
+    else:
+        @bp.route(rule, methods=["POST"])
+        def view(form_id=None):
+            backend, allowed = get_form(form_id)
+            kwargs, redirect_uri, file = get_submission(backend, allowed)
+            # We generate and send the email via our email backend
+            with sending(backend, kwargs, file) as new:
+                if new:
+                    backend.mail(kwargs, file)
+            return get_response(backend, redirect_uri)
+
+    store = getattr(email_backend, 'attachment_store', None) if registry is None else None
+    if store is not None:
+        @bp.route('/files/<digest>/<filename>', methods=["GET"])
+        def download(digest, filename):
+            """ Serve a file of the attachment store from a signed link """
+            if not store.verify(digest, filename, request.args.get('expires'),
+                                request.args.get('signature')):
+                reject(403, 'invalid_link')
+            path = store.get_path(digest)
+            if not os.path.exists(path):
+                reject(404, 'missing_file')
+            return send_file(path, mimetype='application/octet-stream',
+                             as_attachment=True, download_name=filename)
+
+    if registry is not None:
+        @bp.after_request
+        def allow_origin(response):
+            """ Answer CORS requests with the allowed origins of the form """
+            origin = request.headers.get('Origin')
+            if not origin or request.endpoint != bp.name + '.view':
+                return response
+            form = registry.get((request.view_args or {}).get('form_id'))
+            if form is not None and origin in form.origins:
+                response.headers['Access-Control-Allow-Origin'] = origin
+                response.vary.add('Origin')
+                if request.method == 'OPTIONS':
+                    response.headers['Access-Control-Allow-Methods'] = 'POST'
+                    response.headers['Access-Control-Max-Age'] = str(cors_max_age)
+                    requested = request.headers.get('Access-Control-Request-Headers')
+                    if requested:
+                        response.headers['Access-Control-Allow-Headers'] = requested
+            return response
+
+    if metrics is not None:
+        @bp.before_request
+        def start_timer():
+            g.contact_start = time.perf_counter()
+
+        @bp.after_request
+        def count_request(response):
+            if request.endpoint == bp.name + '.view':
+                metrics.observe('request', time.perf_counter() - g.contact_start)
+                metrics.inc('requests_total', status=response.status_code)
+            return response
+
+        if metrics_route:
+            @bp.route(metrics_route, methods=["GET"])
+            def metrics_view():
+                return Response(metrics.render(),
+                                content_type='text/plain; version=0.0.4; charset=utf-8')
+
     return bp
@@ -0,0 +1,226 @@
+""" Minimal asyncio SMTP client used by the asynchronous email backends """
+import asyncio
+import base64
+import smtplib
+import socket
+import ssl
+import time
+from contextlib import asynccontextmanager
+
+from .errors import PoolTimeout
+from .mime import iter_smtp_data
+from .pool import Session, SMTPConnectionPool
+
+class AsyncSMTP:
+    """ SMTP client speaking the subset of the protocol needed to send mail
+
+    Errors are reported with the exceptions of smtplib, so callers can
+    handle both clients the same way.
+    """
+
+    def __init__(self, host, port, use_ssl=True, timeout=30, local_hostname=None):
+        self.host           = host
+        self.port           = port
+        self.use_ssl        = use_ssl
+        self.timeout        = timeout
+        self.local_hostname = local_hostname or socket.getfqdn()
+        self.features       = {}
+        self.reader         = None
+        self.writer         = None
+
+    async def connect(self):
+        """ Open the connection and greet the server """
+        context = ssl.create_default_context() if self.use_ssl else None
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=context),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            raise smtplib.SMTPConnectError(-1, b'Connection timed out') from None
+        code, resp = await self.getreply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, resp)
+        await self.ehlo()
+
+    async def getreply(self):
+        """ Read a (possibly multiline) reply from the server """
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                self.close()
+                raise smtplib.SMTPServerDisconnected('Server timed out') from None
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                try:
+                    return int(line[:3]), b'\n'.join(lines)
+                except ValueError:
+                    self.close()
+                    raise smtplib.SMTPResponseException(-1, line) from None
+
+    async def send(self, data):
+        """ Write raw +data+ to the server """
+        if self.writer is None:
+            raise smtplib.SMTPServerDisconnected('Please run connect() first')
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except OSError:
+            self.close()
+            raise smtplib.SMTPServerDisconnected('Server not connected') from None
+
+    async def docmd(self, cmd, args=''):
+        """ Send a command and return the server reply """
+        await self.send(('%s %s' % (cmd, args) if args else cmd).encode('ascii') + b'\r\n')
+        return await self.getreply()
+
+    async def ehlo(self):
+        """ Identify ourself and keep the extensions supported by the server """
+        code, resp = await self.docmd('EHLO', self.local_hostname)
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, resp)
+        self.features = {}
+        for line in resp.decode('latin-1').split('\n')[1:]:
+            keyword, _, params = line.partition(' ')
+            self.features[keyword.lower()] = params
+        return code, resp
+
+    async def login(self, user, password):
+        """ Authenticate with AUTH PLAIN, or AUTH LOGIN if PLAIN isn't offered """
+        methods = self.features.get('auth', 'PLAIN').upper().split()
+        if 'PLAIN' in methods or 'LOGIN' not in methods:
+            token = base64.b64encode(('\0%s\0%s' % (user, password)).encode('utf-8'))
+            code, resp = await self.docmd('AUTH', 'PLAIN ' + token.decode('ascii'))
+        else:
+            code, resp = await self.docmd('AUTH', 'LOGIN')
+            for value in (user, password):
+                if code != 334:
+                    break
+                await self.send(base64.b64encode(value.encode('utf-8')) + b'\r\n')
+                code, resp = await self.getreply()
+        if code != 235:
+            raise smtplib.SMTPAuthenticationError(code, resp)
+        return code, resp
+
+    async def noop(self):
+        """ Check that the connection is still alive """
+        return await self.docmd('NOOP')
+
+    async def sendmail(self, from_email, to_emails, data):
+        """ Send +data+ (bytes or a binary file using CRLF) to +to_emails+ """
+        code, resp = await self.docmd('MAIL', 'FROM:<%s>' % from_email)
+        if code != 250:
+            await self.docmd('RSET')
+            raise smtplib.SMTPSenderRefused(code, resp, from_email)
+        refused = {}
+        for to_email in to_emails:
+            code, resp = await self.docmd('RCPT', 'TO:<%s>' % to_email)
+            if code not in (250, 251):
+                refused[to_email] = (code, resp)
+        if len(refused) == len(to_emails):
+            await self.docmd('RSET')
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, resp = await self.docmd('DATA')
+        if code != 354:
+            await self.docmd('RSET')
+            raise smtplib.SMTPDataError(code, resp)
+        for buffer in iter_smtp_data(data):
+            await self.send(buffer)
+        code, resp = await self.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
+    async def quit(self):
+        """ Politely end the session """
+        try:
+            return await self.docmd('QUIT')
+        finally:
+            self.close()
+
+    def close(self):
+        """ Close the connection """
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+class AsyncSMTPConnectionPool(SMTPConnectionPool):
+    """ Pool of reusable AsyncSMTP sessions, bound to one event loop
+
+    * connect: Coroutine function returning a new logged-in AsyncSMTP
+    """
+
+    def __init__(self, connect, size=4, idle_timeout=60, max_messages=100,
+                 timeout=None):
+        super().__init__(connect, size, idle_timeout, max_messages, timeout)
+        self._slots = asyncio.Semaphore(size)
+
+    @staticmethod
+    async def close_session(session):
+        """ Close the session, ignoring network errors """
+        try:
+            await session.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            session.smtp.close()
+
+    async def is_alive(self, session):
+        """ Check with a NOOP that the server still answers on this session """
+        try:
+            return (await session.smtp.noop())[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    async def acquire(self):
+        """ Return a live session, reusing an idle one when possible
+
+        Raise PoolTimeout when no session frees up within +timeout+. """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout() from None
+        try:
+            while True:
+                session = self._idle.pop() if self._idle else None
+                if session is None:
+                    return Session(await self.connect())
+                if not self.is_expired(session) and await self.is_alive(session):
+                    return session
+                await self.close_session(session)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, session, discard=False):
+        """ Give back a session to the pool, closing it if it can't be reused """
+        try:
+            if discard or self.is_exhausted(session):
+                await self.close_session(session)
+                return
+            session.last_used = time.monotonic()
+            self._idle.append(session)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def session(self):
+        """ Asynchronous context manager yielding a logged-in AsyncSMTP """
+        session = await self.acquire()
+        try:
+            yield session.smtp
+        except BaseException:
+            await self.release(session, discard=True)
+            raise
+        session.messages += 1
+        await self.release(session)
+
+    async def close(self):
+        """ Close every idle session """
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await self.close_session(session)
@@ -0,0 +1,130 @@
+""" Content-addressed store of uploaded files, linked from messages """
+import base64
+import hashlib
+import hmac
+import os
+import tempfile
+import time
+from urllib.parse import quote, urlencode
+
+from .errors import FileTooLarge
+
+# Size of the reads of an upload copied to the store
+CHUNK_SIZE = 64 * 1024
+
+class AttachmentStore:
+    """ Local directory holding uploaded files by the SHA-256 of their content
+
+    Uploads are hashed while they are copied to the store, so a file posted
+    many times is only stored once. Files up to +link_threshold+ bytes are
+    still joined to the message; larger ones are replaced by a signed link,
+    valid for +expires+ seconds, served by the blueprint under /files (see
+    +base_url+), so that messages stay small whatever the size of the upload.
+    """
+
+    def __init__(self, path, secret, base_url, link_threshold=1024 * 1024,
+                 expires=7 * 24 * 3600):
+        """ Configuration of the store:
+
+        * path:           Directory holding the files
+        * secret:         Key signing the links
+        * base_url:       URL of the /files route of the blueprint, i.e
+                          'https://example.com/contact/files'
+        * link_threshold: Size in bytes over which a file is sent as a link
+        * expires:        Seconds during which a link can be used
+        """
+        self.path           = path
+        self.secret         = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.base_url       = base_url.rstrip('/')
+        self.link_threshold = link_threshold
+        self.expires        = expires
+        os.makedirs(os.path.join(path, 'tmp'), exist_ok=True)
+
+    def get_path(self, digest):
+        """ Return the path of the file whose content hashes to +digest+ """
+        return os.path.join(self.path, digest[:2], digest)
+
+    def put(self, file, max_size=None):
+        """ Copy +file+ to the store, returning its digest and its size
+
+        Raise FileTooLarge when the file is larger than +max_size+. """
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.path, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise FileTooLarge(getattr(file, 'filename', None))
+                    sha.update(chunk)
+                    out.write(chunk)
+            digest = sha.hexdigest()
+            path = self.get_path(digest)
+            try:
+                # Already stored: keep the file as long as its newest link
+                os.utime(path)
+            except FileNotFoundError:
+                # Not stored yet, or purged in between
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+            else:
+                os.unlink(tmp)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest, size
+
+    def sign(self, digest, filename, expires):
+        """ Return the signature of a link to +digest+ """
+        message = ('%s/%s/%d' % (digest, filename, expires)).encode('utf-8')
+        signature = hmac.new(self.secret, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(signature).rstrip(b'=').decode('ascii')
+
+    def verify(self, digest, filename, expires, signature):
+        """ Return wether a link is valid and not expired """
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.sign(digest, filename, expires), signature or '')
+
+    def get_link(self, digest, filename, expires):
+        """ Return a link to download +digest+ as +filename+, signed until
+        the timestamp +expires+ """
+        return '%s/%s/%s?%s' % (self.base_url, digest, quote(filename), urlencode({
+            'expires': expires, 'signature': self.sign(digest, filename, expires)}))
+
+    def get_part(self, file, max_size=None):
+        """ Store the uploaded +file+ and return the part of the message
+        holding it: the file itself, or a link when it is too large """
+        from email.mime.text import MIMEText
+        from werkzeug.utils import secure_filename
+        from .mime import SpooledAttachment
+
+        filename = secure_filename(file.filename) or 'file'
+        digest, size = self.put(file, max_size)
+        if size <= self.link_threshold:
+            with open(self.get_path(digest), 'rb') as f:
+                return SpooledAttachment(f, file.filename)
+        expires = int(time.time() + self.expires)
+        return MIMEText('%s (%d bytes): %s\nThis link expires on %s.' % (
+            file.filename, size, self.get_link(digest, filename, expires),
+            time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(expires))), 'plain')
+
+    def purge(self):
+        """ Delete the files whose links all expired, return how many were """
+        deleted = 0
+        limit = time.time() - self.expires
+        for folder in os.listdir(self.path):
+            if len(folder) != 2:
+                continue
+            for name in os.listdir(os.path.join(self.path, folder)):
+                path = os.path.join(self.path, folder, name)
+                if os.path.getmtime(path) < limit:
+                    os.unlink(path)
+                    deleted += 1
+        return deleted
@@ -1,34 +1,82 @@
-""" Module that regroups different email backends """
+""" Module that regroups different email backends
+
+Heavy dependencies (the email package, smtplib, asyncio, boto3) are only
+imported when a message is generated or sent, and connections or clients
+are only created on first send, once per process, so that importing the
+module and configuring backends stays cheap and safe to do before a fork.
+"""
 import html
+import logging
 import os
-import smtplib
 import textwrap
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
+import threading
+import time
+
+from .errors import FileTooLarge
+from .formatting import Template
+from .utils import FieldPolicy, RoutingTable, backoff, file_size, filter_args, filename_ext
+
+logger = logging.getLogger(__name__)
 
-from .utils import AllowedList, filter_args, filename_ext
+# Guards the lazy creation of per process resources (executors, clients)
+_process_lock = threading.Lock()
 
 class EmailBackend:
     """ Provide an interface to send email """
 
+    # Wether mail() returns before the message is actually delivered
+    deferred = False
+
+    # Number of threads running blocking sends on behalf of amail()
+    executor_workers = 4
+
     def __init__(self, from_email, to_email,
                  subject=None, allowed_fields="*", allow_file=False,
-                 red_herring=None):
+                 red_herring=None, max_file_size=None, required_fields=None,
+                 max_lengths=None, body=None, routes=None, filters=None,
+                 attachment_store=None):
         """ Configuration for email backend:
 
         * from_email: Email address to send emails from
         * to_email:   Email address to send email to
-        * subject_fn: Lambda that generate the subject of the message
+        * subject: Subject template, or lambda that generate the subject
         * allowed_fields: Fields that will be included in the message
         * allow_file: Allow files to be joined to the email
+        * max_file_size: Maximum size in bytes of a joined file
+        * required_fields: Fields that must be posted with a value
+        * max_lengths: Maximum length of every field, or dict of lengths per field
+        * body: Body template, or lambda that generate the body of the message.
+                Templates use {field} and {field|default} placeholders, and
+                {fields} for the list of allowed fields.
+        * routes: Recipients by field value, sent to instead of to_email when
+                  a value matches (see utils.RoutingTable)
+        * filters: Spam filters run on submissions, cheapest first (see
+                   filters.FilterPipeline)
+        * attachment_store: Store keeping joined files, which are sent as a
+                            link when they are large (see
+                            attachments.AttachmentStore)
         """
         self.from_email     = from_email
         self.to_email       = to_email
         self.subject        = subject
-        self.allowed_fields = AllowedList(allowed_fields)
+        self.body           = body
+        self.allowed_fields = FieldPolicy(allowed_fields, required_fields, max_lengths)
         self.allow_file     = allow_file
         self.red_herring    = red_herring
+        self.max_file_size  = max_file_size
+        self.routes         = RoutingTable(routes) if routes else None
+        self.filters        = filters
+        if filters is not None and not hasattr(filters, 'check'):
+            from .filters import FilterPipeline
+            self.filters = FilterPipeline(filters)
+        self.attachment_store = attachment_store
+
+        # Folded From and To headers, by recipients, used by get_bytes
+        self._headers = {}
+
+        # Templates are compiled once, instead of on every message
+        self.subject_template = Template(subject) if isinstance(subject, str) else None
+        self.body_template    = Template(body) if isinstance(body, str) else None
 
     def is_red_herring(self, fields):
         """ Function that returns wether the transaction is a red herring
@@ -39,33 +87,67 @@ class EmailBackend:
             return True
         return False
 
+    def get_rejection(self, fields):
+        """ Return the name of the filter rejecting the submission, None if
+        it can be sent """
+        if self.filters is None:
+            return None
+        return self.filters.check(fields)
+
     def get_subject(self, fields):
         """ Return the subject of the email message """
         if self.subject is None:
             return "New message" # default value
-        if isinstance(self.subject, str):
-            return self.subject
+        if self.subject_template is not None:
+            return self.subject_template.render(fields)
         return html.escape(self.subject(**(filter_args(fields, self.subject))))
 
     def get_file(self, file):
-        """ Proxy to check what to return as a file """
-        ext = filename_ext(file.filename) if file else None
+        """ Proxy to check what to return as a file
+
+        Raise FileTooLarge when a file that would be joined is known to be
+        larger than +max_file_size+, before any of it is read. Files that
+        are not allowed are left out whatever their size. """
+        if not file or not self.allow_file:
+            return None
+        ext = filename_ext(file.filename)
         if isinstance(self.allow_file, str):
             # We check if file extension is the same as +allow_file+
-            return file if ext == self.allow_file else None
-        if hasattr(self.allow_file, '__iter__'):
+            if ext != self.allow_file:
+                return None
+        elif hasattr(self.allow_file, '__iter__'):
             # We check if file extension is in allowed +allow_file+
-            return file if ext in self.allow_file else None
-        return file if self.allow_file else None
+            if ext not in self.allow_file:
+                return None
+        if self.max_file_size is not None:
+            size = file_size(file)
+            if size is not None and size > self.max_file_size:
+                raise FileTooLarge(file.filename)
+        return file
 
     def get_message(self, fields):
-        """ Craft a multiline message to be sent via email """
+        """ Craft a multiline message to be sent via email
+
+        Raise InvalidFields when fields don't follow the field policy """
         # We need to escape each line from html tags
-        lines = []
-        for k, item in self.allowed_fields.filter(fields):
-            if item:
-                lines.append("%s: %s" % (k, item))
-        return html.escape('\n'.join(lines))
+        allowed = {k: item for k, item in self.allowed_fields.filter(fields) if item}
+        if self.body is None:
+            return html.escape('\n'.join("%s: %s" % line for line in allowed.items()))
+        if self.body_template is not None:
+            allowed['fields'] = '\n'.join("%s: %s" % line for line in allowed.items())
+            return self.body_template.render(allowed)
+        return html.escape(self.body(**filter_args(allowed, self.body)))
+
+    def get_recipients(self, fields):
+        """ Return the addresses the message is sent to
+
+        Every recipient is put in the To header, so that the message is
+        delivered to all of them in a single transaction. """
+        if self.routes is not None:
+            recipients = self.routes.get(fields)
+            if recipients:
+                return recipients
+        return RoutingTable.addresses(self.to_email)
 
     def get_reply_email(self, fields):
         """ Return a reply email to be included in email """
@@ -73,10 +155,14 @@ class EmailBackend:
 
     def get_mail(self, fields, file=None):
         """ Return a Mimetype message """
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        from .mime import SpooledAttachment
+
         message = MIMEMultipart()
         message['Subject'] = self.get_subject(fields)
         message['From'] = self.from_email
-        message['To'] = self.to_email
+        message['To'] = ', '.join(self.get_recipients(fields))
 
         # We add a reply-to email if there is en email field sent
         reply_email = self.get_reply_email(fields)
@@ -87,18 +173,169 @@ class EmailBackend:
         part = MIMEText(self.get_message(fields), 'plain')
         message.attach(part)
 
-        # We add the attachment, if present
+        # We add the attachment, if present. Its content is spooled to a
+        # temporary file so it is never held in memory as a whole
         attachment = self.get_file(file)
-        if attachment:
-            part = MIMEApplication(attachment.read())
-            part.add_header('Content-Disposition', 'attachment', filename=attachment.filename)
-            message.attach(part)
+        if attachment and self.attachment_store is not None:
+            message.attach(self.attachment_store.get_part(attachment, self.max_file_size))
+        elif attachment:
+            message.attach(SpooledAttachment(attachment, attachment.filename,
+                                             max_size=self.max_file_size))
 
         return message
 
+    def get_bytes(self, fields, recipients):
+        """ Return the message of a submission without file, as bytes
+
+        Same message as the one of get_mail, written directly instead of
+        going through the email package. The headers that only depend on
+        the recipients are folded once. """
+        from .mime import fold_headers, text_message
+        recipients = tuple(recipients)
+        headers = self._headers.get(recipients)
+        if headers is None:
+            headers = self._headers[recipients] = fold_headers((
+                ('MIME-Version', '1.0'),
+                ('From', self.from_email),
+                ('To', ', '.join(recipients)),
+            ))
+        dynamic = [('Subject', self.get_subject(fields))]
+        reply_email = self.get_reply_email(fields)
+        if reply_email:
+            dynamic.append(('reply-to', reply_email))
+        return text_message(headers + fold_headers(dynamic), self.get_message(fields))
+
+    def is_direct(self):
+        """ Return wether mail() can write messages with get_bytes
+
+        Backends overriding how messages are generated or sent rely on the
+        message object, so they keep using get_mail. """
+        cls = type(self)
+        return (cls.get_mail is EmailBackend.get_mail and cls.send is EmailBackend.send
+                and cls.asend is EmailBackend.asend)
+
+    def send_raw(self, from_email, to_emails, data):
+        """ Send an already serialized message to +to_emails+
+
+        +data+ is either bytes or a binary file positioned at the start of
+        the message. """
+        raise NotImplementedError()
+
+    def send(self, message):
+        """ Send a message generated by get_mail """
+        from .mime import get_recipients, spool_message
+        with spool_message(message) as fp:
+            self.send_raw(message['From'], get_recipients(message), fp)
+
+    def mail(self, fields, file=None):
+        """ Generate and send an email based on fields passed
+
+        Messages without file are written straight to bytes (see get_bytes). """
+        if self.get_file(file) or not self.is_direct():
+            self.send(self.get_mail(fields, file))
+        else:
+            recipients = self.get_recipients(fields)
+            self.send_raw(self.from_email, recipients, self.get_bytes(fields, recipients))
+
+    @property
+    def executor(self):
+        """ Bounded thread pool used by asend_raw, created once per process """
+        from concurrent.futures import ThreadPoolExecutor
+        with _process_lock:
+            if getattr(self, '_executor_pid', None) != os.getpid():
+                self._executor = ThreadPoolExecutor(self.executor_workers)
+                self._executor_pid = os.getpid()
+        return self._executor
+
+    async def asend_raw(self, from_email, to_emails, data):
+        """ Coroutine sending an already serialized message
+
+        Unless overridden, send_raw is run in the backend's executor. """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.send_raw, from_email, to_emails, data)
+
+    async def asend(self, message):
+        """ Coroutine sending a message generated by get_mail """
+        from .mime import get_recipients, spool_message
+        with spool_message(message) as fp:
+            await self.asend_raw(message['From'], get_recipients(message), fp)
+
+    async def amail(self, fields, file=None):
+        """ Coroutine generating and sending an email based on fields passed """
+        if self.get_file(file) or not self.is_direct():
+            await self.asend(self.get_mail(fields, file))
+        else:
+            recipients = self.get_recipients(fields)
+            await self.asend_raw(self.from_email, recipients,
+                                 self.get_bytes(fields, recipients))
+
+class ProxyEmailBackend:
+    """ Base class for backends wrapping another email backend
+
+    Anything that is not defined on the proxy (formatting, configuration) is
+    looked up on the wrapped backend, so a proxy can be used wherever an
+    email backend is expected.
+
+    Messages without file are written to bytes by the wrapped backend and
+    handed to send_raw, unless +direct+ is False: proxies passing the
+    message object on (i.e a queue) go through get_mail and send. """
+
+    direct = True
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    @property
+    def deferred(self):
+        """ Wether mail() returns before the message is actually delivered """
+        return self.backend.deferred
+
+    def is_direct(self):
+        """ Return wether mail() can write messages with get_bytes """
+        return self.direct and self.backend.is_direct()
+
+    def send_raw(self, from_email, to_emails, data):
+        """ Send an already serialized message to +to_emails+ """
+        self.backend.send_raw(from_email, to_emails, data)
+
+    def send(self, message):
+        """ Send a message generated by get_mail """
+        self.backend.send(message)
+
     def mail(self, fields, file=None):
         """ Generate and send an email based on fields passed """
-        raise NotImplementedError()
+        if self.get_file(file) or not self.is_direct():
+            self.send(self.get_mail(fields, file))
+        else:
+            recipients = self.get_recipients(fields)
+            self.send_raw(self.from_email, recipients, self.get_bytes(fields, recipients))
+
+    async def asend_raw(self, from_email, to_emails, data):
+        """ Coroutine sending an already serialized message """
+        await self.backend.asend_raw(from_email, to_emails, data)
+
+    async def asend(self, message):
+        """ Coroutine sending a message generated by get_mail """
+        await self.backend.asend(message)
+
+    async def amail(self, fields, file=None):
+        """ Coroutine generating and sending an email based on fields passed
+
+        Deferred backends only do local work in mail(), so it is run as is. """
+        if self.deferred:
+            self.mail(fields, file)
+        elif self.get_file(file) or not self.is_direct():
+            await self.asend(self.get_mail(fields, file))
+        else:
+            recipients = self.get_recipients(fields)
+            await self.asend_raw(self.from_email, recipients,
+                                 self.get_bytes(fields, recipients))
 
 class SMTPEmailBackend(EmailBackend):
     """ Provide an SMTP interface to send email """
@@ -114,30 +351,202 @@ class SMTPEmailBackend(EmailBackend):
     for the SMTPEmailBackend to work. """)
 
     def __init__(self, *args, smtp_server=None, smtp_user=None,
-                 smtp_password=None, smtp_port=465, **kwargs):
+                 smtp_password=None, smtp_port=465, smtp_ssl=True,
+                 smtp_timeout=30, pool_size=4, pool_idle_timeout=60,
+                 pool_max_messages=100, pool_timeout=30, **kwargs):
+        """ SMTP specific configuration:
+
+        * smtp_ssl:          Connect with SMTP over SSL (default) or plain SMTP
+        * smtp_timeout:      Seconds after which a connection or a command
+                             that gets no answer from the server fails
+        * pool_size:         Number of authenticated sessions kept open
+        * pool_idle_timeout: Seconds after which an idle session is closed
+        * pool_max_messages: Number of messages sent before a session is renewed
+        * pool_timeout:      Seconds to wait for a session when they are all
+                             in use, before answering 503
+        """
         super().__init__(*args, **kwargs)
 
         self.smtp_server   = smtp_server
         self.smtp_user     = smtp_user
         self.smtp_password = smtp_password or os.getenv('SMTP_PASSWORD')
         self.smtp_port     = smtp_port
+        self.smtp_ssl      = smtp_ssl
+        self.smtp_timeout  = smtp_timeout
 
         assert self.smtp_server, self.MISSING_SERVER
         assert self.smtp_user, self.MISSING_USER
         assert self.smtp_password, self.MISSING_PASS
 
+        self.pool_size         = pool_size
+        self.pool_idle_timeout = pool_idle_timeout
+        self.pool_max_messages = pool_max_messages
+        self.pool_timeout      = pool_timeout
 
-    def mail(self, fields, file=None):
-        """ We use SMTP to send an email """
-        message = self.get_mail(fields, file=None)
+        # Asyncio sessions live on an event loop of their own (see async_loop)
+        self._async_pool = None
+
+    @property
+    def pool(self):
+        """ Pool of SMTP sessions, created once per process on first use """
+        # Sockets inherited through a fork would be shared with the parent
+        if getattr(self, '_pool_pid', None) != os.getpid():
+            from .pool import SMTPConnectionPool
+            with _process_lock:
+                if getattr(self, '_pool_pid', None) != os.getpid():
+                    self._pool = SMTPConnectionPool(
+                        self.connect,
+                        size=self.pool_size,
+                        idle_timeout=self.pool_idle_timeout,
+                        max_messages=self.pool_max_messages,
+                        timeout=self.pool_timeout,
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def connect(self):
+        """ Open and authenticate a new SMTP session """
+        import smtplib
+        smtp_class = smtplib.SMTP_SSL if self.smtp_ssl else smtplib.SMTP
+        server = smtp_class(self.smtp_server, self.smtp_port, timeout=self.smtp_timeout)
         try:
-            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
             server.login(self.smtp_user, self.smtp_password)
-            server.sendmail(message['From'], message['To'], message.as_string())
+        except BaseException:
             server.close()
+            raise
+        return server
+
+    def send_raw(self, from_email, to_emails, data):
+        """ We use a pooled SMTP session to send an email """
+        import smtplib
+        try:
+            # A pooled session may have been dropped by the server in between
+            # requests, in which case we retry once on a fresh connection
+            for retry in (True, False):
+                try:
+                    with self.pool.session() as server:
+                        self.sendfile(server, from_email, to_emails, data)
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    if not retry:
+                        raise
+                    if not isinstance(data, (bytes, bytearray)):
+                        data.seek(0)
         except smtplib.SMTPAuthenticationError:
-            print("The username and/or password you entered is incorrect")
+            logger.error("The username and/or password you entered is incorrect")
+            raise
+
+    async def aconnect(self):
+        """ Open and authenticate a new asyncio SMTP session """
+        from .aiosmtp import AsyncSMTP
+        server = AsyncSMTP(self.smtp_server, self.smtp_port, use_ssl=self.smtp_ssl,
+                           timeout=self.smtp_timeout)
+        await server.connect()
+        try:
+            await server.login(self.smtp_user, self.smtp_password)
+        except BaseException:
+            server.close()
             raise
+        return server
+
+    @property
+    def async_loop(self):
+        """ Event loop running the asyncio SMTP sessions, in a thread started
+        once per process
+
+        Flask runs each asynchronous view in a new event loop, which sessions
+        can't outlive, so they are kept on a loop shared by every request. """
+        if getattr(self, '_loop_pid', None) != os.getpid():
+            import asyncio
+            with _process_lock:
+                if getattr(self, '_loop_pid', None) != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, daemon=True).start()
+                    self._async_pool = None
+                    self._loop = loop
+                    self._loop_pid = os.getpid()
+        return self._loop
+
+    @property
+    def async_pool(self):
+        """ Pool of asyncio SMTP sessions, only used from async_loop """
+        if self._async_pool is None:
+            from .aiosmtp import AsyncSMTPConnectionPool
+            self._async_pool = AsyncSMTPConnectionPool(
+                self.aconnect,
+                size=self.pool_size,
+                idle_timeout=self.pool_idle_timeout,
+                max_messages=self.pool_max_messages,
+                timeout=self.pool_timeout,
+            )
+        return self._async_pool
+
+    async def asend_raw(self, from_email, to_emails, data):
+        """ We send the email on a pooled asyncio SMTP session of async_loop """
+        import asyncio
+        future = asyncio.run_coroutine_threadsafe(
+            self.asend_pooled(from_email, to_emails, data), self.async_loop)
+        await asyncio.wrap_future(future)
+
+    async def asend_pooled(self, from_email, to_emails, data):
+        """ Coroutine sending an email from async_loop """
+        import smtplib
+        try:
+            for retry in (True, False):
+                try:
+                    async with self.async_pool.session() as server:
+                        await server.sendmail(from_email, to_emails, data)
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    if not retry:
+                        raise
+                    if not isinstance(data, (bytes, bytearray)):
+                        data.seek(0)
+        except smtplib.SMTPAuthenticationError:
+            logger.error("The username and/or password you entered is incorrect")
+            raise
+
+    async def aclose(self):
+        """ Close the idle asyncio SMTP sessions """
+        import asyncio
+        if getattr(self, '_loop_pid', None) == os.getpid() and self._async_pool is not None:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+                self._async_pool.close(), self._loop))
+
+    @staticmethod
+    def sendfile(server, from_email, to_emails, fp, buffer_size=64 * 1024):
+        """ Send the message read from +fp+ without loading it in memory
+
+        Same as smtplib's sendmail, except that the DATA command is fed
+        from the file as it is read. +fp+ (a binary file or bytes) must use
+        CRLF line endings. """
+        import smtplib
+        from .mime import iter_smtp_data
+        server.ehlo_or_helo_if_needed()
+        code, resp = server.mail(from_email)
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPSenderRefused(code, resp, from_email)
+        refused = {}
+        for to_email in to_emails:
+            code, resp = server.rcpt(to_email)
+            if code not in (250, 251):
+                refused[to_email] = (code, resp)
+        if len(refused) == len(to_emails):
+            server.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, resp = server.docmd('data')
+        if code != 354:
+            server.rset()
+            raise smtplib.SMTPDataError(code, resp)
+
+        for buffer in iter_smtp_data(fp, buffer_size):
+            server.send(buffer)
+
+        code, resp = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
 
 class SESEmailBackend(EmailBackend):
     """ Provide an interface for SES to send email """
@@ -150,31 +559,127 @@ class SESEmailBackend(EmailBackend):
     SESEmailBackend constructor or via AWS_SECRET_ACCESS_KEY_EMAIL environment variable
     """)
 
-    def __init__(self, *args, access_key=None, secret_key=None, **kwargs):
+    # Seconds after which a send quota that could not be read is read again.
+    # Meanwhile sends are not paced, throttled sends still being retried
+    QUOTA_RETRY = 300
+
+    # Error codes SES answers when the sending rate is exceeded
+    THROTTLING_CODES = ('Throttling', 'ThrottlingException', 'TooManyRequestsException')
+
+    def __init__(self, *args, access_key=None, secret_key=None,
+                 executor_workers=10, max_send_rate=None, max_retries=5,
+                 retry_base=0.5, retry_cap=20, **kwargs):
+        """ SES specific configuration:
+
+        * executor_workers: Number of concurrent SES calls made by amail() and
+                            dispatch(), and size of the connection pool
+        * max_send_rate:    Recipients sent to per second, read from the
+                            account's send quota when not given (sends are
+                            not paced while the quota can't be read)
+        * max_retries:      Number of retries of a throttled send
+        * retry_base:       Delay in seconds before the first retry
+        * retry_cap:        Maximum delay in seconds between two retries
+        """
         super().__init__(*args, **kwargs)
-        import boto3
-        access_key = access_key or os.getenv('AWS_ACCESS_KEY_ID_EMAIL')
-        secret_key = secret_key or os.getenv('AWS_SECRET_ACCESS_KEY_EMAIL')
+        self.executor_workers = executor_workers
+        self.max_send_rate    = max_send_rate
+        self.max_retries      = max_retries
+        self.retry_base       = retry_base
+        self.retry_cap        = retry_cap
+        self.access_key = access_key or os.getenv('AWS_ACCESS_KEY_ID_EMAIL')
+        self.secret_key = secret_key or os.getenv('AWS_SECRET_ACCESS_KEY_EMAIL')
 
-        assert access_key, self.MISSING_CREDENTIALS
-        assert secret_key, self.MISSING_CREDENTIALS
+        assert self.access_key, self.MISSING_CREDENTIALS
+        assert self.secret_key, self.MISSING_CREDENTIALS
 
-        self.client = boto3.client(
-            'ses',
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key or os.getenv('AWS_SECRET_ACCESS_KEY_EMAIL'),
-        )
+    @property
+    def client(self):
+        """ boto3 SES client, created once per process on first use """
+        if getattr(self, '_client_pid', None) != os.getpid():
+            # boto3 takes a while to import and to build a client
+            import boto3
+            from botocore.config import Config
+            with _process_lock:
+                if getattr(self, '_client_pid', None) != os.getpid():
+                    self._client = boto3.client(
+                        'ses',
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        # One connection for each thread sending concurrently
+                        config=Config(max_pool_connections=self.executor_workers),
+                    )
+                    self._client_pid = os.getpid()
+        return self._client
 
+    @property
+    def pacer(self):
+        """ Token bucket of the send rate along with the rate, created once
+        per process on first use. The rate is None while sends aren't paced. """
+        if (getattr(self, '_pacer_pid', None) != os.getpid()
+                or (self._pacer[1] is None and time.monotonic() >= self._pacer_retry)):
+            from .ratelimit import MemoryStore
+            rate = self.max_send_rate or self.get_send_rate()
+            with _process_lock:
+                self._pacer = (MemoryStore(maxsize=1), rate)
+                self._pacer_retry = time.monotonic() + self.QUOTA_RETRY
+                self._pacer_pid = os.getpid()
+        return self._pacer
 
-    def mail(self, fields, file=None):
-        """ We use boto3 to send email """
-        message = self.get_mail(fields, file)
-
-        # We need to send raw email, otherwise file is not supported
-        self.client.send_raw_email(
-            Source=message['From'],
-            Destinations=[message['To']],
-            RawMessage={
-                'Data': message.as_string()
-            }
-        )
+    def get_send_rate(self):
+        """ Return the maximum send rate of the account, None if unknown """
+        try:
+            return self.client.get_send_quota()['MaxSendRate'] or None
+        except Exception as exc:
+            # i.e an IAM policy only granting ses:SendRawEmail
+            logger.warning("Could not read the SES send quota, sends are not paced "
+                           "until it can be read", exc_info=exc)
+            return None
+
+    def wait_for_rate(self, recipients):
+        """ Block until +recipients+ can be sent to without exceeding the rate """
+        store, rate = self.pacer
+        if rate is None:
+            return
+        # SES counts each recipient of a message against the rate
+        for _ in range(recipients):
+            while True:
+                wait = store.take('ses', rate, max(rate, 1), time.monotonic())
+                if not wait:
+                    break
+                time.sleep(wait)
+
+    def is_throttled(self, exc):
+        """ Return whether +exc+ tells that the sending rate was exceeded """
+        error = getattr(exc, 'response', {}).get('Error', {})
+        # The daily quota is reported with the same code, but retrying is vain
+        return (error.get('Code') in self.THROTTLING_CODES
+                and 'daily' not in error.get('Message', '').lower())
+
+    def send_raw(self, from_email, to_emails, data):
+        """ We use boto3 to send email, paced to the account's send rate """
+        from .mime import read_data
+        to_emails = list(to_emails)
+        data = read_data(data)
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_rate(len(to_emails))
+            try:
+                # We need to send raw email, otherwise file is not supported
+                self.client.send_raw_email(
+                    Source=from_email,
+                    Destinations=to_emails,
+                    RawMessage={
+                        'Data': data
+                    }
+                )
+                return
+            except Exception as exc:
+                if attempt == self.max_retries or not self.is_throttled(exc):
+                    raise
+            time.sleep(backoff(attempt, self.retry_base, self.retry_cap))
+
+    def dispatch(self, messages):
+        """ Send +messages+ concurrently from the executor
+
+        Sends are paced to the send rate whatever the number of threads.
+        Return the futures of the sends. """
+        return [self.executor.submit(self.send, message) for message in messages]
@@ -0,0 +1,315 @@
+""" Local capture of messages, to be sent later by another backend """
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+from .backends import EmailBackend
+from .mime import read_data
+
+logger = logging.getLogger(__name__)
+
+# Length of the envelope, length of the message and CRC32 of both
+RECORD = struct.Struct('>III')
+
+def sync_path(path):
+    """ Flush the file or folder +path+ to disk """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class GroupCommit:
+    """ Store making appended messages durable in batches
+
+    Writers append under a lock, then wait for their message to be
+    committed. The first writer to wait commits every message appended so
+    far, with a single fsync, while the others wait for it: under load, one
+    fsync covers many messages.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path  = path
+        self.fsync = fsync
+
+        self._cond     = threading.Condition()
+        self._pending  = []
+        self._written  = 0
+        self._synced   = 0
+        self._failed   = 0
+        self._syncing  = False
+        self._io_lock  = threading.Lock()
+
+    def write(self, from_email, to_emails, data):
+        """ Write a message, without making it durable; return what commit()
+        receives for it. Called under the lock of the store. """
+        raise NotImplementedError()
+
+    def commit(self, batch):
+        """ Make the messages of +batch+ durable """
+        raise NotImplementedError()
+
+    def append(self, from_email, to_emails, data):
+        """ Store a message, returning once it is committed """
+        with self._cond:
+            self._pending.append(self.write(from_email, to_emails, data))
+            self._written += 1
+            sequence = self._written
+            while self._synced < sequence:
+                if sequence <= self._failed:
+                    raise OSError("Could not commit the message to %s" % self.path)
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                # Lead the commit of every message written so far
+                batch, self._pending = self._pending, []
+                last, self._syncing = self._written, True
+                self._cond.release()
+                try:
+                    with self._io_lock:
+                        self.commit(batch)
+                except BaseException:
+                    self._cond.acquire()
+                    self._failed = last
+                    raise
+                else:
+                    self._cond.acquire()
+                    self._synced = last
+                finally:
+                    self._syncing = False
+                    self._cond.notify_all()
+
+class SegmentLog(GroupCommit):
+    """ Append-only log of messages, split into segment files
+
+    Each record holds the envelope (sender and recipients, as JSON) and the
+    message, with a CRC32 telling a complete record from one cut by a crash.
+    Every process writes to its own segment, named after its creation time
+    and the pid, which is sealed (renamed from .open to .log) once it
+    reaches +segment_size+ or the log is closed.
+    """
+
+    PREFIX = 'segment-'
+    OPEN   = '.open'
+    SEALED = '.log'
+
+    def __init__(self, path, fsync=True, segment_size=64 * 1024 * 1024):
+        super().__init__(path, fsync)
+        self.segment_size = segment_size
+        os.makedirs(path, exist_ok=True)
+        self._file = None
+        self._pid  = None
+
+    @classmethod
+    def segments(cls, path):
+        """ Return the paths of the segments in +path+, oldest first """
+        names = [name for name in os.listdir(path) if name.startswith(cls.PREFIX)
+                 and name.endswith((cls.OPEN, cls.SEALED))]
+        names.sort(key=lambda name: name.rpartition('.')[0])
+        return [os.path.join(path, name) for name in names]
+
+    def open(self):
+        """ Start a new segment """
+        self._file = open(os.path.join(self.path, '%s%020d-%d%s' % (
+            self.PREFIX, time.time_ns(), os.getpid(), self.OPEN)), 'xb')
+        self._pid = os.getpid()
+
+    def write(self, from_email, to_emails, data):
+        if self._pid != os.getpid() or self._file.tell() >= self.segment_size:
+            self.rotate()
+        envelope = json.dumps([from_email, list(to_emails)]).encode('utf-8')
+        crc = zlib.crc32(data, zlib.crc32(envelope))
+        self._file.write(RECORD.pack(len(envelope), len(data), crc) + envelope + data)
+
+    def commit(self, batch):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def seal(self):
+        """ Commit, close and seal the current segment of this process """
+        if self._file is not None and self._pid == os.getpid():
+            self.commit(None)
+            self._file.close()
+            name = self._file.name
+            os.rename(name, name[:-len(self.OPEN)] + self.SEALED)
+        self._file = None
+        self._pid  = None
+
+    def rotate(self):
+        """ Seal the current segment and start a new one """
+        with self._io_lock:
+            # A forked process leaves the segment of its parent alone
+            self.seal()
+            self.open()
+
+    def close(self):
+        """ Seal the current segment """
+        with self._cond, self._io_lock:
+            self.seal()
+
+class Maildir(GroupCommit):
+    """ Maildir holding a file per message
+
+    Messages are written to tmp/ and moved to new/ once committed, so a
+    reader never sees a partial message. The envelope is kept in the
+    Return-Path and Delivered-To headers, prepended to the message.
+    """
+
+    def __init__(self, path, fsync=True):
+        super().__init__(path, fsync)
+        for folder in ('tmp', 'new', 'cur'):
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+        self._count = 0
+        self._host  = socket.gethostname().replace('/', '\\057').replace(':', '\\072')
+
+    def write(self, from_email, to_emails, data):
+        self._count += 1
+        name = '%d.P%dQ%d.%s' % (time.time(), os.getpid(), self._count, self._host)
+        headers = [b'Return-Path: <%s>\r\n' % from_email.encode('utf-8')]
+        headers += [b'Delivered-To: %s\r\n' % to.encode('utf-8') for to in to_emails]
+        with open(os.path.join(self.path, 'tmp', name), 'xb') as f:
+            f.write(b''.join(headers) + data)
+        return name
+
+    def commit(self, batch):
+        for name in batch:
+            if self.fsync:
+                sync_path(os.path.join(self.path, 'tmp', name))
+            os.rename(os.path.join(self.path, 'tmp', name),
+                      os.path.join(self.path, 'new', name))
+        if self.fsync:
+            # A single fsync of the folder makes every rename durable
+            sync_path(os.path.join(self.path, 'new'))
+
+    def close(self):
+        pass
+
+class CaptureEmailBackend(EmailBackend):
+    """ Email backend storing messages on the local disk instead of sending them
+
+    Messages are appended to a segmented log (+layout+ 'log') or written to
+    a Maildir (+layout+ 'maildir'), and are only acknowledged once on disk.
+    Concurrent sends share their fsyncs (see GroupCommit), so throughput is
+    bound by the local disk. Captured messages are sent later with export().
+    """
+
+    def __init__(self, *args, path=None, layout='log', fsync=True,
+                 segment_size=64 * 1024 * 1024, **kwargs):
+        """ Capture specific configuration:
+
+        * path:         Folder holding the log segments or the Maildir
+        * layout:       'log' or 'maildir'
+        * fsync:        Wait for messages to be on disk before acknowledging
+                        them, rather than only written to the OS
+        * segment_size: Size in bytes from which a new log segment is started
+        """
+        super().__init__(*args, **kwargs)
+        if layout == 'log':
+            self.store = SegmentLog(path, fsync, segment_size)
+        elif layout == 'maildir':
+            self.store = Maildir(path, fsync)
+        else:
+            raise ValueError("Unknown capture layout %r" % layout)
+        self.layout = layout
+
+    def send_raw(self, from_email, to_emails, data):
+        """ Store an already serialized message """
+        self.store.append(from_email, to_emails, read_data(data))
+
+    def close(self):
+        """ Commit and close the files of the store """
+        self.store.close()
+
+def read_segment(path, offset=0):
+    """ Yield the offset following each record of the segment +path+ from
+    +offset+, along with its sender, recipients and message
+
+    Stops at the end of the segment or at an incomplete record. """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            envelope_size, data_size, crc = RECORD.unpack(header)
+            envelope = f.read(envelope_size)
+            data = f.read(data_size)
+            if len(data) < data_size or zlib.crc32(data, zlib.crc32(envelope)) != crc:
+                return
+            from_email, to_emails = json.loads(envelope)
+            offset += RECORD.size + envelope_size + data_size
+            yield offset, from_email, to_emails, data
+
+def read_maildir_message(path):
+    """ Return the sender, recipients and message of a captured Maildir file """
+    with open(path, 'rb') as f:
+        data = f.read()
+    from_email, to_emails = '', []
+    while True:
+        line, _, rest = data.partition(b'\r\n')
+        if line.startswith(b'Return-Path: <') and line.endswith(b'>'):
+            from_email = line[14:-1].decode('utf-8')
+        elif line.startswith(b'Delivered-To: '):
+            to_emails.append(line[14:].decode('utf-8'))
+        else:
+            return from_email, to_emails, data
+        data = rest
+
+def export(path, backend, layout='log', limit=None):
+    """ Send the messages captured in +path+ with +backend+'s send_raw
+
+    Exported messages are removed: sealed segments are deleted once sent,
+    and the position reached in a segment still open is saved next to it,
+    so an export can run while messages are being captured. A failed send
+    stops the export, and the message is sent again by the next one.
+    Return the number of messages sent, at most +limit+. """
+    if layout == 'maildir':
+        return export_maildir(path, backend, limit)
+    sent = 0
+    for segment in SegmentLog.segments(path):
+        position = segment.rpartition('.')[0] + '.pos'
+        offset = 0
+        if os.path.exists(position):
+            with open(position) as f:
+                offset = int(f.read() or 0)
+        sealed = segment.endswith(SegmentLog.SEALED)
+        try:
+            for end, from_email, to_emails, data in read_segment(segment, offset):
+                if limit is not None and sent >= limit:
+                    return sent
+                backend.send_raw(from_email, to_emails, data)
+                offset = end
+                sent += 1
+        finally:
+            save_position(position, offset)
+        if sealed:
+            if offset < os.path.getsize(segment):
+                logger.warning("Skipped the incomplete end of segment %s", segment)
+            os.unlink(segment)
+            os.unlink(position)
+    return sent
+
+def save_position(path, offset):
+    """ Atomically write the export position +offset+ to +path+ """
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(offset))
+    os.replace(path + '.tmp', path)
+
+def export_maildir(path, backend, limit=None):
+    """ Send and remove the messages of the Maildir +path+, see export() """
+    sent = 0
+    folder = os.path.join(path, 'new')
+    for name in sorted(os.listdir(folder)):
+        if limit is not None and sent >= limit:
+            break
+        message = os.path.join(folder, name)
+        backend.send_raw(*read_maildir_message(message))
+        os.unlink(message)
+        sent += 1
+    return sent
@@ -0,0 +1,197 @@
+""" Load balancing and failover between several email backends """
+import itertools
+import threading
+import time
+
+from .backends import ProxyEmailBackend
+
+class Member:
+    """ Rolling health of a backend of a CompositeEmailBackend
+
+    Latency and error rate are exponentially weighted moving averages, so
+    recent sends weigh more than old ones. Failed sends count in the
+    latency, along with FAILURE_PENALTY seconds. """
+
+    # Time a failed send is assumed to cost, on top of its own latency,
+    # since the message then has to be sent again on another member
+    FAILURE_PENALTY = 1.0
+
+    def __init__(self, backend):
+        self.backend   = backend
+        self.latency   = 0.0
+        self.errors    = 0.0
+        self.failures  = 0
+        self.opened_at = None
+        self.trial     = False
+
+    @property
+    def score(self):
+        """ Expected time to get a message sent, lower is better """
+        return (self.latency + self.errors * self.FAILURE_PENALTY) / max(0.01, 1 - self.errors)
+
+    def is_available(self, now, reset_timeout):
+        """ Return whether the circuit lets a send through at +now+ """
+        if self.opened_at is None:
+            return True
+        # Once reset_timeout elapsed, a single trial send is let through
+        return not self.trial and now - self.opened_at >= reset_timeout
+
+class CompositeEmailBackend(ProxyEmailBackend):
+    """ Spread messages over several backends, failing over between them
+
+    Messages are generated by the first backend. Each send is tried on the
+    members in the order given by +strategy+, 'round_robin' or
+    'least_latency', until one succeeds. A member failing
+    +failure_threshold+ times in a row has its circuit opened: it is skipped
+    for +reset_timeout+ seconds, after which a single trial send decides
+    whether it is closed again. When every circuit is open, the members are
+    still tried, the one opened first coming first, rather than losing the
+    message.
+
+    Members should be backends actually sending messages; wrap the composite
+    in a queue or an outbox to deliver in the background.
+    """
+
+    STRATEGIES = ('round_robin', 'least_latency')
+
+    def __init__(self, backends, strategy='round_robin', failure_threshold=5,
+                 reset_timeout=30, decay=0.2):
+        """ Configuration of the composite:
+
+        * backends:          Email backends to send messages with
+        * strategy:          'round_robin' or 'least_latency'
+        * failure_threshold: Consecutive failures opening a member's circuit
+        * reset_timeout:     Seconds before an open circuit is tried again
+        * decay:             Weight of the last send in the rolling scores
+        """
+        assert backends, "CompositeEmailBackend needs at least one backend"
+        assert strategy in self.STRATEGIES, "Unknown strategy %r" % strategy
+        super().__init__(backends[0])
+        self.members           = [Member(backend) for backend in backends]
+        self.strategy          = strategy
+        self.failure_threshold = failure_threshold
+        self.reset_timeout     = reset_timeout
+        self.decay             = decay
+
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        """ Return the members to try a send on, in order """
+        with self._lock:
+            if self.strategy == 'round_robin':
+                start = next(self._turn) % len(self.members)
+                return self.members[start:] + self.members[:start]
+            return sorted(self.members, key=lambda member: member.score)
+
+    def claim(self, member):
+        """ Return whether a send can be tried on +member+ now """
+        with self._lock:
+            if not member.is_available(time.monotonic(), self.reset_timeout):
+                return False
+            member.trial = member.opened_at is not None
+            return True
+
+    def record(self, member, latency, error):
+        """ Update the health of +member+ after a send """
+        with self._lock:
+            member.trial = False
+            member.errors += self.decay * (error - member.errors)
+            member.latency += self.decay * (latency - member.latency)
+            if error:
+                member.failures += 1
+                # A failed trial reopens the circuit for another reset_timeout
+                if member.opened_at is not None or member.failures >= self.failure_threshold:
+                    member.opened_at = time.monotonic()
+            else:
+                member.failures = 0
+                member.opened_at = None
+
+    def release(self, member):
+        """ Let another trial through +member+ after an interrupted send """
+        with self._lock:
+            member.trial = False
+
+    @staticmethod
+    def rewind(data):
+        """ Rewind +data+ before it is sent again """
+        if not isinstance(data, (bytes, bytearray)):
+            data.seek(0)
+
+    def fallback(self, members):
+        """ Return +members+, the one whose circuit opened first coming first
+
+        Circuits closed by another send since then come last. """
+        with self._lock:
+            opened = [(member.opened_at, index) for index, member in enumerate(members)]
+        opened.sort(key=lambda item: (item[0] is None, item[0] or 0, item[1]))
+        return [members[index] for _, index in opened]
+
+    def attempts(self, data):
+        """ Yield the members to send +data+ with, rewinding it between tries
+
+        Members are claimed one at a time, so that a half open circuit is
+        only used for a trial when the members before it failed. """
+        members, claimed = self.candidates(), False
+        for member in members:
+            if self.claim(member):
+                if claimed:
+                    self.rewind(data)
+                claimed = True
+                yield member
+        if not claimed:
+            # Every circuit is open, rather than losing the message try them all
+            for index, member in enumerate(self.fallback(members)):
+                if index:
+                    self.rewind(data)
+                yield member
+
+    def send_raw(self, from_email, to_emails, data):
+        """ Send an already serialized message with the first member that can """
+        to_emails, error = list(to_emails), None
+        for member in self.attempts(data):
+            start = time.perf_counter()
+            try:
+                member.backend.send_raw(from_email, to_emails, data)
+            except Exception as exc:
+                self.record(member, time.perf_counter() - start, True)
+                error = exc
+            except BaseException:
+                # i.e a cancelled send, which says nothing of the member
+                self.release(member)
+                raise
+            else:
+                self.record(member, time.perf_counter() - start, False)
+                return
+        raise error
+
+    def send(self, message):
+        """ Serialize +message+ once, then send it with failover """
+        from .mime import get_recipients, spool_message
+        with spool_message(message) as fp:
+            self.send_raw(message['From'], get_recipients(message), fp)
+
+    async def asend_raw(self, from_email, to_emails, data):
+        """ Coroutine sending a serialized message with the first member that can """
+        to_emails, error = list(to_emails), None
+        for member in self.attempts(data):
+            start = time.perf_counter()
+            try:
+                await member.backend.asend_raw(from_email, to_emails, data)
+            except Exception as exc:
+                self.record(member, time.perf_counter() - start, True)
+                error = exc
+            except BaseException:
+                # i.e a cancelled send, which says nothing of the member
+                self.release(member)
+                raise
+            else:
+                self.record(member, time.perf_counter() - start, False)
+                return
+        raise error
+
+    async def asend(self, message):
+        """ Coroutine serializing +message+ once, then sending it with failover """
+        from .mime import get_recipients, spool_message
+        with spool_message(message) as fp:
+            await self.asend_raw(message['From'], get_recipients(message), fp)
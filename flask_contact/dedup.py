@@ -0,0 +1,60 @@
+""" Suppression of duplicate submissions """
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from .mime import CHUNK_SIZE
+
+class DuplicateFilter:
+    """ Remember recent submissions to drop their duplicates
+
+    A submission is identified by its Idempotency-Key header when present,
+    otherwise by a digest of its normalized allowed fields and of its file.
+    Keys are kept +ttl+ seconds, and at most +maxsize+ of them.
+    """
+
+    def __init__(self, ttl=600, maxsize=10000):
+        self.ttl     = ttl
+        self.maxsize = maxsize
+        self.keys    = OrderedDict()
+        self.lock    = threading.Lock()
+
+    @staticmethod
+    def normalize(value):
+        """ Return +value+ without the differences a resubmit may introduce """
+        return ' '.join(str(value).split())
+
+    def get_key(self, fields, file=None, idempotency_key=None):
+        """ Return the key identifying a submission """
+        if idempotency_key:
+            return 'key:' + idempotency_key
+
+        digest = hashlib.sha256()
+        for key, value in sorted(fields):
+            digest.update(('%s=%s\0' % (key, self.normalize(value))).encode('utf-8'))
+        if file:
+            digest.update(('file=%s\0' % file.filename).encode('utf-8'))
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+            file.seek(0)
+        return 'hash:' + digest.hexdigest()
+
+    def claim(self, key):
+        """ Return True and remember +key+ if it wasn't seen recently """
+        now = time.monotonic()
+        with self.lock:
+            # Keys are kept in insertion order, so expired ones come first
+            while self.keys and next(iter(self.keys.values())) <= now:
+                self.keys.popitem(last=False)
+            if key in self.keys:
+                return False
+            self.keys[key] = now + self.ttl
+            if len(self.keys) > self.maxsize:
+                self.keys.popitem(last=False)
+        return True
+
+    def release(self, key):
+        """ Forget +key+, e.g. when its submission could not be sent """
+        with self.lock:
+            self.keys.pop(key, None)
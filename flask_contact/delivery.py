@@ -0,0 +1,115 @@
+""" Asynchronous delivery of messages by a pool of background workers """
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from .backends import ProxyEmailBackend
+from .errors import QueueFull
+
+logger = logging.getLogger(__name__)
+
+class QueuedEmailBackend(ProxyEmailBackend):
+    """ Wrap an email backend so that messages are sent in the background
+
+    Messages generated by get_mail are put on a bounded in-process queue that
+    is drained by worker threads, so mail() returns as soon as the message is
+    queued. Pending messages are flushed when the interpreter exits.
+    """
+
+    deferred = True
+    # Workers hand the message objects to the wrapped backend's send
+    direct   = False
+
+    def __init__(self, backend, maxsize=100, workers=2, block=False,
+                 timeout=None, on_error=None):
+        """ Configuration for the delivery queue:
+
+        * backend:  Email backend used to actually send messages
+        * maxsize:  Maximum number of messages waiting to be sent
+        * workers:  Number of threads sending messages
+        * block:    Wait for a free slot when the queue is full instead of
+                    raising QueueFull right away
+        * timeout:  Maximum number of seconds to wait for a free slot
+        * on_error: Callback receiving the message and the exception when
+                    a message fails to be sent
+        """
+        super().__init__(backend)
+        self.queue    = queue.Queue(maxsize)
+        self.workers  = workers
+        self.block    = block
+        self.timeout  = timeout
+        self.on_error = on_error
+
+        self._threads = []
+        self._pid     = None
+        self._lock    = threading.Lock()
+
+    def start(self):
+        """ Start the worker threads, once per process """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads don't survive a fork, so a forked worker starts its own
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self.work, daemon=True)
+                for _ in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            atexit.register(self.close)
+
+    def work(self):
+        """ Worker loop sending queued messages until it receives None """
+        while True:
+            message = self.queue.get()
+            try:
+                if message is None:
+                    return
+                self.backend.send(message)
+            except Exception as exc:
+                self.handle_error(message, exc)
+            finally:
+                self.queue.task_done()
+
+    def handle_error(self, message, exc):
+        """ Report a message that could not be sent """
+        if self.on_error is not None:
+            # A failing callback must not kill the worker thread
+            try:
+                self.on_error(message, exc)
+            except Exception:
+                logger.exception("Error callback failed for the message to %s", message['To'])
+        else:
+            logger.error("Could not send message to %s", message['To'], exc_info=exc)
+
+    def send(self, message):
+        """ Queue +message+ to be sent by a worker thread """
+        self.start()
+        try:
+            self.queue.put(message, self.block, self.timeout)
+        except queue.Full:
+            raise QueueFull() from None
+
+    def close(self, flush=True):
+        """ Stop the workers, waiting for pending messages when +flush+ """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+        if not flush:
+            # Drop the pending messages so the workers see the sentinel soon
+            try:
+                while True:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+            except queue.Empty:
+                pass
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+        atexit.unregister(self.close)
@@ -0,0 +1,211 @@
+""" Digest mode coalescing many submissions into periodic summary emails """
+import atexit
+import logging
+import os
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from .backends import ProxyEmailBackend
+from .mime import SpooledAttachment
+
+logger = logging.getLogger(__name__)
+
+class Entry:
+    """ Submission waiting to be included in a digest """
+    __slots__ = ('received', 'subject', 'text', 'attachment', 'recipients')
+
+    def __init__(self, received, subject, text, attachment=None, recipients=()):
+        self.received   = received
+        self.subject    = subject
+        self.text       = text
+        self.attachment = attachment
+        self.recipients = tuple(recipients)
+
+class DigestEmailBackend(ProxyEmailBackend):
+    """ Wrap an email backend so that submissions are sent as digests
+
+    Each submission is formatted with the wrapped backend's get_subject and
+    get_message, then buffered. A single message regrouping the buffered
+    submissions is sent by a timer thread every +window+ seconds, or as
+    soon as +size+ submissions are waiting, so that no request waits for a
+    digest to be sent. Submissions routed to different recipients (see
+    get_recipients) are sent in separate digests. When a digest can't be sent, its submissions are
+    buffered again for the next one, tried after +retry_delay+ seconds.
+    """
+
+    deferred = True
+    # Submissions are formatted into entries by mail(), not sent as messages
+    direct   = False
+
+    SEPARATOR = '\n\n' + '-' * 40 + '\n\n'
+
+    def __init__(self, backend, window=3600, size=100,
+                 max_attachments_size=10 * 1024 * 1024,
+                 subject="{count} new messages", on_error=None,
+                 max_entries=1000, retry_delay=60):
+        """ Configuration for the digest:
+
+        * backend:              Email backend used to send the digests
+        * window:               Maximum number of seconds a submission waits
+        * size:                 Number of submissions triggering a digest
+        * max_attachments_size: Maximum total size of the files joined to a
+                                digest, further files are left out
+        * subject:              Subject of the digest, formatted with count
+        * on_error:             Callback receiving the entries and the
+                                exception when failed digests leave more
+                                than +max_entries+ submissions buffered
+        * max_entries:          Maximum number of submissions buffered once
+                                a digest failed, the oldest are handed to
+                                on_error, or dropped
+        * retry_delay:          Seconds before a failed digest is tried again
+        """
+        super().__init__(backend)
+        self.window               = window
+        self.size                 = size
+        self.max_attachments_size = max_attachments_size
+        self.subject              = subject
+        self.on_error             = on_error
+        self.max_entries          = max_entries
+        self.retry_delay          = retry_delay
+
+        self._entries = []
+        self._attachments_size = 0
+        self._lock    = threading.Lock()
+        self._wakeup  = threading.Event()
+        self._stop    = threading.Event()
+        self._thread  = None
+        self._pid     = None
+
+    def get_entry(self, fields, file=None):
+        """ Format a submission along with its attachment """
+        received = time.strftime('%Y-%m-%d %H:%M:%S')
+        attachment = self.get_file(file)
+        if attachment:
+            attachment = SpooledAttachment(attachment, attachment.filename,
+                                           max_size=self.max_file_size)
+        return Entry(received, self.get_subject(fields), self.get_message(fields),
+                     attachment or None, self.get_recipients(fields))
+
+    def get_digest(self, entries):
+        """ Return a Mimetype message regrouping +entries+, sent to the
+        recipients of the first one """
+        message = MIMEMultipart()
+        message['Subject'] = self.subject.format(count=len(entries))
+        message['From'] = self.from_email
+        message['To'] = ', '.join(entries[0].recipients)
+
+        body = self.SEPARATOR.join(
+            "%s - %s\n\n%s" % (entry.received, entry.subject, entry.text)
+            for entry in entries
+        )
+        message.attach(MIMEText(body, 'plain'))
+
+        for entry in entries:
+            if entry.attachment:
+                message.attach(entry.attachment)
+        return message
+
+    def mail(self, fields, file=None):
+        """ Buffer a submission, waking the timer up when enough are waiting """
+        self.start()
+        entry = self.get_entry(fields, file)
+        with self._lock:
+            if entry.attachment:
+                size = entry.attachment.size
+                if self._attachments_size + size > self.max_attachments_size:
+                    entry.text += ("\n(attachment %s left out of this digest)"
+                                   % entry.attachment.filename)
+                    entry.attachment = None
+                else:
+                    self._attachments_size += size
+            self._entries.append(entry)
+            full = len(self._entries) >= self.size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """ Send a digest of the buffered submissions to each of their
+        recipients, if any, returning wether they were all sent
+
+        Errors are not raised: the submissions of a digest come from many
+        requests, and none of them should fail for the others. """
+        with self._lock:
+            entries, self._entries = self._entries, []
+            self._attachments_size = 0
+        groups = {}
+        for entry in entries:
+            groups.setdefault(entry.recipients, []).append(entry)
+        sent = True
+        for group in groups.values():
+            try:
+                self.backend.send(self.get_digest(group))
+            except Exception as exc:
+                self.handle_error(group, exc)
+                sent = False
+        return sent
+
+    def handle_error(self, entries, exc):
+        """ Buffer the entries of a digest that could not be sent again,
+        keeping at most +max_entries+ submissions """
+        logger.error("Could not send a digest of %d submissions, keeping them for the next one",
+                     len(entries), exc_info=exc)
+        with self._lock:
+            self._entries[:0] = entries
+            overflow = self._entries[:max(0, len(self._entries) - self.max_entries)]
+            del self._entries[:len(overflow)]
+            self._attachments_size = sum(
+                entry.attachment.size for entry in self._entries if entry.attachment)
+        if not overflow:
+            return
+        if self.on_error is not None:
+            try:
+                self.on_error(overflow, exc)
+            except Exception:
+                logger.exception("Error callback of the digest failed")
+        else:
+            logger.error("Dropped the %d oldest submissions of the digest", len(overflow))
+
+    def run(self):
+        """ Timer loop sending a digest every window, or once woken up """
+        while True:
+            self._wakeup.wait(self.window)
+            while True:
+                self._wakeup.clear()
+                if self._stop.is_set():
+                    return
+                try:
+                    if self.flush():
+                        break
+                except Exception:
+                    logger.exception("Could not flush the digest")
+                # Whatever is buffered, let the backend recover before trying again
+                if self._stop.wait(self.retry_delay):
+                    return
+
+    def start(self):
+        """ Start the timer thread, once per process """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup.clear()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """ Stop the timer and send the buffered submissions """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if self._pid != os.getpid():
+                thread = None
+            self._pid = None
+        self._stop.set()
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+            atexit.unregister(self.close)
+        self.flush()
@@ -0,0 +1,25 @@
+""" Exceptions raised while handling a submission
+
+They live in their own module so that the blueprint can handle them
+without importing the modules raising them. """
+
+class InvalidFields(ValueError):
+    """ Raised when posted fields don't follow a FieldPolicy
+
+    +errors+ maps each invalid field to the reason it was rejected. """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+class FileTooLarge(Exception):
+    """ Raised when an uploaded file is larger than allowed """
+
+class QueueFull(Exception):
+    """ Raised when a message can't be queued because the queue is full """
+
+class PoolTimeout(Exception):
+    """ Raised when no SMTP session of a pool frees up in time """
+
+class RedHerring(Exception):
+    """ Raised when a submission fills in the red herring (honeypot) field """
@@ -0,0 +1,206 @@
+""" Pipeline of spam filters run on submissions before they are sent """
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+class Filter:
+    """ Base class of the filters of a FilterPipeline
+
+    A filter has a +name+, used in the statistics, and a relative +cost+:
+    the pipeline runs the cheapest filters first, so that the expensive
+    ones only see the submissions that got past the others.
+    """
+
+    name = 'filter'
+    cost = 1
+
+    def check(self, fields, text):
+        """ Return wether the submission must be rejected
+
+        +text+ is the values of +fields+ joined by new lines. """
+        raise NotImplementedError()
+
+class HoneypotFilter(Filter):
+    """ Reject submissions filling in a field that only bots see """
+
+    name = 'honeypot'
+    cost = 1
+
+    def __init__(self, field):
+        self.field = field
+
+    def check(self, fields, text):
+        return bool(fields.get(self.field))
+
+class LengthFilter(Filter):
+    """ Reject submissions whose text is longer than +max_length+ """
+
+    name = 'length'
+    cost = 2
+
+    def __init__(self, max_length=5000):
+        self.max_length = max_length
+
+    def check(self, fields, text):
+        return len(text) > self.max_length
+
+class LinkFilter(Filter):
+    """ Reject submissions holding more than +max_links+ links """
+
+    name = 'links'
+    cost = 5
+
+    LINK = re.compile(r'https?://|www\.|\[url', re.IGNORECASE)
+
+    def __init__(self, max_links=2):
+        self.max_links = max_links
+
+    def check(self, fields, text):
+        count = 0
+        for _ in self.LINK.finditer(text):
+            count += 1
+            if count > self.max_links:
+                return True
+        return False
+
+class KeywordFilter(Filter):
+    """ Reject submissions holding one of +keywords+ (whole words, any case)
+
+    Keywords are compiled into a single regular expression. """
+
+    name = 'keywords'
+    cost = 10
+
+    def __init__(self, keywords):
+        words = sorted({keyword.casefold() for keyword in keywords}, key=len, reverse=True)
+        self.pattern = re.compile(r'\b(?:%s)\b' % '|'.join(map(re.escape, words)),
+                                  re.IGNORECASE) if words else None
+
+    def check(self, fields, text):
+        return self.pattern is not None and self.pattern.search(text) is not None
+
+class BayesFilter(Filter):
+    """ Naive Bayes scorer trained on local examples of spam and ham
+
+    Submissions are reduced to the set of their words. A submission is
+    rejected when its probability of being spam is at least +threshold+,
+    once at least +min_examples+ examples of each kind were trained.
+    """
+
+    name = 'bayes'
+    cost = 50
+
+    TOKEN = re.compile(r'[^\W\d_]{2,}|https?://')
+
+    def __init__(self, threshold=0.9, min_examples=10):
+        self.threshold    = threshold
+        self.min_examples = min_examples
+        self.counts       = {True: Counter(), False: Counter()}
+        self.examples     = {True: 0, False: 0}
+        self.lock         = threading.Lock()
+
+    def tokens(self, text):
+        """ Return the set of words of +text+ """
+        return set(self.TOKEN.findall(text.casefold()))
+
+    def train(self, text, spam):
+        """ Learn that +text+ is spam, or ham (not spam) """
+        tokens = self.tokens(text)
+        with self.lock:
+            self.counts[spam].update(tokens)
+            self.examples[spam] += 1
+
+    def score(self, text):
+        """ Return the probability of +text+ being spam """
+        tokens = self.tokens(text)
+        spams, hams = self.examples[True], self.examples[False]
+        if not spams or not hams:
+            return 0.5
+        # Log odds of the prior and of each word, with Laplace smoothing
+        log_odds = math.log(spams / hams)
+        for token in tokens:
+            spam = (self.counts[True][token] + 1) / (spams + 2)
+            ham = (self.counts[False][token] + 1) / (hams + 2)
+            log_odds += math.log(spam / ham)
+        if log_odds > 700:
+            return 1.0
+        return 1 - 1 / (1 + math.exp(log_odds))
+
+    def check(self, fields, text):
+        if min(self.examples.values()) < self.min_examples:
+            return False
+        return self.score(text) >= self.threshold
+
+    def save(self, path):
+        """ Save what was learnt to the JSON file +path+ """
+        with self.lock:
+            state = {'spam': [self.examples[True], self.counts[True]],
+                     'ham': [self.examples[False], self.counts[False]]}
+            with open(path, 'w') as f:
+                json.dump(state, f)
+
+    def load(self, path):
+        """ Load what was learnt from the JSON file +path+ """
+        with open(path) as f:
+            state = json.load(f)
+        with self.lock:
+            for spam, key in ((True, 'spam'), (False, 'ham')):
+                examples, counts = state[key]
+                self.examples[spam] = examples
+                self.counts[spam] = Counter(counts)
+
+class Stats:
+    """ Number of runs, rejections and time spent of a filter """
+    __slots__ = ('calls', 'hits', 'seconds')
+
+    def __init__(self):
+        self.calls   = 0
+        self.hits    = 0
+        self.seconds = 0.0
+
+    @property
+    def hit_rate(self):
+        """ Share of the runs that rejected the submission """
+        return self.hits / self.calls if self.calls else 0.0
+
+class FilterPipeline:
+    """ Filters run cheapest first, stopping at the first rejection
+
+    Statistics are kept for every filter, to tell how often it rejects
+    submissions and what it costs.
+    """
+
+    def __init__(self, filters):
+        self.filters = sorted(filters, key=lambda f: f.cost)
+        # Kept per filter rather than per name: filters may share a name
+        self.stats   = [Stats() for _ in self.filters]
+        self.lock    = threading.Lock()
+
+    def check(self, fields):
+        """ Return the name of the filter rejecting +fields+, None if none does """
+        text = '\n'.join(str(value) for value in fields.values() if value)
+        for filter_, stats in zip(self.filters, self.stats):
+            start = time.perf_counter()
+            rejected = filter_.check(fields, text)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stats.calls += 1
+                stats.seconds += elapsed
+                if rejected:
+                    stats.hits += 1
+            if rejected:
+                return filter_.name
+        return None
+
+    def get_stats(self):
+        """ Return the statistics of each filter, in the order they are run """
+        with self.lock:
+            return [
+                {'name': f.name, 'cost': f.cost, 'calls': stats.calls,
+                 'hits': stats.hits, 'hit_rate': stats.hit_rate,
+                 'seconds': stats.seconds}
+                for f, stats in zip(self.filters, self.stats)
+            ]
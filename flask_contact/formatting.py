@@ -0,0 +1,48 @@
+""" Templates used to format the subject and the body of messages """
+import html
+import re
+
+TOKEN = re.compile(r'\{\{|\}\}|\{\s*(\w+)\s*(?:\|([^{}]*))?\}')
+
+class Template:
+    """ Format string compiled once into literal text and field lookups
+
+    Use {name} to insert the value of field 'name', {name|default} to insert
+    'default' when the field is missing or empty, and {{ or }} for braces.
+    Field values are escaped when rendered, the template text is not.
+    """
+
+    def __init__(self, source, escape=html.escape):
+        self.source   = source
+        self.escape   = escape
+        self.segments = []
+
+        # Each segment is a literal text followed by an optional field
+        literal, position = '', 0
+        for match in TOKEN.finditer(source):
+            literal += source[position:match.start()]
+            position = match.end()
+            if match.group(1) is None:
+                literal += match.group(0)[0]
+            else:
+                self.segments.append((literal, match.group(1), match.group(2) or ''))
+                literal = ''
+        self.segments.append((literal + source[position:], None, None))
+
+    @property
+    def names(self):
+        """ Return the names of the fields used by the template """
+        return [name for _, name, _ in self.segments if name is not None]
+
+    def render(self, fields):
+        """ Render the template in a single pass over its segments """
+        parts = []
+        for literal, name, default in self.segments:
+            parts.append(literal)
+            if name is not None:
+                value = fields.get(name)
+                parts.append(self.escape(str(value)) if value else default)
+        return ''.join(parts)
+
+    def __repr__(self):
+        return 'Template(%r)' % self.source
@@ -0,0 +1,106 @@
+""" Checks of a request made before its body is parsed """
+import tempfile
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import BadRequest
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from .errors import RedHerring
+
+class Gatekeeper:
+    """ Reject requests from their headers, and parse forms as a stream
+
+    check() is run on the headers of a request, before any of its body is
+    read: it enforces a Content-Length budget, the content type, and that
+    the Origin (or Referer) header, when sent, is an allowed origin.
+
+    parse() reads a multipart form part by part, so that a submission
+    filling in the red herring field is rejected before the file parts
+    following it are read. Put the red herring field before the file input
+    of the form to benefit from it.
+    """
+
+    CONTENT_TYPES = ('application/json', 'application/x-www-form-urlencoded',
+                     'multipart/form-data')
+
+    def __init__(self, max_content_length=10 * 1024 * 1024,
+                 content_types=CONTENT_TYPES, check_origin=True,
+                 max_memory=1024 * 1024, chunk_size=64 * 1024):
+        """ Configuration of the gatekeeper:
+
+        * max_content_length: Maximum size in bytes of the body of a request
+        * content_types:      Accepted content types
+        * check_origin:       Reject requests from an origin that isn't allowed
+        * max_memory:         Size over which an uploaded file is spooled to disk
+        * chunk_size:         Size of the reads of a multipart body
+        """
+        self.max_content_length = max_content_length
+        self.content_types      = frozenset(content_types)
+        self.check_origin       = check_origin
+        self.max_memory         = max_memory
+        self.chunk_size         = chunk_size
+
+    def check(self, request, origins):
+        """ Return the status code and the reason to reject +request+ with,
+        or None when it can be parsed
+
+        +origins+ is the OriginPolicy of the blueprint. """
+        if self.max_content_length is not None:
+            if request.content_length is None:
+                return 411, 'length_required'
+            if request.content_length > self.max_content_length:
+                return 413, 'too_large'
+
+        if request.mimetype not in self.content_types:
+            return 415, 'content_type'
+
+        if self.check_origin:
+            origin = request.headers.get('Origin') or request.referrer
+            if origin and origin not in origins:
+                return 401, 'origin'
+        return None
+
+    def parse(self, request, is_red_herring):
+        """ Return the fields and the file of a multipart form
+
+        Raise RedHerring as soon as the fields parsed so far are a red
+        herring according to +is_red_herring+. Only the part named 'file'
+        is kept among files. """
+        boundary = request.mimetype_params.get('boundary')
+        if not boundary:
+            raise BadRequest("Missing multipart boundary")
+
+        decoder = MultipartDecoder(boundary.encode('latin-1'))
+        fields, file = {}, None
+        name, value, spool = None, None, None
+        try:
+            while True:
+                event = decoder.next_event()
+                if isinstance(event, NeedData):
+                    decoder.receive_data(request.stream.read(self.chunk_size) or None)
+                elif isinstance(event, Field):
+                    name, value, spool = event.name, bytearray(), None
+                elif isinstance(event, File):
+                    name, value = event.name, None
+                    spool = None
+                    if event.name == 'file' and file is None:
+                        spool = tempfile.SpooledTemporaryFile(self.max_memory)
+                        file = FileStorage(spool, event.filename, event.name,
+                                           headers=event.headers)
+                elif isinstance(event, Data):
+                    if value is not None:
+                        value += event.data
+                    elif spool is not None:
+                        spool.write(event.data)
+                    if event.more_data:
+                        continue
+                    if value is not None:
+                        fields.setdefault(name, value.decode('utf-8', 'replace'))
+                        if is_red_herring(fields):
+                            raise RedHerring()
+                    elif spool is not None:
+                        spool.seek(0)
+                elif isinstance(event, Epilogue):
+                    return fields, file
+        except ValueError:
+            raise BadRequest("Invalid multipart form") from None
@@ -0,0 +1,267 @@
+""" End-to-end load test of the blueprint against a local SMTP sink
+
+Starts an SMTP sink answering after an artificial latency, serves an app
+registering blueprint() with a local WSGI server, and posts submissions to
+it from concurrent clients:
+
+    python -m flask_contact.loadtest --requests 2000 --concurrency 20 \\
+        --kind json --backend queued --smtp-latency 0.05
+
+Reports the throughput, the latency percentiles and the errors by status,
+so that backends and settings can be compared on the same machine.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flask_contact import blueprint
+
+BACKENDS = ('smtp', 'queued', 'capture')
+KINDS = ('json', 'form', 'file')
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """ Local SMTP server counting the messages it receives
+
+    Every message is acknowledged +latency+ seconds after its data was
+    received, like a relay would. Each connection is served by a thread. """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        super().__init__((host, port), SMTPHandler)
+        self.latency     = latency
+        self.messages    = 0
+        self.bytes       = 0
+        self.connections = 0
+        self.lock        = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def received(self, size):
+        """ Count a received message of +size+ bytes """
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """ SMTP session accepting any login, sender and recipient """
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.wfile.write(b'220 sink ready\r\n')
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.wfile.write(b'250-sink\r\n250-8BITMIME\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif command == b'AUTH':
+                self.wfile.write(b'235 Authenticated\r\n')
+            elif command == b'DATA':
+                self.wfile.write(b'354 Go ahead\r\n')
+                size = 0
+                for line in self.rfile:
+                    if line == b'.\r\n':
+                        break
+                    size += len(line)
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                self.server.received(size)
+                self.wfile.write(b'250 Queued\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+def get_backend(name, sink, options):
+    """ Return the email backend +name+ sending to +sink+ """
+    from flask_contact.backends import SMTPEmailBackend
+    settings = dict(allowed_fields='*', allow_file=True)
+    if name == 'capture':
+        from flask_contact.capture import CaptureEmailBackend
+        return CaptureEmailBackend('from@example.com', 'to@example.com',
+                                   path=options.capture_path or tempfile.mkdtemp(),
+                                   fsync=not options.no_fsync, **settings)
+    backend = SMTPEmailBackend(
+        'from@example.com', 'to@example.com',
+        smtp_server='127.0.0.1', smtp_port=sink.port, smtp_ssl=False,
+        smtp_user='user', smtp_password='password',
+        pool_size=options.pool_size, **settings)
+    if name == 'queued':
+        from flask_contact.delivery import QueuedEmailBackend
+        return QueuedEmailBackend(backend, maxsize=options.queue_size,
+                                  workers=options.pool_size)
+    return backend
+
+def get_body(kind, index, file_size):
+    """ Return the content type and the body of submission number +index+ """
+    fields = {'email': 'client%d@example.com' % index,
+              'message': 'Message number %d\n%s' % (index, 'x' * 200)}
+    if kind == 'json':
+        return 'application/json', json.dumps(fields).encode('utf-8')
+    fields['redirect_uri'] = 'http://localhost/thanks'
+    if kind == 'form':
+        from urllib.parse import urlencode
+        return 'application/x-www-form-urlencoded', urlencode(fields).encode('ascii')
+    boundary = 'loadtest%d' % index
+    parts = [b'--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (
+        boundary.encode(), name.encode(), value.encode()) for name, value in fields.items()]
+    parts.append(b'--%s\r\nContent-Disposition: form-data; name="file"; filename="file.pdf"\r\n'
+                 b'Content-Type: application/pdf\r\n\r\n%s\r\n' % (
+                     boundary.encode(), os.urandom(file_size)))
+    parts.append(b'--%s--\r\n' % boundary.encode())
+    return 'multipart/form-data; boundary=%s' % boundary, b''.join(parts)
+
+class QuietHandler(WSGIRequestHandler):
+    """ Request handler not logging every request """
+    def log_request(self, *args, **kwargs):
+        pass
+
+class Client:
+    """ HTTP client keeping a connection open per thread """
+
+    def __init__(self, port):
+        self.port  = port
+        self.local = threading.local()
+
+    def post(self, content_type, body):
+        """ Post +body+, returning the status and the time it took """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                '127.0.0.1', self.port, timeout=60)
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/', body, {'Content-Type': content_type,
+                                                   'Origin': 'http://localhost'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            self.local.connection = None
+            status = type(exc).__name__
+        return status, time.perf_counter() - start
+
+def percentile(values, rank):
+    """ Return the +rank+ percentile of the sorted +values+ (nearest rank) """
+    if not values:
+        return 0.0
+    index = max(0, math.ceil(rank / 100 * len(values)) - 1)
+    return values[index]
+
+def run(options):
+    """ Run a load test, returning its report as a dict """
+    sink = SMTPSink(options.smtp_latency)
+    threading.Thread(target=sink.serve_forever, args=(0.05,), daemon=True).start()
+    backend = get_backend(options.backend, sink, options)
+
+    app = Flask(__name__)
+    app.register_blueprint(blueprint('contact', backend))
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+
+    client = Client(server.server_port)
+    bodies = [get_body(options.kind, index, options.file_size)
+              for index in range(min(options.requests, 100))]
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options.concurrency) as executor:
+            results = list(executor.map(
+                lambda index: client.post(*bodies[index % len(bodies)]),
+                range(options.requests)))
+        elapsed = time.perf_counter() - start
+        if options.backend == 'queued':
+            backend.close() # Waits for the queued messages to be sent
+        drained = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        sink.shutdown()
+        sink.server_close()
+
+    latencies = sorted(duration for _, duration in results)
+    statuses = Counter(status for status, _ in results)
+    errors = sum(count for status, count in statuses.items()
+                 if not isinstance(status, int) or status >= 400)
+    return {
+        'backend':     options.backend,
+        'kind':        options.kind,
+        'requests':    options.requests,
+        'concurrency': options.concurrency,
+        'seconds':     elapsed,
+        'throughput':  options.requests / elapsed if elapsed else 0.0,
+        'p50':         percentile(latencies, 50),
+        'p95':         percentile(latencies, 95),
+        'p99':         percentile(latencies, 99),
+        'max':         latencies[-1] if latencies else 0.0,
+        'error_rate':  errors / options.requests if options.requests else 0.0,
+        'statuses':    {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'delivered':   sink.messages,
+        'drained':     drained,
+        'connections': sink.connections,
+    }
+
+def format_report(report):
+    """ Return +report+ as lines of text """
+    lines = [
+        '%(requests)d %(kind)s submissions, %(concurrency)d clients, %(backend)s backend' % report,
+        'throughput  %10.1f req/s in %.2fs' % (report['throughput'], report['seconds']),
+        'latency     p50 %.1fms  p95 %.1fms  p99 %.1fms  max %.1fms' % tuple(
+            report[key] * 1000 for key in ('p50', 'p95', 'p99', 'max')),
+        'errors      %10.2f%%  %s' % (report['error_rate'] * 100, ' '.join(
+            '%s:%d' % item for item in report['statuses'].items())),
+    ]
+    if report['backend'] != 'capture':
+        lines.append('delivered   %10d messages in %.2fs over %d SMTP connections' % (
+            report['delivered'], report['drained'], report['connections']))
+    return '\n'.join(lines)
+
+def get_parser():
+    """ Return the parser of the command line options """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=1000,
+                        help="Number of submissions posted (default: 1000)")
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help="Number of concurrent clients (default: 10)")
+    parser.add_argument('--kind', choices=KINDS, default='json',
+                        help="Posted submissions: JSON, URL encoded form or multipart form with a file")
+    parser.add_argument('--file-size', type=int, default=100 * 1024,
+                        help="Size in bytes of the posted file (default: 102400)")
+    parser.add_argument('--backend', choices=BACKENDS, default='smtp')
+    parser.add_argument('--smtp-latency', type=float, default=0.0,
+                        help="Seconds the SMTP sink takes to accept a message")
+    parser.add_argument('--pool-size', type=int, default=4,
+                        help="SMTP sessions kept open, and workers of the queued backend")
+    parser.add_argument('--queue-size', type=int, default=1000,
+                        help="Size of the queue of the queued backend")
+    parser.add_argument('--capture-path', help="Folder of the capture backend (default: temporary)")
+    parser.add_argument('--no-fsync', action='store_true',
+                        help="Don't wait for captured messages to be on disk")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    return parser
+
+def main(argv=None):
+    options = get_parser().parse_args(argv)
+    report = run(options)
+    print(json.dumps(report, indent=2) if options.json else format_report(report))
+    return 1 if report['error_rate'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
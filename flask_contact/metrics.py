@@ -0,0 +1,183 @@
+""" Counters and latency histograms of the contact blueprint """
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from .backends import ProxyEmailBackend
+from .mime import SpooledAttachment
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    """ Cumulative histogram in the Prometheus fashion """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts  = [0] * len(buckets)
+        self.sum     = 0
+        self.count   = 0
+
+    def observe(self, value):
+        """ Record +value+ """
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ Yield each bucket upper bound with the number of values under it """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+def format_labels(labels):
+    """ Return +labels+ (tuple of name, value) in the Prometheus text format """
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels
+    )
+
+class Metrics:
+    """ Thread-safe registry of counters and latency histograms
+
+    Pass it to blueprint() to time the stages of the view and count the
+    requests, and wrap the backend sending messages with instrument() to
+    time the MIME generation and the delivery.
+    """
+
+    HELP = {
+        'requests_total':         ('counter', "Requests answered by the view, by status"),
+        'rejections_total':       ('counter', "Submissions rejected before being sent, by reason"),
+        'sends_total':            ('counter', "Messages handed to the email backend"),
+        'send_failures_total':    ('counter', "Messages the email backend failed to send"),
+        'attachment_bytes_total': ('counter', "Size of the files joined to messages"),
+        'stage_seconds':          ('histogram', "Time spent in each stage of a submission"),
+    }
+
+    def __init__(self, prefix='contact', buckets=BUCKETS):
+        self.prefix     = prefix
+        self.buckets    = buckets
+        self.counters   = {}
+        self.histograms = {}
+        self.lock       = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """ Increment counter +name+ """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds):
+        """ Record that +stage+ took +seconds+ """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """ Context manager recording the time spent in +stage+ """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def instrument(self, backend):
+        """ Return +backend+ wrapped to time its MIME generation and delivery """
+        return InstrumentedEmailBackend(backend, self)
+
+    def render(self):
+        """ Return the metrics in the Prometheus text exposition format """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (stage, list(histogram.cumulative()), histogram.sum, histogram.count)
+                for stage, histogram in self.histograms.items()
+            )
+
+        lines, documented = [], set()
+        def document(name):
+            if name not in documented:
+                documented.add(name)
+                kind, text = self.HELP[name]
+                lines.append('# HELP %s_%s %s' % (self.prefix, name, text))
+                lines.append('# TYPE %s_%s %s' % (self.prefix, name, kind))
+
+        for (name, labels), value in counters:
+            document(name)
+            lines.append('%s_%s%s %s' % (self.prefix, name, format_labels(labels), value))
+        for stage, cumulative, total, count in histograms:
+            document('stage_seconds')
+            name = '%s_stage_seconds' % self.prefix
+            for bound, value in cumulative:
+                labels = format_labels((('stage', stage), ('le', bound)))
+                lines.append('%s_bucket%s %d' % (name, labels, value))
+            labels = format_labels((('stage', stage), ('le', '+Inf')))
+            lines.append('%s_bucket%s %d' % (name, labels, count))
+            labels = format_labels((('stage', stage),))
+            lines.append('%s_sum%s %r' % (name, labels, total))
+            lines.append('%s_count%s %d' % (name, labels, count))
+        return '\n'.join(lines) + '\n'
+
+class InstrumentedEmailBackend(ProxyEmailBackend):
+    """ Wrap an email backend to time its MIME generation and delivery
+
+    Wrap the backend actually sending messages, before wrapping it in a
+    queue, an outbox or a digest, so that deliveries made in the background
+    are measured as well.
+    """
+
+    def __init__(self, backend, metrics):
+        super().__init__(backend)
+        self.metrics = metrics
+
+    def get_mail(self, fields, file=None):
+        """ Generate a message, timing the 'build' stage """
+        with self.metrics.time('build'):
+            message = self.backend.get_mail(fields, file)
+        size = sum(part.size for part in message.walk()
+                   if isinstance(part, SpooledAttachment))
+        if size:
+            self.metrics.inc('attachment_bytes_total', size)
+        return message
+
+    def get_bytes(self, fields, recipients):
+        """ Write a message without file, timing the 'build' stage """
+        with self.metrics.time('build'):
+            return self.backend.get_bytes(fields, recipients)
+
+    @contextmanager
+    def sending(self):
+        """ Context of a delivery, timing the 'send' stage """
+        try:
+            with self.metrics.time('send'):
+                yield
+        except Exception:
+            self.metrics.inc('send_failures_total')
+            raise
+        self.metrics.inc('sends_total')
+
+    def send_raw(self, from_email, to_emails, data):
+        with self.sending():
+            self.backend.send_raw(from_email, to_emails, data)
+
+    def send(self, message):
+        with self.sending():
+            self.backend.send(message)
+
+    async def asend_raw(self, from_email, to_emails, data):
+        with self.sending():
+            await self.backend.asend_raw(from_email, to_emails, data)
+
+    async def asend(self, message):
+        with self.sending():
+            await self.backend.asend(message)
@@ -0,0 +1,179 @@
+""" Serialization of email messages with streamed attachments """
+import base64
+import io
+import re
+import secrets
+import tempfile
+from email.generator import BytesGenerator
+from email.mime.base import MIMEBase
+from email.policy import compat32
+from email.utils import getaddresses
+
+from .errors import FileTooLarge
+
+# Messages are written with CRLF line endings, as expected by SMTP
+POLICY = compat32.clone(linesep='\r\n')
+CRLF = b'\r\n'
+
+# Read size for attachments, 57 bytes being encoded as a 76 characters line
+CHUNK_SIZE = 57 * 1024
+
+# Line endings of a text, and a line longer than SMTP accepts (RFC 5321)
+NEWLINE   = re.compile(r'\r\n|\r|\n')
+LONG_LINE = re.compile(r'[^\r\n]{999}')
+
+TEXT_ASCII = (b'Content-Type: text/plain; charset="us-ascii"\r\n'
+              b'Content-Transfer-Encoding: 7bit\r\n\r\n')
+TEXT_UTF8  = (b'Content-Type: text/plain; charset="utf-8"\r\n'
+              b'Content-Transfer-Encoding: base64\r\n\r\n')
+
+class SpooledAttachment(MIMEBase):
+    """ Attachment whose content is spooled to a temporary file
+
+    The content is copied in chunks from the upload, and base64 encoded in
+    chunks when the message is written by write_message, so the memory used
+    does not depend on the size of the file.
+    """
+
+    def __init__(self, file, filename, max_size=None, max_memory=1024 * 1024):
+        """ Copy +file+ to a temporary file
+
+        * max_size:   Raise FileTooLarge when the file is larger than this
+        * max_memory: Size over which the content is spooled to disk
+        """
+        super().__init__('application', 'octet-stream')
+        self['Content-Transfer-Encoding'] = 'base64'
+        self.add_header('Content-Disposition', 'attachment', filename=filename)
+        self.filename = filename
+        self.spool = tempfile.SpooledTemporaryFile(max_memory)
+        self.size = 0
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.size += len(chunk)
+            if max_size is not None and self.size > max_size:
+                self.spool.close()
+                raise FileTooLarge(filename)
+            self.spool.write(chunk)
+
+    def is_multipart(self):
+        return False
+
+    def iter_encoded(self):
+        """ Yield the base64 encoded content, line by line in chunks """
+        self.spool.seek(0)
+        for chunk in iter(lambda: self.spool.read(CHUNK_SIZE), b''):
+            yield encode_base64(chunk)
+
+    # The generic email generator reads the payload directly, so a message
+    # holding a spooled attachment can still be converted with as_string()
+    # (at the cost of holding the encoded content in memory)
+    @property
+    def _payload(self):
+        if not hasattr(self, 'spool'):
+            return None
+        return b''.join(self.iter_encoded()).decode('ascii').replace('\r\n', '\n')
+
+    @_payload.setter
+    def _payload(self, value):
+        pass
+
+    def write_to(self, fp):
+        """ Write the part headers and its encoded content to +fp+ """
+        write_headers(self, fp)
+        for lines in self.iter_encoded():
+            fp.write(lines)
+
+def write_headers(message, fp):
+    """ Write the headers of +message+ followed by a blank line """
+    for name, value in message.raw_items():
+        fp.write(POLICY.fold_binary(name, value))
+    fp.write(CRLF)
+
+def fold_headers(headers):
+    """ Return +headers+ (name, value pairs) folded and encoded as bytes """
+    return b''.join(POLICY.fold_binary(name, value) for name, value in headers)
+
+def text_message(headers, text):
+    """ Return a text/plain message as bytes, without the email package
+
+    +headers+ are the folded headers of the message, see fold_headers. The
+    body is encoded as MIMEText would: as is when it is ASCII, otherwise as
+    base64 encoded UTF-8. Lines too long for SMTP are base64 encoded too.
+    Either way, lines of the text end with CRLF. """
+    # Most texts only use LF, which a replace converts much faster than a regex
+    text = NEWLINE.sub('\r\n', text) if '\r' in text else text.replace('\n', '\r\n')
+    if text.isascii() and not LONG_LINE.search(text):
+        return headers + TEXT_ASCII + text.encode('ascii')
+    return headers + TEXT_UTF8 + encode_base64(text.encode('utf-8'))
+
+def encode_base64(data):
+    """ Return +data+ base64 encoded, in lines of 76 characters ending with CRLF
+
+    Encoding at once and then slicing is faster than base64.encodebytes,
+    which encodes 57 bytes at a time. """
+    encoded = base64.b64encode(data)
+    lines = [encoded[i:i + 76] for i in range(0, len(encoded), 76)]
+    return CRLF.join(lines) + CRLF if lines else b''
+
+def has_spooled(message):
+    """ Return wether +message+ holds a spooled attachment """
+    return any(isinstance(part, SpooledAttachment) for part in message.walk())
+
+def write_message(message, fp):
+    """ Write +message+ to the binary file +fp+, streaming attachments """
+    if isinstance(message, SpooledAttachment):
+        message.write_to(fp)
+    elif not message.is_multipart() or not has_spooled(message):
+        BytesGenerator(fp, mangle_from_=False, policy=POLICY).flatten(message)
+    else:
+        if message.get_boundary() is None:
+            message.set_boundary('=' * 15 + secrets.token_hex(16) + '==')
+        boundary = message.get_boundary().encode('ascii')
+        write_headers(message, fp)
+        for part in message.get_payload():
+            fp.write(b'--' + boundary + CRLF)
+            write_message(part, fp)
+            fp.write(CRLF)
+        fp.write(b'--' + boundary + b'--' + CRLF)
+
+def spool_message(message, max_memory=1024 * 1024):
+    """ Return a temporary file holding the serialized +message+ """
+    fp = tempfile.SpooledTemporaryFile(max_memory)
+    write_message(message, fp)
+    fp.seek(0)
+    return fp
+
+def get_recipients(message):
+    """ Return the envelope recipients of +message+, from its To and Cc headers """
+    headers = message.get_all('To', []) + message.get_all('Cc', [])
+    return [address for _, address in getaddresses(headers) if address]
+
+def iter_smtp_data(data, buffer_size=64 * 1024):
+    """ Yield the content of an SMTP DATA command in buffers
+
+    +data+ is bytes or a binary file using CRLF line endings. Lines starting
+    with a dot are escaped (RFC 5321 section 4.5.2) and the terminating
+    sequence is included in the last buffer. """
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    buffer = bytearray()
+    line = CRLF
+    for line in data:
+        if line.startswith(b'.'):
+            buffer += b'.'
+        buffer += line
+        if len(buffer) >= buffer_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if not line.endswith(CRLF):
+        buffer += CRLF
+    buffer += b'.' + CRLF
+    yield bytes(buffer)
+
+def read_data(data):
+    """ Return serialized message +data+ (bytes or a binary file) as bytes """
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    return data.read()
@@ -0,0 +1,194 @@
+""" Durable on-disk outbox retrying failed deliveries """
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .backends import ProxyEmailBackend
+from .mime import get_recipients, read_data, spool_message
+from .utils import backoff
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    from_email   TEXT NOT NULL,
+    to_emails    TEXT NOT NULL,
+    data         BLOB NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    dead         INTEGER NOT NULL DEFAULT 0,
+    error        TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, next_attempt);
+"""
+
+class OutboxEmailBackend(ProxyEmailBackend):
+    """ Wrap an email backend so that messages are first stored on disk
+
+    mail() only writes the serialized message to a SQLite database. A drain
+    thread then sends stored messages through the wrapped backend, retrying
+    with an exponential backoff and moving a message to the dead letters
+    once it failed +max_attempts+ times. Several processes can share the
+    same outbox: a batch is leased by one drain loop at a time.
+    """
+
+    deferred = True
+
+    def __init__(self, backend, path, max_attempts=8, batch_size=20,
+                 retry_base=5, retry_cap=3600, lease=300, poll_interval=5,
+                 drain=True):
+        """ Configuration for the outbox:
+
+        * backend:       Email backend used to actually send messages
+        * path:          Path of the SQLite database holding the messages
+        * max_attempts:  Number of failed attempts before a message is dead
+        * batch_size:    Number of messages dequeued at once
+        * retry_base:    Delay in seconds before the first retry
+        * retry_cap:     Maximum delay in seconds between two retries
+        * lease:         Seconds a batch is reserved for the loop sending it
+        * poll_interval: Seconds between two checks for due messages
+        * drain:         Start a drain thread in this process on first send
+        """
+        super().__init__(backend)
+        self.path          = path
+        self.max_attempts  = max_attempts
+        self.batch_size    = batch_size
+        self.retry_base    = retry_base
+        self.retry_cap     = retry_cap
+        self.lease         = lease
+        self.poll_interval = poll_interval
+        self.drain_thread  = drain
+
+        self._db      = None
+        self._pid     = None
+        self._lock    = threading.Lock()
+        self._wakeup  = threading.Event()
+        self._stopped = threading.Event()
+        self._thread  = None
+
+    @property
+    def db(self):
+        """ Connection to the outbox database, opened once per process """
+        if self._pid != os.getpid():
+            # A connection must not be used across a fork
+            self._db = sqlite3.connect(self.path, isolation_level=None,
+                                       check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=FULL')
+            self._db.executescript(SCHEMA)
+            self._pid = os.getpid()
+            self._thread = None
+        return self._db
+
+    def send(self, message):
+        """ Store +message+ in the outbox """
+        with spool_message(message) as fp:
+            self.send_raw(message['From'], get_recipients(message), fp)
+
+    def send_raw(self, from_email, to_emails, data):
+        """ Store an already serialized message in the outbox """
+        with self._lock:
+            self.db.execute(
+                'INSERT INTO outbox (from_email, to_emails, data, next_attempt) '
+                'VALUES (?, ?, ?, ?)',
+                (from_email, json.dumps(list(to_emails)), read_data(data), time.time()),
+            )
+        if self.drain_thread:
+            self.start()
+        self._wakeup.set()
+
+    def claim(self):
+        """ Lease a batch of due messages and return them """
+        now = time.time()
+        with self._lock:
+            db = self.db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = db.execute(
+                    'SELECT id, from_email, to_emails, data, attempts FROM outbox '
+                    'WHERE dead = 0 AND next_attempt <= ? ORDER BY id LIMIT ?',
+                    (now, self.batch_size),
+                ).fetchall()
+                db.executemany(
+                    'UPDATE outbox SET next_attempt = ? WHERE id = ?',
+                    [(now + self.lease, row[0]) for row in rows],
+                )
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return rows
+
+    def drain(self):
+        """ Try to send one batch of due messages, return the batch size """
+        rows = self.claim()
+        for id_, from_email, to_emails, data, attempts in rows:
+            try:
+                self.backend.send_raw(from_email, json.loads(to_emails), data)
+            except Exception as exc:
+                self.fail(id_, attempts + 1, exc)
+            else:
+                with self._lock:
+                    self.db.execute('DELETE FROM outbox WHERE id = ?', (id_,))
+        return len(rows)
+
+    def fail(self, id_, attempts, exc):
+        """ Schedule a retry of a message, or bury it after max_attempts """
+        dead = attempts >= self.max_attempts
+        delay = backoff(attempts - 1, self.retry_base, self.retry_cap)
+        logger.warning("Delivery attempt %d of outbox message %d failed: %r",
+                       attempts, id_, exc)
+        with self._lock:
+            self.db.execute(
+                'UPDATE outbox SET attempts = ?, next_attempt = ?, dead = ?, error = ? '
+                'WHERE id = ?',
+                (attempts, time.time() + delay, int(dead), repr(exc), id_),
+            )
+
+    def dead_letters(self):
+        """ Return the messages that could not be delivered """
+        with self._lock:
+            return self.db.execute(
+                'SELECT id, from_email, to_emails, data, attempts, error '
+                'FROM outbox WHERE dead = 1 ORDER BY id'
+            ).fetchall()
+
+    def pending(self):
+        """ Return the number of messages waiting to be delivered """
+        with self._lock:
+            return self.db.execute(
+                'SELECT COUNT(*) FROM outbox WHERE dead = 0'
+            ).fetchone()[0]
+
+    def run(self):
+        """ Drain loop, sending batches until close() is called """
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if self.drain():
+                    continue
+            except Exception:
+                logger.exception("Could not drain outbox %s", self.path)
+            self._wakeup.wait(self.poll_interval)
+
+    def start(self):
+        """ Start the drain thread, once per process """
+        with self._lock:
+            self.db # Forgets about the parent's thread after a fork
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """ Stop the drain thread; stored messages stay in the outbox """
+        thread, self._thread = self._thread, None
+        self._stopped.set()
+        self._wakeup.set()
+        if thread is not None and self._pid == os.getpid():
+            thread.join()
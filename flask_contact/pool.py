@@ -0,0 +1,121 @@
+""" Pool of authenticated SMTP sessions shared between requests """
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from .errors import PoolTimeout
+
+class Session:
+    """ Logged-in SMTP connection along with its usage statistics """
+    __slots__ = ('smtp', 'last_used', 'messages')
+
+    def __init__(self, smtp):
+        self.smtp      = smtp
+        self.last_used = time.monotonic()
+        self.messages  = 0
+
+    def close(self):
+        """ Close the underlying connection, ignoring network errors """
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self.smtp.close()
+            except OSError:
+                pass
+
+class SMTPConnectionPool:
+    """ Thread-safe pool of reusable SMTP sessions
+
+    * connect:      Callable returning a new logged-in smtplib connection
+    * size:         Maximum number of sessions open at the same time
+    * idle_timeout: Seconds after which an idle session is evicted
+    * max_messages: Number of messages after which a session is recycled
+    * timeout:      Seconds to wait for a session when +size+ are in use,
+                    before raising PoolTimeout (None waits forever)
+    """
+
+    def __init__(self, connect, size=4, idle_timeout=60, max_messages=100,
+                 timeout=None):
+        self.connect      = connect
+        self.size         = size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.timeout      = timeout
+
+        self._idle  = []
+        self._lock  = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def is_exhausted(self, session):
+        """ Return wether the session has sent its share of messages """
+        return bool(self.max_messages) and session.messages >= self.max_messages
+
+    def is_expired(self, session):
+        """ Return wether the session should not be reused anymore """
+        if self.is_exhausted(session):
+            return True
+        if self.idle_timeout is not None:
+            return time.monotonic() - session.last_used > self.idle_timeout
+        return False
+
+    def is_alive(self, session):
+        """ Check with a NOOP that the server still answers on this session """
+        try:
+            return session.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self):
+        """ Return a live session, reusing an idle one when possible
+
+        Raise PoolTimeout when no session frees up within +timeout+. """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout()
+        try:
+            while True:
+                with self._lock:
+                    session = self._idle.pop() if self._idle else None
+                if session is None:
+                    return Session(self.connect())
+                if not self.is_expired(session) and self.is_alive(session):
+                    return session
+                session.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, session, discard=False):
+        """ Give back a session to the pool, closing it if it can't be reused """
+        try:
+            if discard or self.is_exhausted(session):
+                session.close()
+                return
+            session.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(session)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def session(self):
+        """ Context manager yielding a logged-in smtplib connection
+
+        The session is discarded if the block raises, since the state of the
+        SMTP conversation is then unknown. """
+        session = self.acquire()
+        try:
+            yield session.smtp
+        except BaseException:
+            self.release(session, discard=True)
+            raise
+        session.messages += 1
+        self.release(session)
+
+    def close(self):
+        """ Close every idle session """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
@@ -0,0 +1,151 @@
+""" Token bucket rate limiting of the contact submissions """
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class MemoryStore:
+    """ Token buckets kept in memory, for a single process
+
+    Only the +maxsize+ most recently used buckets are kept. An evicted
+    bucket is one that hasn't been used for a while, which is most likely
+    full again anyway.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.buckets = OrderedDict()
+        self.lock    = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """ Take a token from bucket +key+
+
+        Return 0 when a token was available, otherwise the number of seconds
+        until the next one. """
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        return wait
+
+class SQLiteStore:
+    """ Token buckets kept in a SQLite database shared by all the workers
+
+    Use a database on a local (or memory backed) file system, so that the
+    limits apply across every worker process of a host.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key     TEXT PRIMARY KEY,
+        tokens  REAL NOT NULL,
+        updated REAL NOT NULL
+    )
+    """
+
+    def __init__(self, path, prune_every=1000):
+        self.path        = path
+        self.prune_every = prune_every
+        self.lock        = threading.Lock()
+        self._db         = None
+        self._pid        = None
+        self._takes      = 0
+
+    @property
+    def db(self):
+        """ Connection to the database, opened once per process """
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                       check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=OFF')
+            self._db.execute(self.SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def take(self, key, rate, burst, now):
+        """ Take a token from bucket +key+, see MemoryStore.take """
+        with self.lock:
+            db = self.db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT tokens, updated FROM buckets WHERE key = ?',
+                                 (key,)).fetchone()
+                tokens, updated = row or (burst, now)
+                tokens = min(burst, tokens + (now - updated) * rate)
+                wait = 0 if tokens >= 1 else (1 - tokens) / rate
+                if not wait:
+                    tokens -= 1
+                db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)',
+                           (key, tokens, now))
+                self._takes += 1
+                if self._takes % self.prune_every == 0:
+                    # Buckets untouched for that long are full again
+                    db.execute('DELETE FROM buckets WHERE updated < ?',
+                               (now - burst / rate,))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return wait
+
+class RateLimiter:
+    """ Limit the number of submissions per client
+
+    Every client gets +burst+ submissions, then one more every +per+ / +rate+
+    seconds. Clients are told apart by the request attributes listed in
+    +by+ ('ip' and/or 'origin'), checked before the body of the request is
+    parsed. When +email_field+ is set, the posted email address is limited
+    as well, once the body is parsed.
+    """
+
+    def __init__(self, rate=5, per=60, burst=None, by=('ip',), email_field=None,
+                 store=None):
+        """ Configuration of the rate limiter:
+
+        * rate, per:   Number of submissions allowed per +per+ seconds
+        * burst:       Number of submissions allowed at once (default: rate)
+        * by:          Request attributes identifying a client
+        * email_field: Posted field also limited, e.g. 'email'
+        * store:       MemoryStore (default) or SQLiteStore
+        """
+        self.rate        = rate / per
+        self.burst       = burst or rate
+        self.by          = tuple(by)
+        self.email_field = email_field
+        self.store       = store if store is not None else MemoryStore()
+
+    def take(self, key):
+        """ Return 0 if +key+ may submit now, or the seconds to wait """
+        return self.store.take(key, self.rate, self.burst, time.time())
+
+    def request_key(self, request):
+        """ Return the key identifying the client of +request+ """
+        values = []
+        for attribute in self.by:
+            if attribute == 'ip':
+                values.append(request.remote_addr or '')
+            elif attribute == 'origin':
+                values.append(request.headers.get('Origin') or '')
+            else:
+                raise ValueError("Unknown rate limit attribute %r" % attribute)
+        return '|'.join(values)
+
+    def check_request(self, request):
+        """ Return 0 if the client of +request+ may submit, see take """
+        if not self.by:
+            return 0
+        return self.take(self.request_key(request))
+
+    def check_fields(self, fields):
+        """ Return 0 if the posted email address may submit, see take """
+        value = fields.get(self.email_field) if self.email_field else None
+        if not value or not isinstance(value, str):
+            return 0
+        return self.take('email|' + value.strip().lower())
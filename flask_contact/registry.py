@@ -0,0 +1,148 @@
+""" Registry of many contact forms served by a single blueprint """
+import json
+import logging
+import os
+import threading
+import time
+
+from .backends import EmailBackend
+from .utils import OriginPolicy
+
+logger = logging.getLogger(__name__)
+
+class FormEmailBackend(EmailBackend):
+    """ Formatting settings of a form, sending with a shared backend
+
+    Messages are generated with the form's own settings, and sent by
+    +transport+, so that the forms sharing a transport share its connections.
+    """
+
+    def __init__(self, transport, **settings):
+        super().__init__(**settings)
+        self.transport = transport
+
+    @property
+    def deferred(self):
+        """ Wether mail() returns before the message is actually delivered """
+        return self.transport.deferred
+
+    def is_direct(self):
+        """ Messages are written to bytes unless the transport queues them """
+        return not self.transport.deferred
+
+    def send_raw(self, from_email, to_emails, data):
+        self.transport.send_raw(from_email, to_emails, data)
+
+    def send(self, message):
+        self.transport.send(message)
+
+    async def asend_raw(self, from_email, to_emails, data):
+        await self.transport.asend_raw(from_email, to_emails, data)
+
+    async def asend(self, message):
+        await self.transport.asend(message)
+
+class Form:
+    """ Form of a FormRegistry, with its backend and its allowed origins """
+    __slots__ = ('id', 'backend', 'origins')
+
+    def __init__(self, id, backend, origins):
+        self.id      = id
+        self.backend = backend
+        self.origins = origins
+
+class FormRegistry:
+    """ Forms loaded from a JSON file, reloaded when it changes
+
+    The file maps each form id to its settings, which are the arguments of
+    EmailBackend along with 'allowed_origins' and the name of the 'backend'
+    sending its messages (default: 'default'). Settings under 'defaults'
+    apply to every form:
+
+        {
+            "defaults": {"from_email": "noreply@host.com", "allowed_fields": "*"},
+            "forms": {
+                "acme": {"to_email": "info@acme.com", "allowed_origins": "acme.com"},
+                "globex": {"to_email": "sales@globex.com", "backend": "ses"}
+            }
+        }
+
+    Forms are compiled into a dict, so looking one up doesn't depend on the
+    number of forms. The modification time of the file is checked at most
+    every +reload_interval+ seconds; a file that can't be loaded is logged
+    and the previous forms are kept until it changes again.
+    """
+
+    SETTINGS = ('from_email', 'to_email', 'subject', 'body', 'allowed_fields',
+                'allow_file', 'red_herring', 'max_file_size', 'required_fields',
+                'max_lengths', 'routes')
+
+    def __init__(self, path, backends, reload_interval=2):
+        """ Configuration of the registry:
+
+        * path:            JSON file of the forms
+        * backends:        Backend sending the messages, or dict of backends
+                           by name, that forms refer to with 'backend'
+        * reload_interval: Seconds between two checks of the file
+        """
+        if not isinstance(backends, dict):
+            backends = {'default': backends}
+        self.path            = path
+        self.backends        = backends
+        self.reload_interval = reload_interval
+
+        self.forms        = {}
+        self._mtime       = None
+        self._next_check  = 0
+        self._lock        = threading.Lock()
+        self.load()
+
+    def get_form(self, form_id, settings):
+        """ Return the Form compiled from +settings+ """
+        settings = dict(settings)
+        origins = OriginPolicy(settings.pop('allowed_origins', '*'))
+        transport = self.backends[settings.pop('backend', 'default')]
+        unknown = set(settings) - set(self.SETTINGS)
+        if unknown:
+            raise ValueError("Unknown settings %s for form %r"
+                             % (', '.join(sorted(unknown)), form_id))
+        return Form(form_id, FormEmailBackend(transport, **settings), origins)
+
+    def load(self):
+        """ Load the forms from the file """
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as f:
+            config = json.load(f)
+        defaults = config.get('defaults', {})
+        forms = {
+            form_id: self.get_form(form_id, dict(defaults, **settings))
+            for form_id, settings in config.get('forms', {}).items()
+        }
+        # Requests being served keep the forms they already looked up
+        self.forms = forms
+        self._mtime = mtime
+
+    def reload(self):
+        """ Load the forms again if the file changed since the last check """
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.reload_interval
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._mtime:
+                # A file that fails to load is only reported once
+                self._mtime = mtime
+                self.load()
+        except Exception:
+            logger.exception("Could not reload the forms from %s", self.path)
+        finally:
+            self._lock.release()
+
+    def get(self, form_id):
+        """ Return the Form +form_id+, None if there is no such form """
+        self.reload()
+        return self.forms.get(form_id)
+
+    def __len__(self):
+        return len(self.forms)
@@ -1,5 +1,14 @@
 """ Represent multiple data utilities used by flask contact blueprint """
+import fnmatch
+import functools
 import inspect
+import random
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from .errors import InvalidFields
 
 class AllowedList:
     """ List that represent allowed items
@@ -7,10 +16,32 @@ class AllowedList:
     Use '*' String to allow anything
     Use '' or None to allow nothing
     Use a space separated list or an array to allow only those items
+    Items can also be glob patterns ('utm_*') or regular expressions written
+    between slashes ('/q[0-9]+/'), matching the whole item.
+
+    Items are compiled once: names are kept in a frozenset and patterns are
+    merged into a single regular expression, whose results are cached.
     """
 
+    CACHE_SIZE = 1024
+
     def __init__(self, allowed_items):
         self.allowed_items = allowed_items or []
+        self.allow_all = allowed_items == '*'
+
+        literals, patterns = set(), []
+        for item in self.items():
+            if isinstance(item, str) and len(item) > 1 and item[0] == item[-1] == '/':
+                patterns.append(item[1:-1])
+            elif isinstance(item, str) and any(char in item for char in '*?['):
+                patterns.append(fnmatch.translate(item))
+            else:
+                literals.add(item)
+        self.literals = frozenset(literals)
+        self.pattern = None
+        if patterns:
+            self.pattern = re.compile('|'.join('(?:%s)' % p for p in patterns))
+        self._decisions = {}
 
     def items(self):
         """ return allowed items as a list """
@@ -20,9 +51,23 @@ class AllowedList:
 
     def __contains__(self, key):
         """ Return wether the specified key is allowed """
-        if self.allowed_items == '*':
+        if self.allow_all:
             return True
-        return key in self.items()
+        try:
+            if key in self.literals:
+                return True
+        except TypeError: # Unhashable key
+            return False
+        if self.pattern is None or not isinstance(key, str):
+            return False
+
+        allowed = self._decisions.get(key)
+        if allowed is None:
+            allowed = self.pattern.fullmatch(key) is not None
+            if len(self._decisions) >= self.CACHE_SIZE:
+                self._decisions.clear()
+            self._decisions[key] = allowed
+        return allowed
 
     def filter(self, obj):
         """ Filter object keys by wether it is allowed """
@@ -35,15 +80,268 @@ class AllowedList:
                 if key in self:
                     yield key
 
+class FieldPolicy(AllowedList):
+    """ Allowed fields along with the rules posted fields must follow
 
-def filter_args(dict_to_filter, fn):
-    """ Function that filter +dict_to_filter+ to work with fn """
-    # Taken from https://stackoverflow.com/questions/26515595/how-does-one-ignore-unexpected-keyword-arguments-passed-to-a-function
+    * required:    Fields that must be posted with a value, as a space
+                   separated list or an array
+    * max_lengths: Maximum length of every allowed field (int) or of some
+                   of them (dict of field name to length)
+
+    Rules are checked while filtering a dict, in the same pass, raising
+    InvalidFields once every field has been seen.
+    """
+
+    def __init__(self, allowed_items, required=None, max_lengths=None):
+        super().__init__(allowed_items)
+        self.required    = frozenset(AllowedList(required).items())
+        self.max_lengths = max_lengths
+
+    def max_length(self, key):
+        """ Return the maximum length of field +key+, None if unbounded """
+        if isinstance(self.max_lengths, dict):
+            return self.max_lengths.get(key)
+        return self.max_lengths
+
+    def filter(self, obj):
+        """ Filter object keys by wether it is allowed, checking the rules """
+        if not isinstance(obj, dict) or not (self.required or self.max_lengths):
+            yield from super().filter(obj)
+            return
+
+        errors = {}
+        missing = set(self.required)
+        for key, item in obj.items():
+            if item:
+                missing.discard(key)
+            if key not in self:
+                continue
+            max_length = self.max_length(key)
+            if max_length is not None and isinstance(item, str) and len(item) > max_length:
+                errors[key] = 'too long'
+            else:
+                yield key, item
+        for key in missing:
+            errors[key] = 'required'
+        if errors:
+            raise InvalidFields(errors)
+
+class OriginPolicy:
+    """ Origins allowed to post to a blueprint, compiled once
+
+    Use '*' String to allow any origin
+    Use a space separated list or an array of rules to allow only those:
+
+    * 'example.com':          the host on its default port, over http or https
+    * '*.example.com':        any subdomain of example.com (but not itself)
+    * 'example.com:8080':     the host on a given port, ':*' for any port
+    * 'https://example.com':  the host over the given scheme only
+    * '/regex/':              hosts (with their port, if any) matching regex
+
+    URLs are parsed with urlsplit, so userinfo, paths and the case of the
+    host don't matter. Decisions are cached per scheme, host and port in
+    an LRU, so URLs differing by their path share their decision.
+    """
+
+    CACHE_SIZE = 1024
+    DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+    def __init__(self, allowed_origins, cache_size=CACHE_SIZE):
+        self.allow_all  = allowed_origins == '*'
+        self.cache_size = cache_size
+        self.hosts      = {}
+        self.suffixes   = {}
+
+        patterns = []
+        for rule in AllowedList(None if self.allow_all else allowed_origins).items():
+            if not rule:
+                continue
+            if len(rule) > 1 and rule[0] == rule[-1] == '/':
+                patterns.append(rule[1:-1])
+                continue
+            scheme, host, port = self.parse_rule(rule)
+            if host.startswith('*.'):
+                self.suffixes.setdefault(host[2:], []).append((scheme, port))
+            else:
+                self.hosts.setdefault(host, []).append((scheme, port))
+        self.pattern = None
+        if patterns:
+            self.pattern = re.compile('|'.join('(?:%s)' % p for p in patterns))
+
+        self._decisions = OrderedDict()
+        self._lock      = threading.Lock()
+
+    @staticmethod
+    def parse_rule(rule):
+        """ Return the scheme (or None), the host and the port of +rule+
+
+        The port is None for the default port of the scheme, or '*'. """
+        scheme, _, rest = rule.rpartition('://')
+        host, _, port = rest.partition('/')[0].rpartition(':')
+        if not host:
+            host, port = port, None
+        elif port != '*':
+            port = int(port)
+        return scheme.lower() or None, host.lower(), port
+
+    def split(self, url):
+        """ Return the scheme, the host and the port of +url+, None if invalid """
+        if '//' not in url:
+            url = '//' + url
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError:
+            return None
+        if not parts.hostname:
+            return None
+        scheme = parts.scheme.lower() or None
+        if port is not None and port == self.DEFAULT_PORTS.get(scheme):
+            port = None
+        return scheme, parts.hostname, port
+
+    def matches(self, specs, scheme, port):
+        """ Return wether one of the (scheme, port) rules +specs+ accepts
+        +scheme+ and +port+. Rules without scheme accept http and https. """
+        for rule_scheme, rule_port in specs:
+            schemes = (rule_scheme,) if rule_scheme else self.DEFAULT_PORTS
+            if scheme is not None and scheme not in schemes:
+                continue
+            if rule_port == '*' or rule_port == port:
+                return True
+        return False
 
+    def decide(self, scheme, host, port):
+        """ Return wether +scheme+, +host+ and +port+ (see split) are
+        allowed, without the cache """
+        if self.matches(self.hosts.get(host, ()), scheme, port):
+            return True
+        labels = host.split('.')
+        for index in range(1, len(labels)):
+            specs = self.suffixes.get('.'.join(labels[index:]))
+            if specs and self.matches(specs, scheme, port):
+                return True
+        if self.pattern is not None:
+            netloc = host if port is None else '%s:%s' % (host, port)
+            return self.pattern.fullmatch(netloc) is not None
+        return False
+
+    def __contains__(self, url):
+        """ Return wether +url+ (an origin, or any URL) is allowed """
+        if self.allow_all:
+            return True
+        if not isinstance(url, str):
+            return False
+        parts = self.split(url)
+        if parts is None:
+            return False
+        with self._lock:
+            allowed = self._decisions.get(parts)
+            if allowed is not None:
+                self._decisions.move_to_end(parts)
+                return allowed
+        allowed = self.decide(*parts)
+        with self._lock:
+            self._decisions[parts] = allowed
+            if len(self._decisions) > self.cache_size:
+                self._decisions.popitem(last=False)
+        return allowed
+
+    def cors_origins(self):
+        """ Return the rules as regular expressions of Origin headers
+
+        Used to configure flask-cors, which matches the Origin header of
+        preflights itself. """
+        if self.allow_all:
+            return '*'
+        def port_re(scheme, port):
+            if port == '*':
+                return r'(?::\d+)?'
+            if port is None:
+                default = self.DEFAULT_PORTS.get(scheme)
+                return r'(?::%d)?' % default if default else ''
+            return ':%d' % port
+
+        origins = []
+        for host, specs, prefix in (
+                [(host, specs, '') for host, specs in self.hosts.items()]
+                + [(suffix, specs, r'(?:[^./:]+\.)+') for suffix, specs in self.suffixes.items()]):
+            for scheme, port in specs:
+                schemes = [scheme] if scheme else ['http', 'https']
+                for scheme in schemes:
+                    origins.append(re.compile('%s://%s%s%s$' % (
+                        re.escape(scheme), prefix, re.escape(host), port_re(scheme, port)),
+                        re.IGNORECASE))
+        if self.pattern is not None:
+            origins.append(re.compile(r'https?://(?:%s)$' % self.pattern.pattern, re.IGNORECASE))
+        return origins
+
+class RoutingTable:
+    """ Recipients of a message chosen from the values of its fields
+
+    +rules+ maps a field name to a dict mapping values of that field to a
+    recipient, or to a list of recipients, i.e:
+
+        {'topic': {'sales': 'sales@a.com', 'press': ['pr@a.com', 'ceo@a.com']}}
+
+    Values are matched without case or surrounding whitespace. The rules
+    are compiled to a single dict, so a lookup costs one hash per routed
+    field whatever the number of rules.
+    """
+
+    def __init__(self, rules):
+        self.fields = tuple(rules)
+        self.table  = {
+            (field, self.normalize(value)): self.addresses(recipients)
+            for field, values in rules.items()
+            for value, recipients in values.items()
+        }
+
+    @staticmethod
+    def normalize(value):
+        """ Return +value+ as it is matched against the rules """
+        return str(value).strip().casefold()
+
+    @staticmethod
+    def addresses(recipients):
+        """ Return +recipients+ (an address or a list of them) as a tuple """
+        if isinstance(recipients, str):
+            return (recipients,)
+        return tuple(recipients)
+
+    def get(self, fields):
+        """ Return the recipients the rules route +fields+ to, without duplicates """
+        recipients = []
+        for field in self.fields:
+            value = fields.get(field)
+            if value is None:
+                continue
+            for recipient in self.table.get((field, self.normalize(value)), ()):
+                if recipient not in recipients:
+                    recipients.append(recipient)
+        return recipients
+
+@functools.lru_cache(maxsize=None)
+def get_parameters(fn):
+    """ Return the name of the keyword parameters of +fn+ along with wether
+    they have a default value. The signature is only inspected once per fn. """
     sig = inspect.signature(fn)
-    filter_keys = [param.name for param in sig.parameters.values() if param.kind == param.POSITIONAL_OR_KEYWORD]
-    filtered_dict = {filter_key:dict_to_filter[filter_key] for filter_key in filter_keys}
-    return filtered_dict
+    return tuple(
+        (param.name, param.default is not param.empty)
+        for param in sig.parameters.values()
+        if param.kind in (param.POSITIONAL_OR_KEYWORD, param.KEYWORD_ONLY)
+    )
+
+def filter_args(dict_to_filter, fn):
+    """ Function that filter +dict_to_filter+ to work with fn
+
+    Missing fields are left to their default value, or set to '' when the
+    parameter has no default. """
+    return {
+        name: dict_to_filter.get(name, '')
+        for name, has_default in get_parameters(fn)
+        if not has_default or name in dict_to_filter
+    }
 
 def get_domain(url):
     """ Return the domain part of an url """
@@ -52,8 +350,41 @@ def get_domain(url):
         return None
     return url.split('//')[-1].split('/')[0]
 
+def is_local_path(uri):
+    """ Return wether +uri+ is a path on the same site, without scheme and host
+
+    '//host' and '/\\host' are excluded, as browsers follow them to another
+    host, along with control characters and spaces they would strip. """
+    if not isinstance(uri, str) or not uri.startswith('/') or uri[1:2] in ('/', '\\'):
+        return False
+    return not any(char <= ' ' or char == '\x7f' for char in uri)
+
+def file_size(file):
+    """ Return the size of an uploaded file without reading it
+
+    Return None when the size can't be known in advance. """
+    length = getattr(file, 'content_length', None)
+    if length:
+        return length
+    stream = getattr(file, 'stream', file)
+    try:
+        position = stream.tell()
+        size = stream.seek(0, 2)
+        stream.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return size - position
+
 def filename_ext(filename):
     """ Function that returns filename extension """
     # Taken from http://flask.pocoo.org/docs/1.0/patterns/fileuploads/
 
     return '.' in filename and filename.rsplit('.', 1)[1].lower()
+
+def backoff(attempt, base=1, cap=300):
+    """ Return the delay before retry number +attempt+ (starting at 0)
+
+    The delay grows exponentially up to +cap+ seconds, with half of it
+    randomized so that retries from many clients don't happen in lockstep. """
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -56,7 +56,10 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
         'Programming Language :: Python :: Implementation :: PyPy'
     ],
@@ -76,7 +79,8 @@ setup(
     # your project is installed. For an analysis of "install_requires" vs pip's
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['Flask', 'flask-cors'],
+    install_requires=['Flask>=2.0', 'Werkzeug>=2.0', 'flask-cors>=3.0.10'],
+    python_requires='>=3.8',
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
@@ -84,7 +88,8 @@ setup(
     # $ pip install -e .[dev,test]
     extras_require={
         'test': ['nose'],
-        's3': ['boto3']
+        's3': ['boto3'],
+        'async': ['Flask[async]>=2.0'],
     },
 
     # If there are data files included in your packages that need to be
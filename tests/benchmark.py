@@ -0,0 +1,111 @@
+""" Microbenchmarks of the request to MIME message hot path
+
+Run from the repository root:
+
+    bin/bench --save var/benchmark.json     # record a baseline
+    bin/bench --compare var/benchmark.json  # fail on a regression
+
+Each case reports its throughput (operations per second, best of --repeat
+runs). With --compare, the script exits with status 1 when a case is more
+than --threshold slower than in the baseline.
+"""
+import argparse
+import json
+import sys
+import timeit
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.backends import EmailBackend
+from flask_contact.mime import spool_message
+from flask_contact.utils import AllowedList, filter_args
+
+from helpers import NullBackend, Upload
+
+def get_fields(count, size):
+    """ Return +count+ fields whose values are +size+ characters long """
+    return {'field%d' % i: 'x' * size for i in range(count)}
+
+def cases():
+    """ Yield the name and the function of each benchmark
+
+    Loop variables are bound as default arguments, so that a case does not
+    depend on the cases yielded after it. """
+    for count in (5, 50, 500):
+        fields = get_fields(count, 20)
+        allowed = AllowedList(' '.join(list(fields)[::2]) + ' utm_*')
+        yield 'allowed_filter[%d]' % count, lambda allowed=allowed, fields=fields: list(allowed.filter(fields))
+
+    subject = lambda field0, field1='', missing='': field0 + field1
+    fields = get_fields(10, 20)
+    yield 'filter_args', lambda: filter_args(fields, subject)
+
+    for count, size in ((5, 20), (50, 20), (5, 10000)):
+        backend = EmailBackend('from@example.com', 'to@example.com')
+        fields = get_fields(count, size)
+        yield 'get_message[%d,%d]' % (count, size), lambda backend=backend, fields=fields: backend.get_message(fields)
+        yield 'get_bytes[%d,%d]' % (count, size), lambda backend=backend, fields=fields: backend.get_bytes(fields, ['to@example.com'])
+
+    backend = EmailBackend('from@example.com', 'to@example.com', allow_file=True)
+    fields = get_fields(5, 100)
+    for size in (0, 64 * 1024, 1024 * 1024):
+        data = b'x' * size
+        upload = lambda data=data: Upload(data, 'file.pdf') if data else None
+        yield 'get_mail[%d]' % size, lambda upload=upload: backend.get_mail(fields, upload())
+        message = backend.get_mail(fields, upload())
+        yield 'as_string[%d]' % size, message.as_string
+        yield 'spool_message[%d]' % size, lambda message=message: spool_message(message).close()
+
+    app = Flask(__name__)
+    app.register_blueprint(blueprint('contact', NullBackend('from@example.com', 'to@example.com')))
+    client = app.test_client()
+    fields = get_fields(5, 100)
+    yield 'view[json]', lambda: client.post('/', json=fields)
+    yield 'view[form]', lambda: client.post('/', data=dict(fields, redirect_uri='http://a.com/'))
+
+def measure(fn, repeat):
+    """ Return the best throughput of +fn+ over +repeat+ runs """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return max(number / duration for duration in timer.repeat(repeat, number))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--save', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare the results to this JSON baseline")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Accepted slowdown before failing (default: 0.2)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', default='', help="Only run cases containing this")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    for name, fn in cases():
+        if args.filter not in name:
+            continue
+        results[name] = ops = measure(fn, args.repeat)
+        line = '%-24s %14.1f ops/s' % (name, ops)
+        if name in baseline:
+            change = ops / baseline[name] - 1
+            line += '  %+6.1f%%' % (change * 100)
+            if change < -args.threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if regressions:
+        print("%d case(s) slower than the baseline: %s" % (len(regressions), ', '.join(regressions)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+""" Fake backends and uploads shared by the test cases """
+import email
+import io
+
+from flask_contact.backends import EmailBackend
+from flask_contact.mime import read_data
+
+class Upload(io.BytesIO):
+    """ Uploaded file with a filename """
+    def __init__(self, data, filename='cv.pdf'):
+        super().__init__(data)
+        self.filename = filename
+
+class NullBackend(EmailBackend):
+    """ Backend generating messages without sending them """
+    def send_raw(self, from_email, to_emails, data):
+        pass
+
+class RecordingBackend(EmailBackend):
+    """ Backend keeping what it sends, failing on demand
+
+    Serialized messages are kept in +sent+ as (sender, recipients, bytes),
+    and are parsed back by +messages+. Only send_raw is overridden, so
+    messages are generated like those of a real backend. A send waits for
+    the +gate+ event, if any, then raises +error+ when it is set, or a
+    ConnectionError while +failures+ remain.
+    """
+
+    def __init__(self, *args, gate=None, error=None, failures=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gate     = gate
+        self.error    = error
+        self.failures = failures
+        self.sent     = []
+
+    @property
+    def messages(self):
+        """ Sent messages, parsed back """
+        return [email.message_from_bytes(data) for _, _, data in self.sent]
+
+    def send_raw(self, from_email, to_emails, data):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('relay down')
+        self.sent.append((from_email, list(to_emails), read_data(data)))
@@ -0,0 +1,152 @@
+import asyncio
+import email
+import threading
+import unittest
+import warnings
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.aiosmtp import AsyncSMTPConnectionPool
+from flask_contact.backends import SMTPEmailBackend
+from flask_contact.delivery import QueuedEmailBackend
+from flask_contact.errors import PoolTimeout
+from flask_contact.loadtest import SMTPSink as ThreadedSMTPSink
+
+from helpers import RecordingBackend
+
+class SMTPSink:
+    """ Local asyncio SMTP server keeping the messages it receives """
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        writer.write(b'220 sink ready\r\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line[:4].upper()
+            if command == b'EHLO':
+                writer.write(b'250-sink\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif command == b'AUTH':
+                writer.write(b'235 Authenticated\r\n')
+            elif command == b'DATA':
+                writer.write(b'354 Go ahead\r\n')
+                lines = []
+                while True:
+                    line = await reader.readline()
+                    if line == b'.\r\n':
+                        break
+                    lines.append(line[1:] if line.startswith(b'..') else line)
+                self.messages.append(b''.join(lines))
+                writer.write(b'250 Queued\r\n')
+            elif command == b'QUIT':
+                writer.write(b'221 Bye\r\n')
+                await writer.drain()
+                break
+            else:
+                writer.write(b'250 OK\r\n')
+            await writer.drain()
+        writer.close()
+
+class AsyncSMTPBackendTest(unittest.IsolatedAsyncioTestCase):
+    """ Test case for the asyncio SMTP backend against a local sink """
+
+    async def asyncSetUp(self):
+        self.sink = SMTPSink()
+        port = await self.sink.start()
+        self.backend = SMTPEmailBackend(
+            'from@example.com', 'to@example.com',
+            smtp_server='127.0.0.1', smtp_port=port, smtp_ssl=False,
+            smtp_user='user', smtp_password='pass',
+        )
+
+    async def asyncTearDown(self):
+        await self.backend.aclose()
+        await self.sink.stop()
+
+    async def test_amail(self):
+        "Ensure that amail delivers the message"
+        await self.backend.amail({'message': 'Hello\n.'})
+        message = email.message_from_bytes(self.sink.messages[0])
+        self.assertEqual(message['To'], 'to@example.com')
+        self.assertEqual(message.get_payload(), 'message: Hello\r\n.\r\n')
+
+    async def test_reuse(self):
+        "Ensure that concurrent sends reuse a bounded number of connections"
+        await asyncio.gather(*(self.backend.amail({'n': str(n)}) for n in range(20)))
+        await self.backend.amail({'n': 'last'})
+        self.assertEqual(len(self.sink.messages), 21)
+        self.assertLessEqual(self.sink.connections, self.backend.pool.size)
+
+    async def test_pool_timeout(self):
+        "Ensure that waiting for an asyncio session gives up after the timeout"
+        pool = AsyncSMTPConnectionPool(self.backend.aconnect, size=1, timeout=0.01)
+        session = await pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            await pool.acquire()
+        await pool.release(session)
+        await pool.close()
+
+class AsyncBackendTest(unittest.IsolatedAsyncioTestCase):
+    """ Test case for the executor based amail """
+
+    async def test_executor(self):
+        "Ensure that blocking backends are run in the executor"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        await backend.amail({'message': 'Hello'})
+        self.assertIn(b'message: Hello', backend.sent[0][2])
+
+    async def test_deferred(self):
+        "Ensure that deferred proxies queue the message"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        queued = QueuedEmailBackend(backend)
+        await queued.amail({'message': 'Hello'})
+        queued.close()
+        self.assertEqual(len(backend.sent), 1)
+
+class AsyncViewTest(unittest.TestCase):
+    """ Test case for the asynchronous view """
+
+    def test_view(self):
+        "Ensure that the asynchronous view sends the email"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', backend, asynchronous=True))
+        response = app.test_client().post('/', json={'message': 'Hello'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(backend.sent), 1)
+
+    def test_view_reuse(self):
+        "Ensure that requests of the asynchronous view share SMTP connections"
+        sink = ThreadedSMTPSink()
+        threading.Thread(target=sink.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(sink.server_close)
+        self.addCleanup(sink.shutdown)
+        backend = SMTPEmailBackend(
+            'from@example.com', 'to@example.com',
+            smtp_server='127.0.0.1', smtp_port=sink.port, smtp_ssl=False,
+            smtp_user='user', smtp_password='pass',
+        )
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', backend, asynchronous=True))
+        client = app.test_client()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', ResourceWarning)
+            for n in range(5):
+                self.assertEqual(client.post('/', json={'n': str(n)}).status_code, 200)
+        self.assertEqual(sink.messages, 5)
+        self.assertEqual(sink.connections, 1)
+        asyncio.run(backend.aclose())
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.attachments import AttachmentStore
+from flask_contact.errors import FileTooLarge
+from flask_contact.mime import spool_message
+
+from helpers import RecordingBackend, Upload
+
+class AttachmentStoreTest(unittest.TestCase):
+    """ Test case for the content-addressed attachment store """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = AttachmentStore(self.directory.name, 'secret',
+                                     'http://localhost/files', link_threshold=1000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put(self):
+        "Ensure that identical files are stored once, by their SHA-256"
+        digest, size = self.store.put(Upload(b'x' * 5000))
+        self.assertEqual(digest, hashlib.sha256(b'x' * 5000).hexdigest())
+        self.assertEqual(size, 5000)
+        self.assertEqual(self.store.put(Upload(b'x' * 5000)), (digest, size))
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, digest[:2])), [digest])
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'tmp')), [])
+
+    def test_put_purged(self):
+        "Ensure that a file purged while being stored again is put back"
+        digest, _ = self.store.put(Upload(b'data'))
+        path = self.store.get_path(digest)
+        def purge(path):
+            os.unlink(path)
+            raise FileNotFoundError(path)
+        with patch('os.utime', side_effect=purge):
+            self.assertEqual(self.store.put(Upload(b'data')), (digest, 4))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'tmp')), [])
+
+    def test_too_large(self):
+        "Ensure that a file larger than max_size is not stored"
+        with self.assertRaises(FileTooLarge):
+            self.store.put(Upload(b'x' * 5000), max_size=4000)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['tmp'])
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'tmp')), [])
+
+    def test_verify(self):
+        "Ensure that only signed and unexpired links are valid"
+        expires = int(time.time()) + 60
+        signature = self.store.sign('abc', 'cv.pdf', expires)
+        self.assertTrue(self.store.verify('abc', 'cv.pdf', str(expires), signature))
+        self.assertFalse(self.store.verify('abd', 'cv.pdf', str(expires), signature))
+        self.assertFalse(self.store.verify('abc', 'cv.pdf', str(expires + 1), signature))
+        self.assertFalse(self.store.verify('abc', 'cv.pdf', None, signature))
+        expired = int(time.time()) - 1
+        self.assertFalse(self.store.verify('abc', 'cv.pdf', str(expired),
+                                           self.store.sign('abc', 'cv.pdf', expired)))
+
+    def test_purge(self):
+        "Ensure that files older than the links are deleted"
+        digest, _ = self.store.put(Upload(b'old'))
+        self.store.put(Upload(b'new'))
+        past = time.time() - self.store.expires - 1
+        os.utime(self.store.get_path(digest), (past, past))
+        self.assertEqual(self.store.purge(), 1)
+        self.assertFalse(os.path.exists(self.store.get_path(digest)))
+
+class AttachmentLinkTest(unittest.TestCase):
+    """ Test case for the messages and the route of the attachment store """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = AttachmentStore(self.directory.name, 'secret',
+                                     'http://localhost/files', link_threshold=1000)
+        self.backend = RecordingBackend('from@example.com', 'to@example.com', allow_file=True,
+                                   attachment_store=self.store)
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', self.backend))
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_link(self, data):
+        self.backend.mail({'message': 'Hello'}, Upload(data))
+        body = self.backend.messages[-1].get_payload()[1].get_payload()
+        link = next(word for word in body.split() if word.startswith('http'))
+        return link[len('http://localhost'):]
+
+    def test_inline(self):
+        "Ensure that small files are still joined to the message"
+        self.backend.mail({'message': 'Hello'}, Upload(b'x' * 100))
+        part = self.backend.messages[-1].get_payload()[1]
+        self.assertEqual(part.get_filename(), 'cv.pdf')
+        self.assertEqual(part.get_payload(decode=True), b'x' * 100)
+
+    def test_link(self):
+        "Ensure that large files are sent as a link"
+        data = os.urandom(100 * 1024)
+        link = self.get_link(data)
+        with spool_message(self.backend.messages[-1]) as fp:
+            self.assertLess(len(fp.read()), 2000)
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, data)
+        self.assertIn('cv.pdf', response.headers['Content-Disposition'])
+
+    def test_invalid_link(self):
+        "Ensure that a tampered link is refused"
+        link = self.get_link(b'x' * 5000)
+        path, query = link.split('?')
+        self.assertEqual(self.client.get(path.replace('cv.pdf', 'cv.exe') + '?' + query).status_code, 403)
+        self.assertEqual(self.client.get(path).status_code, 403)
+
+    def test_purged(self):
+        "Ensure that a link to a purged file answers 404"
+        link = self.get_link(b'x' * 5000)
+        os.unlink(self.store.get_path(urlsplit(link).path.split('/')[2]))
+        self.assertEqual(self.client.get(link).status_code, 404)
@@ -39,6 +39,31 @@ class EmailFormattingTest(unittest.TestCase):
             'Hello ' + 'David'
         )
 
+    def test_subject_missing_arg(self):
+        "Test that a lambda subject works with a missing field"
+        backend = EmailBackend('', '', subject=lambda name, topic='general': name + topic)
+        self.assertEqual(backend.get_subject({}), 'general')
+
+    def test_subject_template(self):
+        "Test that a subject template is rendered"
+        backend = EmailBackend('', '', subject="Message from {name|someone}")
+        self.assertEqual(backend.get_subject({'name': '<David>'}), 'Message from &lt;David&gt;')
+        self.assertEqual(backend.get_subject({}), 'Message from someone')
+
+    def test_body_template(self):
+        "Test that a body template is rendered with allowed fields only"
+        backend = EmailBackend('', '', allowed_fields='name message',
+                               body="{name} wrote:\n{message}\n\n{fields}")
+        self.assertEqual(
+            backend.get_message({'name': 'David', 'message': 'Hi', 'secret': 'x'}),
+            'David wrote:\nHi\n\nname: David\nmessage: Hi'
+        )
+
+    def test_body_lambda(self):
+        "Test that a body lambda is called with the fields it names"
+        backend = EmailBackend('', '', body=lambda message: message.upper())
+        self.assertEqual(backend.get_message({'message': 'hi'}), 'HI')
+
     def test_empty_message(self):
         "Test that get message work with an empty message"
         backend = EmailBackend('', '')
@@ -100,3 +125,13 @@ class EmailFormattingTest(unittest.TestCase):
         backend = EmailBackend('', '')
         self.assertEqual(backend.get_reply_email({}), None)
         self.assertEqual(backend.get_reply_email({'email': 'rely'}), 'rely')
+
+    def test_recipients(self):
+        "Make sure that messages are routed by field value"
+        backend = EmailBackend('', 'to@a.com', routes={
+            'topic': {'sales': ['sales@a.com', 'ceo@a.com']}})
+        self.assertEqual(list(backend.get_recipients({})), ['to@a.com'])
+        self.assertEqual(backend.get_recipients({'topic': 'sales'}),
+                         ['sales@a.com', 'ceo@a.com'])
+        message = backend.get_mail({'topic': 'sales'})
+        self.assertEqual(message['To'], 'sales@a.com, ceo@a.com')
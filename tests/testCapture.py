@@ -0,0 +1,116 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from flask_contact.capture import CaptureEmailBackend, SegmentLog, export
+
+from helpers import RecordingBackend
+
+class CaptureTest(unittest.TestCase):
+    """ Test case for the capture backend and its exporter """
+
+    layout = 'log'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.relay = RecordingBackend('from@example.com', 'to@example.com')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_capture(self, **kwargs):
+        return CaptureEmailBackend('from@example.com', 'to@example.com',
+                                   path=self.path, layout=self.layout, **kwargs)
+
+    def test_export(self):
+        "Ensure that captured messages are sent and removed by the exporter"
+        capture = self.get_capture()
+        capture.mail({'message': 'Hello'})
+        capture.mail({'message': 'World'})
+        self.assertEqual(export(self.path, self.relay, self.layout), 2)
+        self.assertEqual(export(self.path, self.relay, self.layout), 0)
+        from_email, to_emails, data = self.relay.sent[0]
+        self.assertEqual(from_email, 'from@example.com')
+        self.assertEqual(to_emails, ['to@example.com'])
+        self.assertTrue(data.startswith(b'MIME-Version: 1.0\r\n'))
+        self.assertIn(b'message: Hello', data)
+        self.assertIn(b'message: World', self.relay.sent[1][2])
+
+    def test_resume(self):
+        "Ensure that a failed export resumes from the failed message"
+        capture = self.get_capture()
+        for index in range(3):
+            capture.mail({'message': 'Hello %d' % index})
+        self.assertEqual(export(self.path, self.relay, self.layout, limit=1), 1)
+        self.relay.failures = 1
+        with self.assertRaises(ConnectionError):
+            export(self.path, self.relay, self.layout)
+        self.assertEqual(export(self.path, self.relay, self.layout), 2)
+        messages = [data for _, _, data in self.relay.sent]
+        for index, data in enumerate(messages):
+            self.assertIn(b'message: Hello %d' % index, data)
+
+    def test_concurrent(self):
+        "Ensure that concurrent sends are all captured"
+        capture = self.get_capture()
+        def send(thread):
+            for index in range(20):
+                capture.mail({'message': '%d-%d' % (thread, index)})
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(export(self.path, self.relay, self.layout), 80)
+
+class MaildirCaptureTest(CaptureTest):
+    """ Test case for the capture backend writing to a Maildir """
+
+    layout = 'maildir'
+
+    def test_maildir(self):
+        "Ensure that messages are delivered to the new folder of the Maildir"
+        self.get_capture().mail({'message': 'Hello'})
+        self.assertEqual(os.listdir(os.path.join(self.path, 'tmp')), [])
+        name, = os.listdir(os.path.join(self.path, 'new'))
+        with open(os.path.join(self.path, 'new', name), 'rb') as f:
+            self.assertTrue(f.read().startswith(
+                b'Return-Path: <from@example.com>\r\nDelivered-To: to@example.com\r\n'))
+
+class SegmentLogTest(unittest.TestCase):
+    """ Test case for the segments of the capture log """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.relay = RecordingBackend('from@example.com', 'to@example.com')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_rotate(self):
+        "Ensure that segments are sealed once full and deleted once exported"
+        capture = CaptureEmailBackend('from@example.com', 'to@example.com',
+                                      path=self.path, segment_size=1)
+        for _ in range(3):
+            capture.mail({'message': 'Hello'})
+        segments = SegmentLog.segments(self.path)
+        self.assertEqual([s.endswith('.log') for s in segments], [True, True, False])
+        self.assertEqual(export(self.path, self.relay), 3)
+        self.assertEqual(len(SegmentLog.segments(self.path)), 1)
+        capture.close()
+        self.assertEqual(export(self.path, self.relay), 0)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_torn_record(self):
+        "Ensure that a record cut by a crash is not exported"
+        capture = CaptureEmailBackend('from@example.com', 'to@example.com', path=self.path)
+        capture.mail({'message': 'Hello'})
+        capture.mail({'message': 'World'})
+        segment, = SegmentLog.segments(self.path)
+        with open(segment, 'r+b') as f:
+            f.truncate(os.path.getsize(segment) - 1)
+        self.assertEqual(export(self.path, self.relay), 1)
+        self.assertIn(b'message: Hello', self.relay.sent[0][2])
@@ -0,0 +1,149 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from flask_contact.backends import EmailBackend
+from flask_contact.composite import CompositeEmailBackend
+from flask_contact.mime import read_data
+
+class RelayBackend(EmailBackend):
+    """ Backend recording the messages it sends, failing on demand """
+    def __init__(self, name, fail=False):
+        super().__init__('from@example.com', 'to@example.com')
+        self.name = name
+        self.fail = fail
+        self.sent = []
+
+    def send_raw(self, from_email, to_emails, data):
+        if self.fail:
+            raise ConnectionError(self.name)
+        self.sent.append(read_data(data))
+
+class CompositeBackendTest(unittest.TestCase):
+    """ Test case for the load balancing composite backend """
+
+    def test_round_robin(self):
+        "Ensure that sends are spread evenly over the members"
+        relays = [RelayBackend('a'), RelayBackend('b'), RelayBackend('c')]
+        composite = CompositeEmailBackend(relays)
+        for _ in range(6):
+            composite.mail({'message': 'Hello'})
+        self.assertEqual([len(relay.sent) for relay in relays], [2, 2, 2])
+
+    def test_failover(self):
+        "Ensure that a failed send is retried on the next member"
+        relays = [RelayBackend('a', fail=True), RelayBackend('b')]
+        composite = CompositeEmailBackend(relays)
+        composite.mail({'message': 'Hello'})
+        composite.mail({'message': 'Hello'})
+        self.assertEqual(len(relays[1].sent), 2)
+        # The message is rewound between tries
+        self.assertIn(b'Hello', relays[1].sent[0])
+
+    def test_all_failed(self):
+        "Ensure that the last error is raised when every member failed"
+        composite = CompositeEmailBackend([RelayBackend('a', fail=True),
+                                           RelayBackend('b', fail=True)])
+        with self.assertRaises(ConnectionError):
+            composite.mail({})
+
+    def test_least_latency(self):
+        "Ensure that the fastest member is preferred"
+        relays = [RelayBackend('a'), RelayBackend('b')]
+        composite = CompositeEmailBackend(relays, strategy='least_latency')
+        composite.record(composite.members[0], 0.5, False)
+        composite.record(composite.members[1], 0.1, False)
+        composite.mail({})
+        self.assertEqual([len(relay.sent) for relay in relays], [0, 1])
+
+    def test_errors_score(self):
+        "Ensure that errors make a member less preferred"
+        composite = CompositeEmailBackend([RelayBackend('a'), RelayBackend('b')],
+                                          strategy='least_latency')
+        fast, slow = composite.members
+        composite.record(fast, 0.1, False)
+        composite.record(slow, 0.2, False)
+        for _ in range(4):
+            composite.record(fast, 0.1, True)
+        self.assertGreater(fast.score, slow.score)
+
+    def test_failing_member(self):
+        "Ensure that a fresh member always failing is not preferred"
+        relays = [RelayBackend('a', fail=True), RelayBackend('b')]
+        composite = CompositeEmailBackend(relays, strategy='least_latency',
+                                          failure_threshold=100)
+        tried = []
+        for _ in range(20):
+            tried.append(composite.candidates()[0].backend.name)
+            composite.mail({})
+        self.assertEqual(len(relays[1].sent), 20)
+        self.assertLessEqual(tried.count('a'), 1)
+
+    def test_cancelled_trial(self):
+        "Ensure that a cancelled trial send lets another trial through"
+        class CancelledBackend(RelayBackend):
+            def send_raw(self, from_email, to_emails, data):
+                raise asyncio.CancelledError()
+        composite = CompositeEmailBackend([CancelledBackend('a')], failure_threshold=1)
+        member = composite.members[0]
+        member.opened_at = 0
+        with patch('flask_contact.composite.time.monotonic', return_value=100):
+            with self.assertRaises(asyncio.CancelledError):
+                composite.send_raw('from@example.com', ['to@example.com'], b'trial')
+            self.assertFalse(member.trial)
+            self.assertTrue(composite.claim(member))
+
+    def test_circuit_breaker(self):
+        "Ensure that a failing member is skipped, then tried again"
+        relays = [RelayBackend('a', fail=True), RelayBackend('b')]
+        composite = CompositeEmailBackend(relays, failure_threshold=2,
+                                          reset_timeout=30)
+        with patch('flask_contact.composite.time.monotonic', return_value=100):
+            for _ in range(4):
+                composite.mail({})
+            self.assertIsNotNone(composite.members[0].opened_at)
+            self.assertEqual(composite.candidates()[0], composite.members[0])
+            self.assertFalse(composite.claim(composite.members[0]))
+
+        relays[0].fail = False
+        with patch('flask_contact.composite.time.monotonic', return_value=200):
+            # After reset_timeout, one trial send closes the circuit
+            composite.send_raw('from@example.com', ['to@example.com'], b'trial')
+            composite.send_raw('from@example.com', ['to@example.com'], b'trial')
+        self.assertIsNone(composite.members[0].opened_at)
+        self.assertEqual(relays[0].sent, [b'trial'])
+
+    def test_all_open(self):
+        "Ensure that members are still tried when every circuit is open"
+        relays = [RelayBackend('a', fail=True)]
+        composite = CompositeEmailBackend(relays, failure_threshold=1)
+        with self.assertRaises(ConnectionError):
+            composite.mail({})
+        relays[0].fail = False
+        composite.mail({})
+        self.assertEqual(len(relays[0].sent), 1)
+
+    def test_direct(self):
+        "Ensure that messages without file are written directly, not as multipart"
+        relays = [RelayBackend('a')]
+        CompositeEmailBackend(relays).mail({'message': 'Hello'})
+        asyncio.run(CompositeEmailBackend(relays).amail({'message': 'Hello'}))
+        for data in relays[0].sent:
+            self.assertIn(b'Content-Type: text/plain', data)
+            self.assertNotIn(b'multipart', data)
+
+    def test_fallback_closed(self):
+        "Ensure that a circuit closed by another send is tried last, not compared"
+        relays = [RelayBackend('a'), RelayBackend('b'), RelayBackend('c')]
+        composite = CompositeEmailBackend(relays)
+        for member, opened_at in zip(composite.members, (5.0, None, 3.0)):
+            member.opened_at = opened_at
+        self.assertEqual([member.backend.name for member in composite.fallback(composite.members)],
+                         ['c', 'a', 'b'])
+
+    def test_async(self):
+        "Ensure that asend fails over as well"
+        relays = [RelayBackend('a', fail=True), RelayBackend('b')]
+        composite = CompositeEmailBackend(relays)
+        asyncio.run(composite.amail({'message': 'Hello'}))
+        self.assertEqual(len(relays[1].sent), 1)
@@ -0,0 +1,74 @@
+import io
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.dedup import DuplicateFilter
+
+from helpers import RecordingBackend
+
+class DuplicateFilterTest(unittest.TestCase):
+    """ Test case for the duplicate filter """
+
+    def test_normalized(self):
+        "Ensure that whitespace differences don't change the key"
+        dedup = DuplicateFilter()
+        self.assertEqual(dedup.get_key([('a', 'Hello  world ')]),
+                         dedup.get_key([('a', 'Hello world')]))
+        self.assertNotEqual(dedup.get_key([('a', 'Hello')]),
+                            dedup.get_key([('a', 'Bye')]))
+
+    def test_file(self):
+        "Ensure that the file content is part of the key and rewound"
+        dedup = DuplicateFilter()
+        first = io.BytesIO(b'abc')
+        first.filename = 'a.txt'
+        second = io.BytesIO(b'abd')
+        second.filename = 'a.txt'
+        self.assertNotEqual(dedup.get_key([], first), dedup.get_key([], second))
+        self.assertEqual(first.read(), b'abc')
+
+    def test_claim(self):
+        "Ensure that a key can only be claimed once within the ttl"
+        dedup = DuplicateFilter(ttl=60)
+        self.assertTrue(dedup.claim('a'))
+        self.assertFalse(dedup.claim('a'))
+        dedup.release('a')
+        self.assertTrue(dedup.claim('a'))
+
+    def test_expired(self):
+        "Ensure that a key is forgotten after the ttl"
+        dedup = DuplicateFilter(ttl=0)
+        self.assertTrue(dedup.claim('a'))
+        self.assertTrue(dedup.claim('a'))
+
+class DuplicateViewTest(unittest.TestCase):
+    """ Test case for the view with duplicate suppression """
+
+    def setUp(self):
+        app = Flask(__name__)
+        self.backend = RecordingBackend('from@example.com', 'to@example.com')
+        app.register_blueprint(blueprint('contact', self.backend, dedup=DuplicateFilter()))
+        self.client = app.test_client()
+
+    def test_duplicate(self):
+        "Ensure that a duplicate gets the success response without being sent"
+        for _ in range(2):
+            response = self.client.post('/', json={'message': 'Hello'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.backend.sent), 1)
+
+    def test_idempotency_key(self):
+        "Ensure that the Idempotency-Key header identifies the submission"
+        headers = {'Idempotency-Key': 'abc'}
+        self.client.post('/', json={'message': 'Hello'}, headers=headers)
+        self.client.post('/', json={'message': 'Bye'}, headers=headers)
+        self.assertEqual(len(self.backend.sent), 1)
+
+    def test_failure(self):
+        "Ensure that a submission that failed can be sent again"
+        self.backend.failures = 1
+        self.assertEqual(self.client.post('/', json={'message': 'Hello'}).status_code, 500)
+        self.client.post('/', json={'message': 'Hello'})
+        self.assertEqual(len(self.backend.sent), 1)
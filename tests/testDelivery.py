@@ -0,0 +1,94 @@
+import threading
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.delivery import QueuedEmailBackend, QueueFull
+
+from helpers import RecordingBackend
+
+class QueuedBackendTest(unittest.TestCase):
+    """ Test case for the background delivery queue """
+
+    def test_send(self):
+        "Ensure that queued messages are sent by the workers"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        queued = QueuedEmailBackend(backend)
+        for _ in range(5):
+            queued.mail({'message': 'Hello'})
+        queued.close()
+        self.assertEqual(len(backend.sent), 5)
+
+    def test_proxy(self):
+        "Ensure that configuration is looked up on the wrapped backend"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        queued = QueuedEmailBackend(backend)
+        self.assertEqual(queued.to_email, 'to@example.com')
+        self.assertTrue(queued.deferred)
+
+    def test_full(self):
+        "Ensure that QueueFull is raised when no slot is available"
+        gate = threading.Event()
+        backend = RecordingBackend('from@example.com', 'to@example.com', gate=gate)
+        queued = QueuedEmailBackend(backend, maxsize=1, workers=1)
+        queued.mail({})
+        with self.assertRaises(QueueFull):
+            for _ in range(3):
+                queued.mail({})
+        gate.set()
+        queued.close()
+
+    def test_error_callback(self):
+        "Ensure that delivery errors are handed to on_error"
+        errors = []
+        backend = RecordingBackend('from@example.com', 'to@example.com',
+                                   error=RuntimeError('down'))
+        queued = QueuedEmailBackend(backend, on_error=lambda m, e: errors.append(e))
+        queued.mail({})
+        queued.close()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], RuntimeError)
+
+    def test_failing_callback(self):
+        "Ensure that a failing on_error callback doesn't kill the worker"
+        def on_error(message, exc):
+            raise ValueError('callback')
+        backend = RecordingBackend('from@example.com', 'to@example.com',
+                                   error=RuntimeError('down'))
+        queued = QueuedEmailBackend(backend, workers=1, on_error=on_error)
+        with self.assertLogs('flask_contact.delivery', 'ERROR'):
+            queued.mail({})
+            queued.queue.join()
+        backend.error = None
+        queued.mail({})
+        queued.close()
+        self.assertEqual(len(backend.sent), 1)
+
+class DeferredViewTest(unittest.TestCase):
+    """ Test case for the view with a deferred backend """
+
+    def get_client(self, backend):
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', backend))
+        return app.test_client()
+
+    def test_accepted(self):
+        "Ensure that a json request is answered with 202"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        queued = QueuedEmailBackend(backend)
+        response = self.get_client(queued).post('/', json={'message': 'Hello'})
+        queued.close()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(backend.sent), 1)
+
+    def test_unavailable(self):
+        "Ensure that a full queue is answered with 503"
+        gate = threading.Event()
+        backend = RecordingBackend('from@example.com', 'to@example.com', gate=gate)
+        queued = QueuedEmailBackend(backend, maxsize=1, workers=1)
+        client = self.get_client(queued)
+        codes = {client.post('/', json={}).status_code for _ in range(3)}
+        gate.set()
+        queued.close()
+        self.assertIn(503, codes)
@@ -0,0 +1,167 @@
+import threading
+import time
+import unittest
+
+from flask_contact.digest import DigestEmailBackend
+
+from helpers import RecordingBackend, Upload
+
+class DigestTest(unittest.TestCase):
+    """ Test case for the digest mode """
+
+    def wait_for(self, backend, count=1):
+        "Wait for the timer thread to send +count+ digests"
+        for _ in range(500):
+            if len(backend.sent) >= count:
+                return
+            time.sleep(0.01)
+
+    def test_size(self):
+        "Ensure that a digest is sent once size submissions are buffered"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        digest = DigestEmailBackend(backend, size=3)
+        for name in ('a', 'b', 'c'):
+            digest.mail({'name': name})
+        self.wait_for(backend)
+        self.assertEqual(len(backend.sent), 1)
+        message = backend.messages[0]
+        self.assertEqual(message['Subject'], '3 new messages')
+        body = message.get_payload()[0].get_payload()
+        self.assertIn('name: a', body)
+        self.assertIn('name: c', body)
+        digest.mail({'name': 'd'})
+        digest.close()
+        self.assertEqual(len(backend.sent), 2)
+        self.assertIn('name: d', backend.messages[1].get_payload()[0].get_payload())
+
+    def test_background(self):
+        "Ensure that digests are never sent from the thread of a submission"
+        threads = []
+        class ThreadBackend(RecordingBackend):
+            def send_raw(self, from_email, to_emails, data):
+                threads.append(threading.current_thread())
+                super().send_raw(from_email, to_emails, data)
+        backend = ThreadBackend('from@example.com', 'to@example.com')
+        digest = DigestEmailBackend(backend, size=1)
+        for name in ('a', 'b', 'c'):
+            digest.mail({'name': name})
+        self.wait_for(backend)
+        self.assertNotIn(threading.current_thread(), threads)
+        digest.close()
+
+    def test_filter(self):
+        "Ensure that entries are formatted by the wrapped backend"
+        backend = RecordingBackend('from@example.com', 'to@example.com',
+                                   allowed_fields='name')
+        digest = DigestEmailBackend(backend)
+        digest.mail({'name': 'a', 'secret': 'b'})
+        digest.close()
+        body = backend.messages[0].get_payload()[0].get_payload()
+        self.assertNotIn('secret', body)
+
+    def test_window(self):
+        "Ensure that a digest is sent at the end of the window"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        digest = DigestEmailBackend(backend, window=0.01)
+        digest.mail({'name': 'a'})
+        for _ in range(100):
+            if backend.sent:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(backend.sent), 1)
+        digest.close()
+
+    def test_routes(self):
+        "Ensure that routed submissions are sent in a digest per recipient"
+        backend = RecordingBackend('from@example.com', 'to@example.com', routes={
+            'topic': {'sales': ['sales@example.com', 'ceo@example.com']}})
+        digest = DigestEmailBackend(backend)
+        for topic in ('sales', 'other', 'sales'):
+            digest.mail({'topic': topic})
+        digest.close()
+        self.assertEqual(sorted((to_emails, message['Subject']) for (_, to_emails, _), message
+                                in zip(backend.sent, backend.messages)), [
+            (['sales@example.com', 'ceo@example.com'], '2 new messages'),
+            (['to@example.com'], '1 new messages'),
+        ])
+
+    def test_attachments_cap(self):
+        "Ensure that files over the attachments size cap are left out"
+        backend = RecordingBackend('from@example.com', 'to@example.com', allow_file=True)
+        digest = DigestEmailBackend(backend, max_attachments_size=10)
+        digest.mail({'name': 'a'}, Upload(b'12345678', 'a.txt'))
+        digest.mail({'name': 'b'}, Upload(b'12345678', 'b.txt'))
+        digest.close()
+        parts = backend.messages[0].get_payload()
+        self.assertEqual(len(parts), 2)
+        self.assertIn('b.txt left out', parts[0].get_payload())
+
+    def test_failure(self):
+        "Ensure that the submissions of a failed digest are kept for the next one"
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=1)
+        digest = DigestEmailBackend(backend, size=3, retry_delay=0.01)
+        with self.assertLogs('flask_contact.digest', 'ERROR'):
+            for name in ('a', 'b', 'c'):
+                digest.mail({'name': name})
+            self.wait_for(backend)
+        digest.close()
+        self.assertEqual(len(backend.sent), 1)
+        self.assertEqual(backend.messages[0]['Subject'], '3 new messages')
+
+    def test_retry_delay(self):
+        "Ensure that a failed digest is not tried again before retry_delay"
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=1)
+        digest = DigestEmailBackend(backend, size=1, retry_delay=60)
+        with self.assertLogs('flask_contact.digest', 'ERROR'):
+            digest.mail({'name': 'a'})
+            for _ in range(500):
+                if not backend.failures:
+                    break
+                time.sleep(0.01)
+        digest.mail({'name': 'b'})
+        time.sleep(0.05)
+        self.assertEqual(backend.sent, [])
+        digest.close()
+        self.assertEqual(backend.messages[0]['Subject'], '2 new messages')
+
+    def test_on_error(self):
+        "Ensure that on_error receives the submissions over max_entries"
+        failed = []
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=1)
+        digest = DigestEmailBackend(backend, size=2, max_entries=1, retry_delay=0.01,
+                                    on_error=lambda entries, exc: failed.append(
+                                        [entry.text for entry in entries]))
+        with self.assertLogs('flask_contact.digest', 'ERROR'):
+            digest.mail({'name': 'a'})
+            digest.mail({'name': 'b'})
+            self.wait_for(backend)
+        digest.close()
+        self.assertEqual(failed, [['name: a']])
+        self.assertEqual(backend.messages[0]['Subject'], '1 new messages')
+
+    def test_overflow(self):
+        "Ensure that submissions over max_entries are dropped without on_error"
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=1)
+        digest = DigestEmailBackend(backend, size=3, max_entries=2, retry_delay=0.01)
+        with self.assertLogs('flask_contact.digest', 'ERROR') as logs:
+            for name in ('a', 'b', 'c'):
+                digest.mail({'name': name})
+            self.wait_for(backend)
+        digest.close()
+        self.assertTrue(any('Dropped the 1 oldest' in line for line in logs.output))
+        body = backend.messages[0].get_payload()[0].get_payload()
+        self.assertNotIn('name: a', body)
+        self.assertIn('name: c', body)
+
+    def test_timer_survives(self):
+        "Ensure that the timer keeps flushing after a failed digest"
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=1)
+        digest = DigestEmailBackend(backend, window=0.01, retry_delay=0.01)
+        with self.assertLogs('flask_contact.digest', 'ERROR'):
+            digest.mail({'name': 'a'})
+            for _ in range(200):
+                if backend.sent:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(len(backend.sent), 1)
+        digest.close()
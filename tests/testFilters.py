@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.backends import EmailBackend
+from flask_contact.filters import (BayesFilter, Filter, FilterPipeline, HoneypotFilter,
+                                   KeywordFilter, LengthFilter, LinkFilter)
+
+class CountingFilter(Filter):
+    """ Filter recording its calls, rejecting on demand """
+    def __init__(self, name, cost, reject=False):
+        self.name = name
+        self.cost = cost
+        self.reject = reject
+        self.calls = 0
+
+    def check(self, fields, text):
+        self.calls += 1
+        return self.reject
+
+class FiltersTest(unittest.TestCase):
+    """ Test case for the spam filters """
+
+    def test_honeypot(self):
+        "Ensure that filling in the honeypot is rejected"
+        self.assertTrue(HoneypotFilter('honey').check({'honey': 'x'}, 'x'))
+        self.assertFalse(HoneypotFilter('honey').check({'honey': ''}, ''))
+
+    def test_length(self):
+        "Ensure that long texts are rejected"
+        self.assertTrue(LengthFilter(10).check({}, 'x' * 11))
+        self.assertFalse(LengthFilter(10).check({}, 'x' * 10))
+
+    def test_links(self):
+        "Ensure that texts with many links are rejected"
+        links = LinkFilter(max_links=2)
+        self.assertFalse(links.check({}, 'see http://a.com and www.b.com'))
+        self.assertTrue(links.check({}, 'http://a.com https://b.com [URL=c]'))
+
+    def test_keywords(self):
+        "Ensure that keywords are matched as whole words in any case"
+        keywords = KeywordFilter(['casino', 'free money'])
+        self.assertTrue(keywords.check({}, 'Best CASINO online'))
+        self.assertTrue(keywords.check({}, 'get free money now'))
+        self.assertFalse(keywords.check({}, 'occasional question'))
+        self.assertFalse(KeywordFilter([]).check({}, 'casino'))
+
+    def test_bayes(self):
+        "Ensure that the Bayes scorer learns from examples"
+        bayes = BayesFilter(min_examples=3)
+        self.assertFalse(bayes.check({}, 'cheap pills online'))
+        for _ in range(3):
+            bayes.train('cheap pills online buy now', spam=True)
+            bayes.train('question about my order delivery', spam=False)
+        self.assertTrue(bayes.check({}, 'buy cheap pills'))
+        self.assertFalse(bayes.check({}, 'a question about delivery'))
+
+    def test_bayes_save(self):
+        "Ensure that what was learnt can be saved and loaded"
+        bayes = BayesFilter(min_examples=1)
+        bayes.train('cheap pills', spam=True)
+        bayes.train('my order', spam=False)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            bayes.save(path)
+            loaded = BayesFilter(min_examples=1)
+            loaded.load(path)
+        finally:
+            os.unlink(path)
+        self.assertEqual(loaded.score('cheap pills'), bayes.score('cheap pills'))
+
+class FilterPipelineTest(unittest.TestCase):
+    """ Test case for the filter pipeline """
+
+    def test_order(self):
+        "Ensure that filters run cheapest first and stop at a rejection"
+        expensive = CountingFilter('expensive', 100)
+        cheap = CountingFilter('cheap', 1, reject=True)
+        pipeline = FilterPipeline([expensive, cheap])
+        self.assertEqual(pipeline.check({'message': 'Hello'}), 'cheap')
+        self.assertEqual((cheap.calls, expensive.calls), (1, 0))
+
+    def test_pass(self):
+        "Ensure that a submission passing every filter is accepted"
+        pipeline = FilterPipeline([CountingFilter('a', 1), CountingFilter('b', 2)])
+        self.assertIsNone(pipeline.check({}))
+
+    def test_stats(self):
+        "Ensure that hit rates and timings are kept per filter"
+        links = LinkFilter(max_links=0)
+        pipeline = FilterPipeline([links, LengthFilter(100)])
+        pipeline.check({'message': 'Hello'})
+        pipeline.check({'message': 'http://spam.com'})
+        stats = {stat['name']: stat for stat in pipeline.get_stats()}
+        self.assertEqual(stats['length']['calls'], 2)
+        self.assertEqual(stats['links']['calls'], 2)
+        self.assertEqual(stats['links']['hit_rate'], 0.5)
+        self.assertGreater(stats['links']['seconds'], 0)
+
+    def test_stats_same_name(self):
+        "Ensure that filters sharing a name keep their own statistics"
+        pipeline = FilterPipeline([KeywordFilter(['viagra']), KeywordFilter(['casino'])])
+        pipeline.check({'message': 'Hello'})
+        pipeline.check({'message': 'Cheap viagra'})
+        stats = pipeline.get_stats()
+        self.assertEqual([stat['name'] for stat in stats], ['keywords', 'keywords'])
+        self.assertEqual([stat['calls'] for stat in stats], [2, 1])
+        self.assertEqual([stat['hits'] for stat in stats], [1, 0])
+
+class FilterViewTest(unittest.TestCase):
+    """ Test case for the filters of the view """
+
+    def test_view(self):
+        "Ensure that filtered submissions are rejected"
+        sent = []
+        class Backend(EmailBackend):
+            def send_raw(self, from_email, to_emails, data):
+                sent.append(data)
+        backend = Backend('from@a.com', 'to@a.com', filters=[KeywordFilter(['casino'])])
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', backend))
+        client = app.test_client()
+        self.assertEqual(client.post('/', json={'message': 'casino'}).status_code, 400)
+        self.assertEqual(client.post('/', json={'message': 'Hello'}).status_code, 200)
+        self.assertEqual(len(sent), 1)
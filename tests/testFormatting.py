@@ -0,0 +1,31 @@
+import unittest
+
+from flask_contact.formatting import Template
+
+class TemplateTest(unittest.TestCase):
+    """ Test case for the compiled templates """
+
+    def test_literal(self):
+        "Ensure that a template without fields is rendered as is"
+        self.assertEqual(Template('Hello').render({}), 'Hello')
+
+    def test_field(self):
+        "Ensure that fields are replaced"
+        template = Template('Hello {name}!')
+        self.assertEqual(template.render({'name': 'David'}), 'Hello David!')
+        self.assertEqual(template.names, ['name'])
+
+    def test_default(self):
+        "Ensure that defaults are used for missing or empty fields"
+        template = Template('Hello {name|you}')
+        self.assertEqual(template.render({}), 'Hello you')
+        self.assertEqual(template.render({'name': ''}), 'Hello you')
+
+    def test_braces(self):
+        "Ensure that doubled braces are kept as literal braces"
+        self.assertEqual(Template('{{name}} {name}').render({'name': 'a'}), '{name} a')
+
+    def test_escape(self):
+        "Ensure that field values are escaped but not the template"
+        template = Template('<b>{name}</b>')
+        self.assertEqual(template.render({'name': '<i>'}), '<b>&lt;i&gt;</b>')
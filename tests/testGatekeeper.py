@@ -0,0 +1,111 @@
+import io
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.gatekeeper import Gatekeeper
+
+from helpers import RecordingBackend
+
+BOUNDARY = 'testboundary'
+
+class CountingStream(io.BytesIO):
+    """ Request body recording how much of it was read """
+    def __init__(self, data):
+        super().__init__(data)
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.consumed += count
+        return count
+
+def multipart(*parts):
+    """ Return a multipart body of +parts+ (name, value, filename) """
+    body = b''
+    for name, value, filename in parts:
+        disposition = 'form-data; name="%s"' % name
+        if filename:
+            disposition += '; filename="%s"' % filename
+        body += ('--%s\r\nContent-Disposition: %s\r\n\r\n' % (BOUNDARY, disposition)).encode()
+        body += value + b'\r\n'
+    return body + ('--%s--\r\n' % BOUNDARY).encode()
+
+class GatekeeperTest(unittest.TestCase):
+    """ Test case for the checks made before the body of a request is read """
+
+    def setUp(self):
+        app = Flask(__name__)
+        self.backend = RecordingBackend('from@example.com', 'to@example.com',
+                                        allow_file=True, red_herring='honey')
+        app.register_blueprint(blueprint('contact', self.backend,
+                                         allowed_origins='a.com',
+                                         gatekeeper=Gatekeeper(max_content_length=4096,
+                                                               chunk_size=512)))
+        self.client = app.test_client()
+
+    def post(self, body, **kwargs):
+        """ Post a multipart +body+, returning the response and the stream """
+        stream = CountingStream(body)
+        response = self.client.post(
+            '/', input_stream=stream, content_length=len(body),
+            content_type='multipart/form-data; boundary=%s' % BOUNDARY, **kwargs)
+        return response, stream
+
+    def test_multipart(self):
+        "Ensure that fields and the file of a multipart form are parsed"
+        body = multipart(('redirect_uri', b'http://a.com/', None),
+                         ('message', b'Hello', None),
+                         ('file', b'content', 'a.txt'))
+        response, _ = self.post(body)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(b'message: Hello', self.backend.sent[0][2])
+        self.assertIn(b'filename="a.txt"', self.backend.sent[0][2])
+
+    def test_red_herring_first(self):
+        "Ensure that the file is not read when the red herring is filled in"
+        body = multipart(('honey', b'bot', None),
+                         ('file', b'x' * 3000, 'a.txt'))
+        response, stream = self.post(body)
+        self.assertEqual(response.status_code, 400)
+        self.assertLessEqual(stream.consumed, 1024)
+        self.assertEqual(self.backend.sent, [])
+
+    def test_too_large(self):
+        "Ensure that a request over the budget is rejected unread"
+        body = multipart(('message', b'x' * 5000, None))
+        response, stream = self.post(body)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(stream.consumed, 0)
+
+    def test_content_type(self):
+        "Ensure that an unexpected content type is rejected"
+        response = self.client.post('/', data='Hello', content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+    def test_origin(self):
+        "Ensure that a request from another origin is rejected unread"
+        body = multipart(('message', b'Hello', None))
+        response, stream = self.post(body, headers={'Origin': 'http://b.com'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(stream.consumed, 0)
+        response, _ = self.post(body, headers={'Origin': 'http://a.com',
+                                               'Referer': 'http://a.com/contact'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_json(self):
+        "Ensure that JSON requests are still parsed by Flask"
+        response = self.client.post('/', json={'message': 'Hello'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid(self):
+        "Ensure that a truncated multipart body is answered 400"
+        body = multipart(('message', b'Hello', None))[:-20]
+        response, _ = self.post(body)
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from flask_contact.backends import SESEmailBackend, SMTPEmailBackend
+
+# Time allowed to import the package once flask is loaded, in seconds
+IMPORT_BUDGET = 0.05
+
+# Modules that must only be imported once a message is sent
+HEAVY_MODULES = ('asyncio', 'boto3', 'email.mime.multipart', 'smtplib', 'sqlite3')
+
+SCRIPT = """
+import json, sys, time
+import flask, flask_cors
+start = time.perf_counter()
+import flask_contact, flask_contact.backends
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+def measure_import():
+    """ Return the time taken to import flask_contact and the loaded modules """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=root)
+    result = json.loads(output)
+    return result['elapsed'], set(result['modules'])
+
+class ImportTest(unittest.TestCase):
+    """ Test case for the import time of the package """
+
+    def test_budget(self):
+        "Ensure that importing the package stays within its time budget"
+        # Best of a few runs, to ignore a cold file system cache
+        elapsed = min(measure_import()[0] for _ in range(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_heavy_modules(self):
+        "Ensure that heavy dependencies are not imported with the package"
+        _, modules = measure_import()
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+class LazyClientTest(unittest.TestCase):
+    """ Test case for the deferred construction of clients """
+
+    def test_smtp_pool(self):
+        "Ensure that the SMTP pool is created on first use, once per process"
+        backend = SMTPEmailBackend('', '', smtp_server='smtp.a.com',
+                                   smtp_user='a', smtp_password='b', pool_size=2)
+        self.assertFalse(hasattr(backend, '_pool'))
+        pool = backend.pool
+        self.assertEqual(pool.size, 2)
+        self.assertIs(backend.pool, pool)
+
+        # A forked process gets its own pool
+        backend._pool_pid = -1
+        self.assertIsNot(backend.pool, pool)
+
+    def test_ses_client(self):
+        "Ensure that the SES backend doesn't build a client until it sends"
+        backend = SESEmailBackend('', '', access_key='a', secret_key='b')
+        self.assertFalse(hasattr(backend, '_client'))
@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+
+from flask_contact.loadtest import format_report, get_parser, percentile, run
+
+class LoadTestTest(unittest.TestCase):
+    """ Test case for the load test entry point """
+
+    def run_loadtest(self, *argv):
+        options = get_parser().parse_args(['--requests', '20', '--concurrency', '4'] + list(argv))
+        return run(options)
+
+    def test_percentile(self):
+        "Ensure that percentiles use the nearest rank"
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_smtp(self):
+        "Ensure that every JSON submission reaches the SMTP sink"
+        report = self.run_loadtest('--smtp-latency', '0.001', '--pool-size', '2')
+        self.assertEqual(report['statuses'], {'200': 20})
+        self.assertEqual(report['error_rate'], 0)
+        self.assertEqual(report['delivered'], 20)
+        self.assertLessEqual(report['connections'], 2)
+        self.assertLessEqual(report['p50'], report['p99'])
+        self.assertIn('p95', format_report(report))
+
+    def test_file(self):
+        "Ensure that multipart submissions with a file are posted"
+        report = self.run_loadtest('--kind', 'file', '--file-size', '1000')
+        self.assertEqual(report['statuses'], {'302': 20})
+        self.assertEqual(report['delivered'], 20)
+
+    def test_queued(self):
+        "Ensure that queued messages are all delivered before the report"
+        report = self.run_loadtest('--kind', 'form', '--backend', 'queued')
+        self.assertEqual(report['statuses'], {'302': 20})
+        self.assertEqual(report['delivered'], 20)
+
+    def test_capture(self):
+        "Ensure that the capture backend can be load tested"
+        with tempfile.TemporaryDirectory() as path:
+            report = self.run_loadtest('--backend', 'capture', '--capture-path', path)
+        self.assertEqual(report['statuses'], {'200': 20})
+        self.assertEqual(report['delivered'], 0)
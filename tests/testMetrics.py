@@ -0,0 +1,70 @@
+import io
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.metrics import Histogram, Metrics
+
+from helpers import RecordingBackend
+
+class HistogramTest(unittest.TestCase):
+    """ Test case for the latency histograms """
+
+    def test_cumulative(self):
+        "Ensure that bucket counts are cumulative"
+        histogram = Histogram((1, 2))
+        for value in (0.5, 1.5, 1.7, 3):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 1), (2, 3)])
+        self.assertEqual(histogram.count, 4)
+
+class MetricsTest(unittest.TestCase):
+    """ Test case for the instrumented blueprint """
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.backend = RecordingBackend('from@example.com', 'to@example.com',
+                                        red_herring='honey', allow_file=True)
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', self.metrics.instrument(self.backend),
+                                         metrics=self.metrics, metrics_route='/metrics'))
+        self.client = app.test_client()
+
+    def test_counters(self):
+        "Ensure that sends, rejections and failures are counted"
+        self.client.post('/', json={'message': 'Hello'})
+        self.client.post('/', json={'honey': 'bot'})
+        self.backend.failures = 1
+        self.client.post('/', json={'message': 'Hello'})
+        counters = self.metrics.counters
+        self.assertEqual(counters[('sends_total', ())], 1)
+        self.assertEqual(counters[('send_failures_total', ())], 1)
+        self.assertEqual(counters[('rejections_total', (('reason', 'red_herring'),))], 1)
+        self.assertEqual(counters[('requests_total', (('status', 400),))], 1)
+        self.assertEqual(counters[('requests_total', (('status', 500),))], 1)
+        for stage in ('request', 'parse', 'red_herring', 'build', 'send', 'mail'):
+            self.assertIn(stage, self.metrics.histograms)
+
+    def test_direct(self):
+        "Ensure that instrumenting a backend keeps writing messages directly"
+        self.client.post('/', json={'message': 'Hello'})
+        self.assertEqual(self.backend.messages[0].get_content_type(), 'text/plain')
+        self.assertIn('build', self.metrics.histograms)
+
+    def test_attachment_bytes(self):
+        "Ensure that the size of joined files is counted"
+        self.client.post('/', data={'redirect_uri': 'http://a.com/',
+                                    'file': (io.BytesIO(b'12345'), 'a.txt')})
+        self.assertEqual(self.metrics.counters[('attachment_bytes_total', ())], 5)
+
+    def test_route(self):
+        "Ensure that metrics are exposed in the Prometheus text format"
+        self.client.post('/', json={'message': 'Hello'})
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE contact_sends_total counter', text)
+        self.assertIn('contact_requests_total{status="200"} 1', text)
+        self.assertIn('contact_stage_seconds_bucket{stage="send",le="+Inf"} 1', text)
+        self.assertIn('contact_stage_seconds_count{stage="build"} 1', text)
@@ -0,0 +1,132 @@
+import email
+import io
+import os
+import unittest
+from email.header import decode_header, make_header
+
+from flask_contact.backends import EmailBackend
+from flask_contact.mime import FileTooLarge, SpooledAttachment, get_recipients, spool_message
+
+from helpers import Upload
+
+def decode(header):
+    """ Return the text of an encoded +header+ """
+    return str(make_header(decode_header(header))) if header else header
+
+class UnsizedUpload:
+    """ Uploaded file whose size can't be known in advance """
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.read = io.BytesIO(data).read
+
+class SpooledAttachmentTest(unittest.TestCase):
+    """ Test case for the streamed attachments """
+
+    def test_roundtrip(self):
+        "Ensure that a spooled attachment is written and parsed back"
+        data = os.urandom(200 * 1024 + 7)
+        backend = EmailBackend('from@example.com', 'to@example.com', allow_file=True)
+        message = backend.get_mail({'message': 'Hello'}, Upload(data, 'cv.pdf'))
+        with spool_message(message) as fp:
+            raw = fp.read()
+        parsed = email.message_from_bytes(raw)
+        body, attachment = parsed.get_payload()
+        self.assertEqual(body.get_payload(), 'message: Hello')
+        self.assertEqual(attachment.get_filename(), 'cv.pdf')
+        self.assertEqual(attachment.get_payload(decode=True), data)
+        self.assertNotIn(b'\n', raw.replace(b'\r\n', b''))
+
+    def test_as_string(self):
+        "Ensure that the generic generator still works"
+        message = EmailBackend('', '', allow_file=True).get_mail(
+            {}, Upload(b'hello', 'a.txt'))
+        self.assertIn('aGVsbG8=', message.as_string())
+
+    def test_too_large(self):
+        "Ensure that a file known to be too large is rejected before reading"
+        backend = EmailBackend('', '', allow_file=True, max_file_size=4)
+        upload = Upload(b'hello', 'a.txt')
+        with self.assertRaises(FileTooLarge):
+            backend.get_file(upload)
+        self.assertEqual(upload.tell(), 0)
+
+    def test_too_large_not_allowed(self):
+        "Ensure that a file too large but not allowed is left out, not rejected"
+        backend = EmailBackend('', '', allow_file=['pdf'], max_file_size=4)
+        self.assertIsNone(backend.get_file(Upload(b'hello', 'a.exe')))
+        self.assertIsNone(EmailBackend('', '', max_file_size=4).get_file(
+            Upload(b'hello', 'a.pdf')))
+
+    def test_too_large_unsized(self):
+        "Ensure that a file of unknown size is rejected while spooled"
+        backend = EmailBackend('', '', allow_file=True, max_file_size=4)
+        with self.assertRaises(FileTooLarge):
+            backend.get_mail({}, UnsizedUpload('a.txt', b'hello'))
+
+    def test_size(self):
+        "Ensure that the size of the spooled file is kept"
+        self.assertEqual(SpooledAttachment(Upload(b'abc', 'a'), 'a').size, 3)
+
+    def test_recipients(self):
+        "Ensure that every address of the To and Cc headers is a recipient"
+        message = EmailBackend('', '').get_mail({})
+        message.replace_header('To', 'A <a@a.com>, b@a.com')
+        message['Cc'] = 'c@a.com'
+        self.assertEqual(get_recipients(message), ['a@a.com', 'b@a.com', 'c@a.com'])
+
+class DirectMessageTest(unittest.TestCase):
+    """ Test case for messages written directly to bytes """
+
+    def assertSameMessage(self, backend, fields):
+        "Ensure that get_bytes and get_mail give the same headers and text"
+        direct = email.message_from_bytes(backend.get_bytes(fields, ['to@a.com']))
+        generic = backend.get_mail(fields)
+        for name in ('Subject', 'From', 'To', 'reply-to'):
+            self.assertEqual(decode(direct[name]), decode(generic[name]))
+        self.assertFalse(direct.is_multipart())
+        self.assertEqual(direct.get_payload(decode=True).replace(b'\r\n', b'\n'),
+                         generic.get_payload()[0].get_payload(decode=True).replace(b'\r\n', b'\n'))
+
+    def test_ascii(self):
+        "Ensure that an ASCII message is the same as the generic one"
+        backend = EmailBackend('from@a.com', 'to@a.com', subject="Hi {name}")
+        self.assertSameMessage(backend, {'name': 'Bob', 'email': 'bob@b.com',
+                                         'message': 'Hello\nWorld'})
+
+    def test_unicode(self):
+        "Ensure that non ASCII headers and text are encoded"
+        backend = EmailBackend('from@a.com', 'to@a.com', subject="Hi {name}")
+        fields = {'name': 'Zoë ' * 30, 'message': 'Été\r\nà la plage'}
+        self.assertSameMessage(backend, fields)
+        self.assertTrue(backend.get_bytes(fields, ['to@a.com']).isascii())
+
+    def test_line_endings(self):
+        "Ensure that every line of the text ends with CRLF"
+        backend = EmailBackend('from@a.com', 'to@a.com')
+        data = backend.get_bytes({'message': 'a\nb\rc\r\nd'}, ['to@a.com'])
+        self.assertTrue(data.endswith(b'message: a\r\nb\r\nc\r\nd'))
+
+    def test_long_line(self):
+        "Ensure that lines too long for SMTP are encoded"
+        backend = EmailBackend('from@a.com', 'to@a.com')
+        data = backend.get_bytes({'message': 'a' * 2000}, ['to@a.com'])
+        self.assertIn(b'Content-Transfer-Encoding: base64', data)
+        self.assertTrue(all(len(line) <= 998 for line in data.split(b'\r\n')))
+
+    def test_generic_fallback(self):
+        "Ensure that backends overriding send get a message object"
+        class Backend(EmailBackend):
+            def send(self, message):
+                self.message = message
+        backend = Backend('from@a.com', 'to@a.com', allow_file=True)
+        backend.mail({'message': 'Hello'})
+        self.assertEqual(backend.message['To'], 'to@a.com')
+
+    def test_file_fallback(self):
+        "Ensure that messages with a file are written by the generic path"
+        class Backend(EmailBackend):
+            def send_raw(self, from_email, to_emails, data):
+                self.data = data.read()
+        backend = Backend('from@a.com', 'to@a.com', allow_file=True)
+        backend.mail({'message': 'Hello'}, Upload(b'abc', 'a.txt'))
+        self.assertTrue(email.message_from_bytes(backend.data).is_multipart())
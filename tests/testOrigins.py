@@ -0,0 +1,144 @@
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.utils import OriginPolicy
+
+from helpers import NullBackend
+
+class OriginPolicyTest(unittest.TestCase):
+    """ Test case for the compiled origin policy """
+
+    def test_all(self):
+        "Ensure that '*' allows any origin"
+        self.assertIn('http://anything.com', OriginPolicy('*'))
+
+    def test_none(self):
+        "Ensure that no rule allows nothing"
+        self.assertNotIn('http://a.com', OriginPolicy(None))
+        self.assertNotIn('http://a.com', OriginPolicy(''))
+
+    def test_host(self):
+        "Ensure that a host is allowed over http and https, on default ports"
+        policy = OriginPolicy('a.com b.com')
+        self.assertIn('http://a.com', policy)
+        self.assertIn('https://B.com/contact?x=1', policy)
+        self.assertIn('https://a.com:443', policy)
+        self.assertIn('a.com/contact', policy)
+        self.assertNotIn('http://a.com:8080', policy)
+        self.assertNotIn('ftp://a.com', policy)
+        self.assertNotIn('http://evil.com', policy)
+
+    def test_userinfo(self):
+        "Ensure that userinfo doesn't fool the policy"
+        policy = OriginPolicy('a.com')
+        self.assertIn('http://user@a.com/', policy)
+        self.assertNotIn('http://a.com@evil.com/', policy)
+        self.assertNotIn('http://a.com.evil.com/', policy)
+
+    def test_wildcard(self):
+        "Ensure that *.domain allows its subdomains only"
+        policy = OriginPolicy(['*.a.com'])
+        self.assertIn('https://www.a.com', policy)
+        self.assertIn('https://x.y.a.com', policy)
+        self.assertNotIn('https://a.com', policy)
+        self.assertNotIn('https://evila.com', policy)
+
+    def test_port(self):
+        "Ensure that port rules are enforced"
+        policy = OriginPolicy('localhost:5000 dev.a.com:*')
+        self.assertIn('http://localhost:5000', policy)
+        self.assertNotIn('http://localhost:5001', policy)
+        self.assertNotIn('http://localhost', policy)
+        self.assertIn('http://dev.a.com:1234', policy)
+        self.assertIn('http://dev.a.com', policy)
+
+    def test_scheme(self):
+        "Ensure that a scheme restricts the rule"
+        policy = OriginPolicy('https://a.com')
+        self.assertIn('https://a.com', policy)
+        self.assertNotIn('http://a.com', policy)
+
+    def test_regex(self):
+        "Ensure that regex rules match the host"
+        policy = OriginPolicy('/review-[0-9]+\\.a\\.com/')
+        self.assertIn('https://review-12.a.com', policy)
+        self.assertNotIn('https://review-x.a.com', policy)
+
+    def test_invalid(self):
+        "Ensure that invalid URLs are denied"
+        policy = OriginPolicy('a.com')
+        self.assertNotIn('http://a.com:99999', policy)
+        self.assertNotIn('', policy)
+        self.assertNotIn(None, policy)
+
+    def test_cache(self):
+        "Ensure that decisions are cached in a bounded LRU"
+        policy = OriginPolicy('a.com', cache_size=2)
+        for url in ('http://a.com', 'http://b.com', 'http://a.com', 'http://c.com'):
+            url in policy
+        self.assertEqual(list(policy._decisions),
+                         [('http', 'a.com', None), ('http', 'c.com', None)])
+
+    def test_cache_paths(self):
+        "Ensure that URLs differing by their path share a cached decision"
+        policy = OriginPolicy('a.com')
+        for index in range(100):
+            self.assertIn('https://a.com/page/%d?q=%d' % (index, index), policy)
+            self.assertNotIn('https://b.com/page/%d' % index, policy)
+        self.assertEqual(len(policy._decisions), 2)
+
+    def test_cors_origins(self):
+        "Ensure that the CORS regexes follow the same rules"
+        origins = OriginPolicy('a.com *.b.com localhost:5000').cors_origins()
+        def allowed(origin):
+            return any(pattern.match(origin) for pattern in origins)
+        self.assertTrue(allowed('https://a.com'))
+        self.assertTrue(allowed('http://www.b.com'))
+        self.assertTrue(allowed('http://localhost:5000'))
+        self.assertFalse(allowed('https://a.com.evil.com'))
+        self.assertFalse(allowed('https://b.com'))
+        self.assertFalse(allowed('http://localhost:5001'))
+
+class OriginViewTest(unittest.TestCase):
+    """ Test case for the origin checks of the view """
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', NullBackend('from@a.com', 'to@a.com'),
+                                         allowed_origins='*.a.com', cors_max_age=600))
+        self.client = app.test_client()
+
+    def test_redirect(self):
+        "Ensure that a form can only redirect to an allowed origin"
+        response = self.client.post('/', data={'redirect_uri': 'https://www.a.com/thanks'})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post('/', data={'redirect_uri': 'https://evil.com/'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_redirect_path(self):
+        "Ensure that a form can redirect to a path of the site, but not of another host"
+        response = self.client.post('/', data={'redirect_uri': '/thanks'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith('/thanks'))
+        for uri in ('//evil.com/', '/\\evil.com/', '/\t/evil.com/', 'thanks'):
+            response = self.client.post('/', data={'redirect_uri': uri})
+            self.assertEqual(response.status_code, 401, uri)
+
+    def test_preflight(self):
+        "Ensure that preflights are cached by browsers"
+        response = self.client.options('/', headers={
+            'Origin': 'https://www.a.com',
+            'Access-Control-Request-Method': 'POST',
+        })
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], 'https://www.a.com')
+        self.assertEqual(response.headers['Access-Control-Max-Age'], '600')
+
+    def test_preflight_denied(self):
+        "Ensure that preflights from other origins are not allowed"
+        response = self.client.options('/', headers={
+            'Origin': 'https://evil.com',
+            'Access-Control-Request-Method': 'POST',
+        })
+        self.assertNotIn('Access-Control-Allow-Origin', response.headers)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from flask_contact.outbox import OutboxEmailBackend
+
+from helpers import RecordingBackend
+
+class OutboxTest(unittest.TestCase):
+    """ Test case for the durable outbox """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'outbox.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_outbox(self, backend, **kwargs):
+        return OutboxEmailBackend(backend, self.path, drain=False,
+                                  retry_base=0, retry_cap=0, **kwargs)
+
+    def test_store(self):
+        "Ensure that mail only stores the message"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        outbox = self.get_outbox(backend)
+        outbox.mail({'message': 'Hello'})
+        self.assertEqual(outbox.pending(), 1)
+        self.assertEqual(backend.sent, [])
+
+    def test_drain(self):
+        "Ensure that draining sends and removes the stored messages"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        outbox = self.get_outbox(backend)
+        outbox.mail({'message': 'Hello'})
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(outbox.pending(), 0)
+        from_email, to_emails, data = backend.sent[0]
+        self.assertEqual(from_email, 'from@example.com')
+        self.assertEqual(to_emails, ['to@example.com'])
+        self.assertIn(b'message: Hello', data)
+
+    def test_retry(self):
+        "Ensure that a failed message is retried"
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=1)
+        outbox = self.get_outbox(backend)
+        outbox.mail({'message': 'Hello'})
+        outbox.drain()
+        self.assertEqual(outbox.pending(), 1)
+        outbox.drain()
+        self.assertEqual(outbox.pending(), 0)
+        self.assertEqual(len(backend.sent), 1)
+
+    def test_dead_letter(self):
+        "Ensure that a message is buried after max_attempts"
+        backend = RecordingBackend('from@example.com', 'to@example.com', failures=5)
+        outbox = self.get_outbox(backend, max_attempts=2)
+        outbox.mail({'message': 'Hello'})
+        outbox.drain()
+        outbox.drain()
+        self.assertEqual(outbox.drain(), 0)
+        self.assertEqual(outbox.pending(), 0)
+        self.assertEqual(len(outbox.dead_letters()), 1)
+
+    def test_durable(self):
+        "Ensure that stored messages survive a new outbox instance"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        self.get_outbox(backend).mail({'message': 'Hello'})
+        self.assertEqual(self.get_outbox(backend).drain(), 1)
+
+    def test_drain_thread(self):
+        "Ensure that the drain thread sends stored messages"
+        backend = RecordingBackend('from@example.com', 'to@example.com')
+        outbox = OutboxEmailBackend(backend, self.path)
+        outbox.mail({'message': 'Hello'})
+        for _ in range(100):
+            if backend.sent:
+                break
+            outbox._stopped.wait(0.01)
+        outbox.close()
+        self.assertEqual(len(backend.sent), 1)
@@ -0,0 +1,163 @@
+import smtplib
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.backends import SMTPEmailBackend
+from flask_contact.errors import PoolTimeout
+from flask_contact.pool import SMTPConnectionPool
+
+def fake_connection():
+    "Return a fake smtplib connection accepting every command"
+    smtp = MagicMock()
+    smtp.noop.return_value = (250, b'OK')
+    smtp.mail.return_value = (250, b'OK')
+    smtp.rcpt.return_value = (250, b'OK')
+    smtp.docmd.return_value = (354, b'Go ahead')
+    smtp.getreply.return_value = (250, b'OK')
+    return smtp
+
+class SMTPConnectionPoolTest(unittest.TestCase):
+    """ Test case for the SMTP connection pool """
+
+    def test_reuse(self):
+        "Ensure that a released session is reused"
+        connect = MagicMock(side_effect=fake_connection)
+        pool = SMTPConnectionPool(connect)
+        with pool.session() as first:
+            pass
+        with pool.session() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(connect.call_count, 1)
+        second.noop.assert_called_once_with()
+
+    def test_dead_session(self):
+        "Ensure that a session failing NOOP is replaced"
+        connect = MagicMock(side_effect=fake_connection)
+        pool = SMTPConnectionPool(connect)
+        with pool.session() as first:
+            pass
+        first.noop.side_effect = smtplib.SMTPServerDisconnected()
+        with pool.session() as second:
+            pass
+        self.assertIsNot(first, second)
+
+    def test_max_messages(self):
+        "Ensure that a session is renewed after max_messages"
+        connect = MagicMock(side_effect=fake_connection)
+        pool = SMTPConnectionPool(connect, max_messages=2)
+        for _ in range(4):
+            with pool.session():
+                pass
+        self.assertEqual(connect.call_count, 2)
+
+    def test_idle_timeout(self):
+        "Ensure that a session idle for too long is evicted"
+        connect = MagicMock(side_effect=fake_connection)
+        pool = SMTPConnectionPool(connect, idle_timeout=0)
+        with pool.session() as first:
+            pass
+        with pool.session() as second:
+            pass
+        self.assertIsNot(first, second)
+        first.quit.assert_called_once_with()
+
+    def test_discard_on_error(self):
+        "Ensure that a session is not reused when the block raises"
+        connect = MagicMock(side_effect=fake_connection)
+        pool = SMTPConnectionPool(connect)
+        with self.assertRaises(ValueError):
+            with pool.session():
+                raise ValueError()
+        self.assertEqual(pool._idle, [])
+
+    def test_timeout(self):
+        "Ensure that waiting for a session gives up after the timeout"
+        pool = SMTPConnectionPool(MagicMock(side_effect=fake_connection),
+                                  size=1, timeout=0.01)
+        session = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        pool.release(session)
+        pool.release(pool.acquire())
+
+class SMTPBackendTest(unittest.TestCase):
+    """ Test case for the pooled SMTP email backend """
+
+    def get_backend(self):
+        return SMTPEmailBackend('from@example.com', 'to@example.com',
+                                smtp_server='localhost', smtp_user='user',
+                                smtp_password='pass')
+
+    @patch('smtplib.SMTP_SSL')
+    def test_single_login(self, smtp_class):
+        "Ensure that many messages are sent with a single login"
+        smtp_class.return_value = fake_connection()
+        backend = self.get_backend()
+        for _ in range(3):
+            backend.mail({'message': 'Hello'})
+        self.assertEqual(smtp_class.call_count, 1)
+        self.assertEqual(smtp_class.return_value.login.call_count, 1)
+        self.assertEqual(smtp_class.return_value.mail.call_count, 3)
+
+    @patch('smtplib.SMTP_SSL')
+    def test_smtp_timeout(self, smtp_class):
+        "Ensure that connections are opened with the SMTP timeout"
+        smtp_class.return_value = fake_connection()
+        backend = SMTPEmailBackend('from@example.com', 'to@example.com',
+                                   smtp_server='localhost', smtp_user='user',
+                                   smtp_password='pass', smtp_timeout=5)
+        backend.mail({'message': 'Hello'})
+        smtp_class.assert_called_once_with('localhost', 465, timeout=5)
+
+    @patch('smtplib.SMTP_SSL')
+    def test_pool_timeout(self, smtp_class):
+        "Ensure that a request finding no free session is answered with 503"
+        smtp_class.side_effect = lambda *args, **kwargs: fake_connection()
+        backend = SMTPEmailBackend('from@example.com', 'to@example.com',
+                                   smtp_server='localhost', smtp_user='user',
+                                   smtp_password='pass', allowed_fields='*',
+                                   pool_size=1, pool_timeout=0.01)
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('contact', backend))
+        session = backend.pool.acquire()
+        response = app.test_client().post('/', json={'message': 'Hello'})
+        self.assertEqual(response.status_code, 503)
+        backend.pool.release(session)
+        response = app.test_client().post('/', json={'message': 'Hello'})
+        self.assertEqual(response.status_code, 200)
+
+    @patch('smtplib.SMTP_SSL')
+    def test_reconnect(self, smtp_class):
+        "Ensure that a disconnected session is replaced on send"
+        stale, fresh = fake_connection(), fake_connection()
+        stale.mail.side_effect = smtplib.SMTPServerDisconnected()
+        smtp_class.side_effect = [stale, fresh]
+        self.get_backend().mail({'message': 'Hello'})
+        fresh.mail.assert_called_once()
+        self.assertIn(b'message: Hello', fresh.send.call_args[0][0])
+
+    @patch('smtplib.SMTP_SSL')
+    def test_routed_recipients(self, smtp_class):
+        "Ensure that every routed recipient is sent to in one transaction"
+        smtp_class.return_value = server = fake_connection()
+        backend = SMTPEmailBackend('from@example.com', 'to@example.com',
+                                   smtp_server='localhost', smtp_user='user',
+                                   smtp_password='pass', routes={
+                                       'topic': {'sales': ['a@a.com', 'b@a.com']}})
+        backend.mail({'topic': 'sales'})
+        server.mail.assert_called_once()
+        self.assertEqual([call[0][0] for call in server.rcpt.call_args_list],
+                         ['a@a.com', 'b@a.com'])
+
+    @patch('smtplib.SMTP_SSL')
+    def test_transparency(self, smtp_class):
+        "Ensure that lines starting with a dot are escaped"
+        smtp_class.return_value = fake_connection()
+        self.get_backend().mail({'message': 'Hello\n.\nBye'})
+        data = smtp_class.return_value.send.call_args[0][0]
+        self.assertIn(b'\r\n..\r\n', data)
+        self.assertTrue(data.endswith(b'\r\n.\r\n'))
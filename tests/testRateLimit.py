@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.ratelimit import MemoryStore, RateLimiter, SQLiteStore
+
+from helpers import NullBackend
+
+class StoreTest(unittest.TestCase):
+    """ Test case for the token bucket stores """
+
+    def check_store(self, store):
+        self.assertEqual(store.take('a', 1, 2, 0), 0)
+        self.assertEqual(store.take('a', 1, 2, 0), 0)
+        self.assertAlmostEqual(store.take('a', 1, 2, 0), 1)
+        self.assertEqual(store.take('b', 1, 2, 0), 0)
+        self.assertEqual(store.take('a', 1, 2, 1), 0)
+
+    def test_memory(self):
+        "Ensure that the memory store implements a token bucket"
+        self.check_store(MemoryStore())
+
+    def test_memory_eviction(self):
+        "Ensure that the memory store keeps maxsize buckets"
+        store = MemoryStore(maxsize=2)
+        for key in 'abc':
+            store.take(key, 1, 1, 0)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+    def test_sqlite(self):
+        "Ensure that the SQLite store implements a token bucket"
+        with tempfile.TemporaryDirectory() as directory:
+            self.check_store(SQLiteStore(os.path.join(directory, 'rate.db')))
+
+class RateLimitViewTest(unittest.TestCase):
+    """ Test case for the rate limited view """
+
+    def get_client(self, limiter):
+        app = Flask(__name__)
+        backend = NullBackend('from@example.com', 'to@example.com')
+        app.register_blueprint(blueprint('contact', backend, rate_limit=limiter))
+        return app.test_client()
+
+    def test_ip(self):
+        "Ensure that a client over the limit is answered 429"
+        client = self.get_client(RateLimiter(rate=2, per=60))
+        codes = [client.post('/', json={}).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        response = client.post('/', json={})
+        self.assertEqual(response.headers['Retry-After'], '30')
+
+    def test_email(self):
+        "Ensure that the email field is limited on its own"
+        client = self.get_client(RateLimiter(rate=1, per=60, by=(), email_field='email'))
+        self.assertEqual(client.post('/', json={'email': 'a@b.c'}).status_code, 200)
+        self.assertEqual(client.post('/', json={'email': 'A@b.c '}).status_code, 429)
+        self.assertEqual(client.post('/', json={'email': 'd@b.c'}).status_code, 200)
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from flask_contact import blueprint
+from flask_contact.delivery import QueuedEmailBackend
+from flask_contact.registry import FormRegistry
+
+from helpers import RecordingBackend
+
+FORMS = {
+    'defaults': {'from_email': 'noreply@host.com'},
+    'forms': {
+        'acme': {'to_email': 'info@acme.com', 'allowed_origins': 'acme.com',
+                 'subject': 'Acme: {name}'},
+        'globex': {'to_email': 'sales@globex.com', 'backend': 'other',
+                   'allowed_fields': 'message'},
+    },
+}
+
+class FormRegistryTest(unittest.TestCase):
+    """ Test case for the registry of forms """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.write(FORMS)
+        self.transport = RecordingBackend('', '')
+        self.other = RecordingBackend('', '')
+        self.registry = FormRegistry(self.path, {'default': self.transport,
+                                                 'other': self.other},
+                                     reload_interval=0)
+        app = Flask(__name__)
+        app.register_blueprint(blueprint('forms', self.registry))
+        self.client = app.test_client()
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def write(self, config):
+        """ Write +config+ to the registry file, with a new modification time """
+        with open(self.path, 'w') as f:
+            json.dump(config, f)
+        mtime = getattr(self, 'mtime', 1000000000) + 10
+        os.utime(self.path, (mtime, mtime))
+        self.mtime = mtime
+
+    def test_forms(self):
+        "Ensure that each form is sent with its own settings"
+        self.client.post('/acme', json={'name': 'Bob', 'message': 'Hi'})
+        self.client.post('/globex', json={'name': 'Bob', 'message': 'Hi'})
+        from_email, to_emails, data = self.transport.sent[0]
+        self.assertEqual((from_email, to_emails), ('noreply@host.com', ['info@acme.com']))
+        self.assertIn(b'Subject: Acme: Bob', data)
+        from_email, to_emails, data = self.other.sent[0]
+        self.assertEqual(to_emails, ['sales@globex.com'])
+        self.assertNotIn(b'name: Bob', data)
+
+    def test_unknown(self):
+        "Ensure that an unknown form is answered 404"
+        self.assertEqual(self.client.post('/nope', json={}).status_code, 404)
+
+    def test_origins(self):
+        "Ensure that each form only redirects to its origins"
+        response = self.client.post('/acme', data={'redirect_uri': 'http://acme.com/'})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post('/acme', data={'redirect_uri': 'http://globex.com/'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_preflight(self):
+        "Ensure that preflights are answered with the origins of the form"
+        headers = {'Origin': 'http://acme.com', 'Access-Control-Request-Method': 'POST'}
+        response = self.client.options('/acme', headers=headers)
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], 'http://acme.com')
+        self.assertIn('Access-Control-Max-Age', response.headers)
+        response = self.client.options('/acme', headers=dict(headers, Origin='http://evil.com'))
+        self.assertNotIn('Access-Control-Allow-Origin', response.headers)
+
+    def test_shared_transport(self):
+        "Ensure that forms of a backend share the same transport"
+        self.assertIs(self.registry.get('acme').backend.transport, self.transport)
+        self.assertIsNot(self.registry.get('acme').backend, self.registry.get('globex').backend)
+
+    def test_reload(self):
+        "Ensure that the forms are reloaded when the file changes"
+        config = json.loads(json.dumps(FORMS))
+        config['forms']['initech'] = {'to_email': 'info@initech.com'}
+        self.write(config)
+        self.assertEqual(self.client.post('/initech', json={}).status_code, 200)
+        self.assertEqual(len(self.registry), 3)
+
+    def test_invalid_reload(self):
+        "Ensure that the previous forms are kept when the file is invalid"
+        with open(self.path, 'w') as f:
+            f.write('{')
+        os.utime(self.path, (2000000000, 2000000000))
+        with self.assertLogs('flask_contact.registry'):
+            self.assertIsNotNone(self.registry.get('acme'))
+
+    def test_unknown_setting(self):
+        "Ensure that a typo in the settings is reported"
+        config = {'forms': {'acme': {'to_email': 'a@a.com', 'to_mail': 'b@a.com'}}}
+        self.write(config)
+        with self.assertRaises(ValueError):
+            FormRegistry(self.path, self.transport)
+
+    def test_deferred(self):
+        "Ensure that a queued transport is used for its queue"
+        queued = QueuedEmailBackend(self.transport)
+        registry = FormRegistry(self.path, {'default': queued, 'other': self.other})
+        self.assertTrue(registry.get('acme').backend.deferred)
+        registry.get('acme').backend.mail({'name': 'Bob'})
+        queued.close()
+        self.assertEqual(len(self.transport.sent), 1)
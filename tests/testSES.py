@@ -0,0 +1,137 @@
+import io
+import os
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from flask_contact.backends import SESEmailBackend
+
+try:
+    from botocore.stub import Stubber
+except ImportError:
+    Stubber = None
+
+def get_backend(**kwargs):
+    """ Return an SES backend with fake credentials and a region """
+    with patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1'}):
+        backend = SESEmailBackend('from@a.com', 'to@a.com', access_key='a',
+                                  secret_key='b', retry_base=0, **kwargs)
+        backend.client
+    return backend
+
+def send_params(data=b'data'):
+    """ Return the parameters expected for a send_raw_email call """
+    return {'Source': 'from@a.com', 'Destinations': ['to@a.com'],
+            'RawMessage': {'Data': data}}
+
+@unittest.skipIf(Stubber is None, "boto3 is not installed")
+class SESEmailBackendTest(unittest.TestCase):
+    """ Test case for the SES dispatcher, with botocore's Stubber """
+
+    def test_quota(self):
+        "Ensure that the send rate is read from the account's send quota"
+        backend = get_backend()
+        with Stubber(backend.client) as stubber:
+            stubber.add_response('get_send_quota', {'MaxSendRate': 14.0})
+            stubber.add_response('send_raw_email', {'MessageId': '1'}, send_params())
+            backend.send_raw('from@a.com', ['to@a.com'], b'data')
+            stubber.assert_no_pending_responses()
+        self.assertEqual(backend.pacer[1], 14.0)
+
+    def test_configured_rate(self):
+        "Ensure that a configured send rate doesn't read the quota"
+        backend = get_backend(max_send_rate=2)
+        with Stubber(backend.client) as stubber:
+            stubber.add_response('send_raw_email', {'MessageId': '1'}, send_params())
+            backend.send_raw('from@a.com', ['to@a.com'], io.BytesIO(b'data'))
+            stubber.assert_no_pending_responses()
+
+    def test_pacing(self):
+        "Ensure that sends wait for the token bucket to refill"
+        backend = get_backend(max_send_rate=2)
+        with Stubber(backend.client) as stubber, \
+             patch('flask_contact.backends.time.sleep') as sleep:
+            for _ in range(3):
+                stubber.add_response('send_raw_email', {'MessageId': '1'}, send_params())
+            for _ in range(3):
+                backend.send_raw('from@a.com', ['to@a.com'], b'data')
+        # The burst is one second of sends, the third has to wait
+        self.assertTrue(sleep.called)
+
+    def test_pool_size(self):
+        "Ensure that the connection pool matches the number of threads"
+        backend = get_backend(executor_workers=25)
+        self.assertEqual(backend.client.meta.config.max_pool_connections, 25)
+
+    def test_throttling_retried(self):
+        "Ensure that throttled sends are retried"
+        backend = get_backend(max_send_rate=100)
+        with Stubber(backend.client) as stubber:
+            stubber.add_client_error('send_raw_email', 'Throttling',
+                                     'Maximum sending rate exceeded.')
+            stubber.add_response('send_raw_email', {'MessageId': '1'}, send_params())
+            backend.send_raw('from@a.com', ['to@a.com'], b'data')
+            stubber.assert_no_pending_responses()
+
+    def test_daily_quota_not_retried(self):
+        "Ensure that exceeding the daily quota is not retried"
+        backend = get_backend(max_send_rate=100)
+        with Stubber(backend.client) as stubber:
+            stubber.add_client_error('send_raw_email', 'Throttling',
+                                     'Daily message quota exceeded.')
+            with self.assertRaises(Exception):
+                backend.send_raw('from@a.com', ['to@a.com'], b'data')
+
+    def test_retries_exhausted(self):
+        "Ensure that the error is raised after max_retries"
+        backend = get_backend(max_send_rate=100, max_retries=1)
+        with Stubber(backend.client) as stubber:
+            for _ in range(2):
+                stubber.add_client_error('send_raw_email', 'Throttling',
+                                         'Maximum sending rate exceeded.')
+            with self.assertRaises(Exception):
+                backend.send_raw('from@a.com', ['to@a.com'], b'data')
+            stubber.assert_no_pending_responses()
+
+    def test_dispatch(self):
+        "Ensure that dispatched messages are all sent"
+        backend = get_backend(max_send_rate=100)
+        messages = [backend.get_mail({'message': str(i)}) for i in range(5)]
+        with Stubber(backend.client) as stubber:
+            for _ in messages:
+                stubber.add_response('send_raw_email', {'MessageId': '1'})
+            for future in backend.dispatch(messages):
+                future.result()
+            stubber.assert_no_pending_responses()
+
+class SendQuotaTest(unittest.TestCase):
+    """ Test case for the pacing of SES sends without a readable send quota """
+
+    def get_backend(self, client):
+        backend = SESEmailBackend('from@a.com', 'to@a.com', access_key='a', secret_key='b')
+        backend._client, backend._client_pid = client, os.getpid()
+        return backend
+
+    def test_unreadable_quota(self):
+        "Ensure that sends are not paced when the quota can't be read"
+        client = Mock()
+        client.get_send_quota.side_effect = Exception('AccessDenied')
+        backend = self.get_backend(client)
+        with self.assertLogs('flask_contact.backends', 'WARNING'), \
+             patch('flask_contact.backends.time.sleep') as sleep:
+            for _ in range(5):
+                backend.send_raw('from@a.com', ['to@a.com'], b'data')
+        self.assertFalse(sleep.called)
+        self.assertEqual(client.send_raw_email.call_count, 5)
+        self.assertEqual(client.get_send_quota.call_count, 1)
+
+    def test_quota_retry(self):
+        "Ensure that the quota is read again after QUOTA_RETRY seconds"
+        client = Mock()
+        client.get_send_quota.side_effect = [Exception('AccessDenied'), {'MaxSendRate': 14.0}]
+        backend = self.get_backend(client)
+        with self.assertLogs('flask_contact.backends', 'WARNING'):
+            self.assertIsNone(backend.pacer[1])
+        later = time.monotonic() + backend.QUOTA_RETRY
+        with patch('flask_contact.backends.time.monotonic', return_value=later):
+            self.assertEqual(backend.pacer[1], 14.0)
@@ -1,6 +1,7 @@
 import unittest
 
-from flask_contact.utils import AllowedList, filter_args, get_domain, filename_ext
+from flask_contact.utils import (AllowedList, FieldPolicy, InvalidFields, RoutingTable,
+                                 filter_args, get_domain, filename_ext)
 
 class AllowedListTest(unittest.TestCase):
     """ Test case for the AllowedList class """
@@ -37,6 +38,44 @@ class AllowedListTest(unittest.TestCase):
         allowed = AllowedList('a').filter({'a': 'b', 'c': 'd'})
         self.assertEqual([('a', 'b')], list(allowed))
 
+    def test_allowed_glob(self):
+        "Ensure that glob patterns are supported"
+        allowed = AllowedList('name utm_*')
+        self.assertTrue('utm_source' in allowed)
+        self.assertTrue('name' in allowed)
+        self.assertFalse('xutm_source' in allowed)
+
+    def test_allowed_regex(self):
+        "Ensure that regular expressions between slashes are supported"
+        allowed = AllowedList(['/q[0-9]+/'])
+        self.assertTrue('q12' in allowed)
+        self.assertFalse('q12a' in allowed)
+        self.assertFalse('q12a' in allowed) # cached decision
+
+class FieldPolicyTest(unittest.TestCase):
+    """ Test case for the FieldPolicy class """
+    def test_required(self):
+        "Ensure that a missing required field is rejected"
+        policy = FieldPolicy('*', required='email')
+        with self.assertRaises(InvalidFields) as context:
+            list(policy.filter({'email': '', 'name': 'a'}))
+        self.assertEqual(context.exception.errors, {'email': 'required'})
+        self.assertEqual(list(policy.filter({'email': 'a'})), [('email', 'a')])
+
+    def test_max_length(self):
+        "Ensure that a field too long is rejected"
+        policy = FieldPolicy('*', max_lengths={'name': 3})
+        with self.assertRaises(InvalidFields):
+            list(policy.filter({'name': 'abcd'}))
+        self.assertEqual(list(policy.filter({'name': 'abc', 'other': 'abcd'})),
+                         [('name', 'abc'), ('other', 'abcd')])
+
+    def test_max_length_disallowed(self):
+        "Ensure that the length of disallowed fields is not checked"
+        policy = FieldPolicy('name', max_lengths=3)
+        self.assertEqual(list(policy.filter({'name': 'abc', 'other': 'abcd'})),
+                         [('name', 'abc')])
+
 class ArgFilterTest(unittest.TestCase):
     """ Test case to check if arguments filtering is working """
     def test_filter_args(self):
@@ -45,6 +84,29 @@ class ArgFilterTest(unittest.TestCase):
         dic = filter_args({'a': 8, 'b': 3}, l)
         self.assertEqual(l(**dic), 8)
 
+class RoutingTableTest(unittest.TestCase):
+    """ Test case for the RoutingTable class """
+    def test_route(self):
+        "Ensure that values are routed to their recipients"
+        routes = RoutingTable({'topic': {'sales': 'sales@a.com',
+                                         'press': ['pr@a.com', 'ceo@a.com']}})
+        self.assertEqual(routes.get({'topic': 'sales'}), ['sales@a.com'])
+        self.assertEqual(routes.get({'topic': 'press'}), ['pr@a.com', 'ceo@a.com'])
+        self.assertEqual(routes.get({'topic': 'other'}), [])
+        self.assertEqual(routes.get({}), [])
+
+    def test_normalized(self):
+        "Ensure that values are matched without case or whitespace"
+        routes = RoutingTable({'topic': {'Sales': 'sales@a.com'}})
+        self.assertEqual(routes.get({'topic': ' SALES '}), ['sales@a.com'])
+
+    def test_many_fields(self):
+        "Ensure that recipients of every field are joined without duplicates"
+        routes = RoutingTable({'topic': {'sales': ['sales@a.com', 'ceo@a.com']},
+                               'country': {'fr': ['fr@a.com', 'ceo@a.com']}})
+        self.assertEqual(routes.get({'topic': 'sales', 'country': 'fr'}),
+                         ['sales@a.com', 'ceo@a.com', 'fr@a.com'])
+
 class DomainTest(unittest.TestCase):
     """ Test the parsing of the domain """
     def test_domain_none(self):